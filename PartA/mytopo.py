@@ -7,13 +7,17 @@ current_dir = os.path.dirname(os.path.realpath(__file__))
 parent_dir = os.path.dirname(current_dir)
 sys.path.append(parent_dir)
 from utils import *
+from routes import compile_routes, install_routes
+import tracing
 
 
 class Config:
     
     intf_ip = None
     host_ip = None
-    route_config = None
+    # trace the network setup and teardown: logs/trace.json (Chrome trace
+    # events) and logs/trace-summary.txt
+    trace = False
 
     @staticmethod
     def setup():
@@ -35,87 +39,6 @@ class Config:
             'h2': '65.0.0.2/8'
         }
 
-        # next-hop-interface and src-exit-interface should be on same network for 'ip route add' to work
-        # you don't have to add routes between interfaces of the same router, ip forwarding takes care of it
-        Config.route_config = [
-            {
-                'node':'h1', 
-                'dst-network':'default', 
-                'next-hop-ip':Config.intf_ip['r1-eth0'], 
-                'src-exit-interface':'h1-eth0',
-            },
-            {
-                'node':'h2', 
-                'dst-network':'default', 
-                'next-hop-ip':Config.intf_ip['r4-eth0'], 
-                'src-exit-interface':'h2-eth0',
-            },
-
-            {
-                'node':'r1', 
-                'dst-network':'66.0.0.0/8', 
-                'next-hop-ip':Config.intf_ip['r3-eth0'], 
-                'src-exit-interface':'r1-eth2'
-            },
-            {
-                'node':'r1', 
-                'dst-network':'default', 
-                'next-hop-ip':Config.intf_ip['r2-eth0'], 
-                'src-exit-interface':'r1-eth1'
-            },
-
-            {
-                'node':'r2', 
-                'dst-network':'62.0.0.0/8', 
-                'next-hop-ip':Config.intf_ip['r1-eth1'], 
-                'src-exit-interface':'r2-eth0'
-            },
-            {
-                'node':'r2', 
-                'dst-network':'67.0.0.0/8', 
-                'next-hop-ip':Config.intf_ip['r1-eth1'], 
-                'src-exit-interface':'r2-eth0'
-            },
-            {
-                'node':'r2', 
-                'dst-network':'default', 
-                'next-hop-ip':Config.intf_ip['r4-eth1'], 
-                'src-exit-interface':'r2-eth1'
-            },
-
-            {
-                'node':'r3', 
-                'dst-network':'62.0.0.0/8', 
-                'next-hop-ip':Config.intf_ip['r1-eth2'], 
-                'src-exit-interface':'r3-eth0'
-            },
-            {
-                'node':'r3', 
-                'dst-network':'63.0.0.0/8', 
-                'next-hop-ip':Config.intf_ip['r1-eth2'], 
-                'src-exit-interface':'r3-eth0'
-            },
-            {
-                'node':'r3', 
-                'dst-network':'default', 
-                'next-hop-ip':Config.intf_ip['r4-eth2'], 
-                'src-exit-interface':'r3-eth1'
-            },
-            
-            {
-                'node':'r4', 
-                'dst-network':'67.0.0.0/8', 
-                'next-hop-ip':Config.intf_ip['r3-eth1'], 
-                'src-exit-interface':'r4-eth2'
-            },
-            {
-                'node':'r4', 
-                'dst-network':'default', 
-                'next-hop-ip':Config.intf_ip['r2-eth1'], 
-                'src-exit-interface':'r4-eth1'
-            },
-        ]
-
 
 class NetworkTopo(Topo):
 
@@ -183,17 +106,18 @@ def run():
     # change directory to PartA to run the code
     os.chdir(path)
 
+    if Config.trace:
+        tracing.enable()
+
     topo = NetworkTopo()
     net = Mininet(topo=topo)
 
     # Add routing for reaching networks (network-id, NOT individual host-ids) that aren't directly connected
-    for config in Config.route_config:
-        src_interface = config['src-exit-interface']
-        router = config['node']
-        dst_host = config['dst-network']
-        next_hop_interface = config['next-hop-ip']
-        cmd = "ip route add "+dst_host+" via "+next_hop_interface.split("/")[0]+" dev "+src_interface.split("/")[0]
-        info(net[router].cmd(cmd))
+    # the routes are computed from the topology and added with one 'ip -batch' per node
+    fibs = compile_routes(topo, Config.intf_ip, Config.host_ip)
+    for node, errors in install_routes(net, fibs).items():
+        for error in errors:
+            if error: info(node + ': ' + error)
     
     net.start()
 
@@ -218,6 +142,12 @@ def run():
     #CLI(net)
     net.stop()
 
+    if Config.trace:
+        tracing.disable()
+        tracing.write_chrome_trace(os.path.join(log_path, 'trace.json'))
+        with open(os.path.join(log_path, 'trace-summary.txt'), 'w') as f:
+            f.write(tracing.summary(20))
+
 
 if __name__ == '__main__':
     setLogLevel('info')
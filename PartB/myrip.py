@@ -1,4 +1,4 @@
-import os, sys, time
+import os, sys, shutil, tempfile
 from mininet.topo import Topo
 from mininet.net import Mininet
 from mininet.cli import CLI
@@ -7,12 +7,26 @@ current_dir = os.path.dirname(os.path.realpath(__file__))
 parent_dir = os.path.dirname(current_dir)
 sys.path.append(parent_dir)
 from utils import *
+from convergence import RouteMonitor, wait_for_convergence
+from birdctl import start_daemons
+from teardown import fast_stop
+from results import ResultStore, new_run_id, topo_hash, import_logs
+from birdconf import write_confs
+from scheduler import at, run_timeline
+from probe import load, analyze, outages
 
 
 class Config:
     
     intf_ip = None
     host_ip = None
+    # RIP timers for the generated bird.conf files, see birdconf.PROFILES
+    bird_profile = 'fast'
+    # probe stream from h1 to h2 measuring the outage: probes per second,
+    # seconds of probing, and when (from the start of probing) r1-r2 fails
+    probe_rate = 1000
+    probe_duration = 10
+    failure_time = 2
 
     @staticmethod
     def setup():
@@ -37,17 +51,17 @@ class Config:
 
 class NetworkTopo(Topo):
 
-    def build(self):
+    def build(self, conf_root=None):
 
         # Add 4 routers in two different subnets
-        r1 = self.addHost('r1', cls=BirdRouter, ip=None)
-        r2 = self.addHost('r2', cls=BirdRouter, ip=None)
-        r3 = self.addHost('r3', cls=BirdRouter, ip=None)
-        r4 = self.addHost('r4', cls=BirdRouter, ip=None)
+        r1 = self.addHost('r1', cls=BirdRouter, defer_bird=True, conf_root=conf_root, ip=None)
+        r2 = self.addHost('r2', cls=BirdRouter, defer_bird=True, conf_root=conf_root, ip=None)
+        r3 = self.addHost('r3', cls=BirdRouter, defer_bird=True, conf_root=conf_root, ip=None)
+        r4 = self.addHost('r4', cls=BirdRouter, defer_bird=True, conf_root=conf_root, ip=None)
 
         # Add hosts
-        h1 = self.addHost('h1', cls=BirdHost, intfName="h1-eth0", ip=Config.host_ip['h1'])
-        h2 = self.addHost('h2', cls=BirdHost, intfName="h2-eth0", ip=Config.host_ip['h2'])
+        h1 = self.addHost('h1', cls=BirdHost, defer_bird=True, conf_root=conf_root, intfName="h1-eth0", ip=Config.host_ip['h1'])
+        h2 = self.addHost('h2', cls=BirdHost, defer_bird=True, conf_root=conf_root, intfName="h2-eth0", ip=Config.host_ip['h2'])
 
         # linking hosts to the routers
         self.addLink(h1, r1, intfName2="r1-eth0", params2={'ip':Config.intf_ip['r1-eth0']})
@@ -89,8 +103,12 @@ def run():
     # change directory to PartB to run the code
     os.chdir(path)
 
-    topo = NetworkTopo()
+    # bird.conf for every node, generated from the topology
+    conf_root = tempfile.mkdtemp(prefix='bird-conf-')
+    topo = NetworkTopo(conf_root=conf_root)
+    write_confs(topo, Config.intf_ip, Config.host_ip, root=conf_root, profile=Config.bird_profile)
     net = Mininet(topo=topo, controller=None)
+    run_id = new_run_id()
 
     """ 
     NETWORK TOPOLOGY             
@@ -103,15 +121,21 @@ def run():
                             (0) [R3] (1)
     """
     net.start()
-    
+
+    # start all the BIRD daemons at once and wait until they answer
+    start_daemons(net.hosts)
+
+    # wait till BIRD sets up all the routes: every node should know every network
+    n_networks = len(set(get_network_addr(ip) for ip in Config.intf_ip.values()))
+    # (end hosts only get a default route from bird)
+    routers = [name for name in topo.hosts() if name not in Config.host_ip]
+    wait_for_convergence(net.hosts, min_routes={name: n_networks for name in routers})
+
     # log routing tables
     info(net['r1'].cmd('route -n | tee ' +log_path+ '/r1-routing-table.txt'))
     info(net['r2'].cmd('route -n | tee ' +log_path+ '/r2-routing-table.txt'))
     info(net['r3'].cmd('route -n | tee ' +log_path+ '/r3-routing-table.txt'))
     info(net['r4'].cmd('route -n | tee ' +log_path+ '/r4-routing-table.txt'))
-    
-    # wait for some time till BIRD sets up all the routes
-    time.sleep(10)
 
     # log traceroute from h1 to h2 
     # note: since route -n is used, there is no dns resolution happening when displaying the routing tables. 
@@ -119,19 +143,54 @@ def run():
     # hence use h2's ip address instead of its name 'h2'
     info(net['h1'].cmd('traceroute -m 5 ' + Config.host_ip['h2'].split("/")[0] +' | tee ' +log_path+ '/traceroute-h1-h2-1.txt'))
     
-    # take r1-r2 link down 
-    info(net.configLinkStatus('r1','r2','down'))
-    
-    # wait for some time till BIRD sets up new routes after the link is taken down
-    time.sleep(5)
+    # take r1-r2 link down while h1 sends a probe stream to h2, to measure
+    # how long traffic is lost while the routes converge
+    h2_ip = Config.host_ip['h2'].split("/")[0]
+    probe_path = os.path.join(parent_dir, 'probe.py')
+    probe_log = os.path.join(log_path, 'probes-h1-h2.bin')
+    # no --idle: the outage is what we measure, it mustn't end the run.
+    # Only start sending once the receiver's socket is bound
+    receiver = net['h2'].popen(['python3', probe_path, 'recv', '--out', probe_log,
+                                '--duration', str(Config.probe_duration + 5)])
+    receiver.stdout.readline()
+    sender = net['h1'].popen(['python3', probe_path, 'send', h2_ip, '--rate', str(Config.probe_rate),
+                              '--duration', str(Config.probe_duration)])
+    # start watching the routing tables first, so that no change is missed
+    monitor = RouteMonitor(net.hosts)
+    failures = run_timeline(net, at(Config.failure_time, 'down', ('r1', 'r2')),
+                            log_path=os.path.join(log_path, 'failures.jsonl'))
+
+    # wait till BIRD sets up new routes after the link is taken down
+    monitor.wait(require_change=True)
+
+    # outage seen by the probes
+    sent = int(sender.communicate()[0].split()[1])
+    receiver.communicate()
+    report = analyze(load(probe_log), rate=Config.probe_rate, sent=sent)
+    info('*** Probes: %d sent, %d lost, %d reordered, median latency %.3f ms\n' %
+         (sent, report['lost'], report['reordered'],
+          report['latency']['median'] if report['latency'] else 0))
+    for t, window in outages(report, [record['sent'] for record in failures]):
+        if window:
+            info('*** r1-r2 down: traffic lost for %.1f ms (%d probes)\n' %
+                 (window['duration_ms'], window['lost']))
+        else:
+            info('*** r1-r2 down: no probes lost\n')
+
+    # log traceroute from h1 to h2 over the new path
     info(net['h1'].cmd('traceroute -m 5 ' + Config.host_ip['h2'].split("/")[0] +' | tee ' +log_path+ '/traceroute-h1-h2-2.txt'))
 
+    # keep the parsed logs in the result store, keyed by run, topology and parameters
+    store = ResultStore(os.path.join(parent_dir, 'results'))
+    import_logs(store, log_path, run_id, topo_hash(topo), {'bird_profile': Config.bird_profile})
+
     # use this only in case of shared folder
     # copy all log files from vm folder where the code is run to the shared folder
     os.system("cp -r ./logs/* /media/sf_mininet-network-emulation/PartB/logs/")
 
     #CLI(net)
-    net.stop()
+    fast_stop(net)
+    shutil.rmtree(conf_root, ignore_errors=True)
 
 
 if __name__ == '__main__':
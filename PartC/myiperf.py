@@ -1,20 +1,30 @@
-import os, sys, time
-import multiprocessing
+import os, sys
 current_dir = os.path.dirname(os.path.realpath(__file__))
 parent_dir = os.path.dirname(current_dir)
 sys.path.append(parent_dir)
 from mininet.topo import Topo
 from mininet.net import Mininet
 from mininet.cli import CLI
-from mininet.link import TCLink
-from mininet.log import setLogLevel, info
+from link import TCLink
+from mininet.log import setLogLevel, info, error
 from utils import *
+from convergence import wait_for_convergence
+from birdctl import start_daemons
+from teardown import fast_stop
+from results import ResultStore, new_run_id, topo_hash, import_logs
+from traffic import run_flows, format_results
+from sweep import measure_rtt, run_sweep, shape_limits, format_sweep
+from telemetry import Sampler
 
 
 class Config:
     
     intf_ip = None
     host_ip = None
+    # router buffer sizes to measure, as multiples of the bandwidth-delay
+    # product (0 is a single packet), and the loss rate of every link in %
+    bdp_multiples = [0, 0.2, 1, 2]
+    loss = 0.1
 
     @staticmethod
     def setup():
@@ -42,14 +52,14 @@ class NetworkTopo(Topo):
     def build(self):
 
         # Add 4 routers in two different subnets
-        r1 = self.addHost('r1', cls=BirdRouter, ip=None)
-        r2 = self.addHost('r2', cls=BirdRouter, ip=None)
-        r3 = self.addHost('r3', cls=BirdRouter, ip=None)
-        r4 = self.addHost('r4', cls=BirdRouter, ip=None)
+        r1 = self.addHost('r1', cls=BirdRouter, defer_bird=True, ip=None)
+        r2 = self.addHost('r2', cls=BirdRouter, defer_bird=True, ip=None)
+        r3 = self.addHost('r3', cls=BirdRouter, defer_bird=True, ip=None)
+        r4 = self.addHost('r4', cls=BirdRouter, defer_bird=True, ip=None)
 
         # Add hosts
-        h1 = self.addHost('h1', cls=BirdHost, intfName="h1-eth0", ip=Config.host_ip['h1'])
-        h2 = self.addHost('h2', cls=BirdHost, intfName="h2-eth0", ip=Config.host_ip['h2'])
+        h1 = self.addHost('h1', cls=BirdHost, defer_bird=True, intfName="h1-eth0", ip=Config.host_ip['h1'])
+        h2 = self.addHost('h2', cls=BirdHost, defer_bird=True, intfName="h2-eth0", ip=Config.host_ip['h2'])
 
         # linking hosts to the routers
         self.addLink(h1, r1, 
@@ -90,26 +100,13 @@ class NetworkTopo(Topo):
                     params2={'ip':Config.intf_ip['r4-eth2']})
 
 
-def run_server(net, buffer_size, path):
-    # run server on port 8000
-    # handle one client connection and exit (-1)
-    net['h2'].cmd('iperf3 -s -p 8000 -i10 -1 | tee '+path+'/server_iperf_'+buffer_size+'.txt') 
-    
-
-def run_client(net, buffer_size, path):
-    # run client and connect to the server on port 8000
-    net['h1'].cmd('iperf3 -c '+Config.host_ip['h2'].split("/")[0]+' -p 8000 -i10 -t10 | tee '+path+'/client_iperf_'+buffer_size+'.txt' ) 
-
-
 def log_performance(net, buffer_size, log_path):
-       
-    # run the iperf server followed by the iperf client
-    server = multiprocessing.Process(target=run_server, args=(net, buffer_size, log_path))
-    server.start()
-    client = multiprocessing.Process(target=run_client, args=(net, buffer_size, log_path))
-    client.start()
-    server.join()
-    client.join()
+    # run an iperf3 flow from h1 to h2 (the client starts once the server
+    # listens) and keep iperf3's JSON output in the logs
+    results = run_flows(net, [('h1', 'h2')], duration=10, interval=10,
+                        log_dir=log_path, log_name='iperf_' + buffer_size)
+    info(format_results(results))
+    return results
     
 
 def run():
@@ -138,29 +135,54 @@ def run():
 
     topo = NetworkTopo()
     net = Mininet(topo=topo, controller=None)
+    run_id = new_run_id()
+    store = ResultStore(os.path.join(parent_dir, 'results'))
 
-    # initialize buffer sizes to 10Kb, 5Mb, 25Mb
-    buffer_sizes = ['1', '437', '2185'] #['10kbit', '5mbit', '25mbit']
     net.start()
+
+    # start all the BIRD daemons at once and wait until they answer
+    start_daemons(net.hosts)
     
-    # wait for some time till BIRD sets up all the routes
-    time.sleep(10)
-
-    # set buffer size for each of the router interfaces
-    buffer_size = buffer_sizes[0]
-    for intf in list(Config.intf_ip.keys()):
-        router = intf.split("-")[0]
-        info(net[router].cmd('tc qdisc replace dev %s root netem limit %s delay 30ms loss 0.1%%'%(intf, buffer_size)))
-    
-    # start measuring network performance
-    log_performance(net, buffer_size, log_path)
+    # wait till BIRD sets up all the routes: every node should know every network
+    n_networks = len(set(get_network_addr(ip) for ip in Config.intf_ip.values()))
+    wait_for_convergence(net.hosts, min_routes=n_networks)
+
+    # size the router buffers from the bandwidth-delay product of their links,
+    # using the rtt between h1 and h2, and measure at every size
+    rtt = measure_rtt(net['h1'], Config.host_ip['h2'].split("/")[0])
+    if rtt is None:
+        error('*** Could not measure the rtt from h1 to h2, skipping the measurements\n')
+    else:
+        info('*** Path rtt %.1f ms\n' % (rtt * 1000))
+        router_intfs = [net[intf.split("-")[0]].intf(intf) for intf in Config.intf_ip]
+        # queue backlog and drops of every router interface during the sweep,
+        # marked with the point being measured (read back with telemetry.load)
+        sampler = Sampler(router_intfs, interval=0.01,
+                          path=os.path.join(log_path, 'qdisc-telemetry.bin')).start()
+
+        def measure(label):
+            sampler.mark(label)
+            return log_performance(net, label, log_path)
+        try:
+            rows = run_sweep(router_intfs, rtt, Config.bdp_multiples, measure, loss=Config.loss,
+                             apply=shape_limits)
+        finally:
+            sampler.stop()
+        info(sampler.report())
+        info(format_sweep(rows))
+        with open(os.path.join(log_path, 'buffer-sweep.txt'), 'w') as f:
+            f.write(format_sweep(rows))
+        store.append('buffer_sweep', rows, run_id, topo_hash(topo), {'loss': Config.loss, 'rtt': rtt})
+
+    # keep the parsed logs in the result store, keyed by run, topology and parameters
+    import_logs(store, log_path, run_id, topo_hash(topo), {'loss': Config.loss})
 
     # use this only in case of shared folder
     # copy all log files from vm folder where the code is run to the shared folder
     os.system("cp -r ./logs/* /media/sf_mininet-network-emulation/PartC/logs/")
 
     CLI(net)
-    net.stop()
+    fast_stop(net)
 
 
 if __name__ == '__main__':
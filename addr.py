@@ -0,0 +1,109 @@
+import socket, struct
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# IPv4 address utilities working on 32 bit integers
+# e.g: network_addr('172.168.0.1/24') => '172.168.0.0/24'
+
+# netmask for every prefix length, MASKS[24] = 0xffffff00
+MASKS = [(0xffffffff << (32 - n)) & 0xffffffff for n in range(33)]
+
+_pack = struct.Struct('!I')
+
+
+def ip_to_int(ip):
+    # '10.0.0.1' => 167772161
+    return _pack.unpack(socket.inet_aton(ip))[0]
+
+
+def int_to_ip(n):
+    # 167772161 => '10.0.0.1'
+    return socket.inet_ntoa(_pack.pack(n))
+
+
+def parse_cidr(cidr):
+    # '10.0.0.1/8' => (167772161, 8), a bare address is a /32
+    ip, _, prefix_len = cidr.partition("/")
+    return ip_to_int(ip), int(prefix_len) if prefix_len else 32
+
+
+def network_addr(cidr):
+    ip, prefix_len = parse_cidr(cidr)
+    return int_to_ip(ip & MASKS[prefix_len]) + "/" + str(prefix_len)
+
+
+def broadcast_addr(cidr):
+    ip, prefix_len = parse_cidr(cidr)
+    return int_to_ip(ip | (~MASKS[prefix_len] & 0xffffffff))
+
+
+def contains(cidr, addr):
+    # does network cidr contain addr (an address or a smaller network)
+    net, prefix_len = parse_cidr(cidr)
+    ip, addr_len = parse_cidr(addr)
+    mask = MASKS[prefix_len]
+    return addr_len >= prefix_len and (ip & mask) == (net & mask)
+
+
+def subnets(cidr, new_prefix_len):
+    # all the /new_prefix_len networks inside cidr, in order
+    net, prefix_len = parse_cidr(cidr)
+    if new_prefix_len < prefix_len or new_prefix_len > 32:
+        raise ValueError("can't split /%d into /%d" % (prefix_len, new_prefix_len))
+    net &= MASKS[prefix_len]
+    step = 1 << (32 - new_prefix_len)
+    suffix = "/" + str(new_prefix_len)
+    for n in range(net, net + (1 << (32 - prefix_len)), step):
+        yield int_to_ip(n) + suffix
+
+
+# Bulk versions working on arrays of packed uint32 addresses and prefix
+# lengths, using numpy when it is installed and array.array otherwise
+
+def pack_cidrs(cidrs):
+    # list of cidr strings => (addresses, prefix lengths) arrays
+    pairs = [parse_cidr(c) for c in cidrs]
+    addrs = array('I', [p[0] for p in pairs])
+    prefix_lens = array('B', [p[1] for p in pairs])
+    if np is not None:
+        return np.frombuffer(addrs, dtype=np.uint32), np.frombuffer(prefix_lens, dtype=np.uint8)
+    return addrs, prefix_lens
+
+
+def unpack_cidrs(addrs, prefix_lens):
+    # inverse of pack_cidrs
+    return [int_to_ip(int(a)) + "/" + str(int(p)) for a, p in zip(addrs, prefix_lens)]
+
+
+def _masks(prefix_lens):
+    if np is not None:
+        return np.asarray(MASKS, dtype=np.uint32)[np.asarray(prefix_lens)]
+    return array('I', [MASKS[p] for p in prefix_lens])
+
+
+def network_addrs(addrs, prefix_lens):
+    # network address of every (address, prefix length) pair
+    masks = _masks(prefix_lens)
+    if np is not None:
+        return np.asarray(addrs, dtype=np.uint32) & masks
+    return array('I', [a & m for a, m in zip(addrs, masks)])
+
+
+def broadcast_addrs(addrs, prefix_lens):
+    masks = _masks(prefix_lens)
+    if np is not None:
+        return np.asarray(addrs, dtype=np.uint32) | ~masks
+    return array('I', [a | (~m & 0xffffffff) for a, m in zip(addrs, masks)])
+
+
+def contains_many(net, prefix_len, addrs):
+    # which of addrs fall inside network net/prefix_len (packed ints)
+    mask = MASKS[prefix_len]
+    net &= mask
+    if np is not None:
+        return (np.asarray(addrs, dtype=np.uint32) & np.uint32(mask)) == np.uint32(net)
+    return [(a & mask) == net for a in addrs]
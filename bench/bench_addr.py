@@ -0,0 +1,63 @@
+"""
+Network address of 100k CIDRs: the old bit-list get_network_addr vs
+the integer version in addr.py, and the bulk array version.
+
+    python3 bench/bench_addr.py [--count 100000]
+"""
+import os, sys, time, random, argparse
+current_dir = os.path.dirname(os.path.realpath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.append(parent_dir)
+import addr
+
+
+def legacy_get_network_addr(cidr):
+    # the original utils.get_network_addr, kept here for comparison
+    ip, subnet = cidr.split("/")
+    subnet = int(subnet)
+    subnet_mask_bits= [1,]*subnet + [0,]*(32-subnet)
+    ip_bin = [format(int(quad), "b") for quad in ip.split(".")]
+    ip_bin = [list('0'*(8-len(x))+x) for x in ip_bin]
+    ip_bits = []
+    for quad in ip_bin:
+        ip_bits+= [int(bit) for bit in quad]
+
+    nw_addr_bits = [x*y for x,y in zip(ip_bits, subnet_mask_bits )]
+    nw_addr = []
+    for i in range(0,32,8):
+        nw_addr += [str(int("".join(str(i) for i in nw_addr_bits[i:i+8]), 2))]
+
+    return ".".join(nw_addr)+"/"+str(subnet)
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def run():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--count', type=int, default=100000)
+    args = parser.parse_args()
+
+    rnd = random.Random(1)
+    cidrs = ['%d.%d.%d.%d/%d' % (rnd.randrange(256), rnd.randrange(256), rnd.randrange(256),
+                                 rnd.randrange(256), rnd.randrange(33)) for _ in range(args.count)]
+
+    t_legacy, legacy = timed(lambda: [legacy_get_network_addr(c) for c in cidrs])
+    t_int, fast = timed(lambda: [addr.network_addr(c) for c in cidrs])
+    assert legacy == fast
+
+    addrs, prefix_lens = addr.pack_cidrs(cidrs)
+    t_bulk, nets = timed(lambda: addr.network_addrs(addrs, prefix_lens))
+    assert addr.unpack_cidrs(nets, prefix_lens) == legacy
+
+    backend = 'numpy' if addr.np is not None else 'array'
+    print('%-24s %8.3f s  %10.0f cidrs/s' % ('legacy bit lists', t_legacy, args.count / t_legacy))
+    print('%-24s %8.3f s  %10.0f cidrs/s' % ('integer', t_int, args.count / t_int))
+    print('%-24s %8.3f s  %10.0f cidrs/s' % ('bulk (%s)' % backend, t_bulk, args.count / t_bulk))
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,72 @@
+"""
+Python-side cost of building links, on fake nodes (no root, no kernel):
+links per second and commands per link for Link, TCLink and OVSLink,
+one at a time or with Link.makeLinks().
+
+    python3 bench/bench_fake_links.py --links 100000 --cls tclink [--bulk] [--profile]
+"""
+import os, sys, time, random, argparse, cProfile, pstats
+current_dir = os.path.dirname(os.path.realpath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.append(parent_dir)
+from mininet.log import setLogLevel
+from link import Link, TCLink, OVSLink
+from fakenode import FakeNode, fakeSwitch
+
+
+LINK_CLASSES = {'link': Link, 'tclink': TCLink, 'ovslink': OVSLink}
+
+
+def make_specs(nodes, n_links, params, seed=1):
+    # ring through all the nodes, then random chords
+    rnd = random.Random(seed)
+    pairs = [(nodes[i], nodes[(i+1) % len(nodes)]) for i in range(len(nodes))]
+    while len(pairs) < n_links:
+        pairs.append(tuple(rnd.sample(nodes, 2)))
+    return [(n1, n2, params) for n1, n2 in pairs[:n_links]]
+
+
+def build(cls, specs, bulk):
+    if bulk:
+        return cls.makeLinks(specs)
+    return [cls(n1, n2, **params) for n1, n2, params in specs]
+
+
+def run():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--nodes', type=int, default=1000)
+    parser.add_argument('--links', type=int, default=100000)
+    parser.add_argument('--cls', choices=sorted(LINK_CLASSES), default='link')
+    parser.add_argument('--switches', action='store_true',
+                        help='fake OVS switches, so that OVSLink makes patch links')
+    parser.add_argument('--bulk', action='store_true', help='use Link.makeLinks()')
+    parser.add_argument('--profile', action='store_true', help='print the top 25 functions')
+    args = parser.parse_args()
+
+    cls = LINK_CLASSES[args.cls]
+    params = {'bw': 100, 'delay': '1ms'} if cls is TCLink else {}
+    make_node = fakeSwitch if args.switches else FakeNode
+    nodes = [make_node('n%d' % i, record=False) for i in range(args.nodes)]
+    specs = make_specs(nodes, args.links, params)
+
+    profiler = cProfile.Profile() if args.profile else None
+    start = time.time()
+    if profiler:
+        profiler.enable()
+    links = build(cls, specs, args.bulk)
+    if profiler:
+        profiler.disable()
+    elapsed = time.time() - start
+    assert len(links) == args.links
+    commands = sum(node.count for node in nodes)
+
+    print('%-8s %-6s %7d links  %8.2f s  %9.1f links/s  %6.2f commands/link' %
+          (args.cls, 'bulk' if args.bulk else 'serial', args.links, elapsed,
+           args.links / elapsed, commands / args.links))
+    if profiler:
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(25)
+
+
+if __name__ == '__main__':
+    setLogLevel('warning')
+    run()
@@ -0,0 +1,93 @@
+"""
+Links per second and shell commands per link: one Link() at a time vs
+Link.makeLinks().
+
+Run as root on a machine with mininet installed:
+    sudo python3 bench/bench_links.py --links 500
+"""
+import os, sys, time, random, argparse
+current_dir = os.path.dirname(os.path.realpath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.append(parent_dir)
+from mininet.net import Mininet
+from mininet.log import setLogLevel
+from mininet.clean import cleanup
+from link import Link, TCLink, NetlinkLink
+import cmdstats
+
+
+LINK_CLASSES = {'link': Link, 'tclink': TCLink, 'netlink': NetlinkLink}
+
+
+def make_pairs(hosts, n_links, seed=1):
+    # ring through all the hosts, then random chords
+    rnd = random.Random(seed)
+    pairs = [(hosts[i], hosts[(i+1) % len(hosts)]) for i in range(len(hosts))]
+    while len(pairs) < n_links:
+        h1, h2 = rnd.sample(hosts, 2)
+        pairs.append((h1, h2))
+    return pairs[:n_links]
+
+
+def delete_links(links):
+    for link in links:
+        link.delete()
+
+
+def bench_serial(cls, pairs, params):
+    cmdstats.reset()
+    cmdstats.enable()
+    start = time.time()
+    links = [cls(n1, n2, **params) for n1, n2 in pairs]
+    elapsed = time.time() - start
+    cmdstats.disable()
+    delete_links(links)
+    return elapsed, cmdstats.stats()['per_link']
+
+
+def bench_bulk(cls, pairs, params, workers):
+    # the per-node 'ip -batch' creating the veth pairs counts as one
+    # command per node (Link.makeIntfPairs), as makeIntfPair does per link
+    cmdstats.reset()
+    cmdstats.enable()
+    start = time.time()
+    links = cls.makeLinks([(n1, n2, params) for n1, n2 in pairs],
+                          maxWorkers=workers)
+    elapsed = time.time() - start
+    cmdstats.disable()
+    delete_links(links)
+    return elapsed, cmdstats.stats()['per_link']
+
+
+def run():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--hosts', type=int, default=100)
+    parser.add_argument('--links', type=int, default=500)
+    parser.add_argument('--cls', choices=sorted(LINK_CLASSES), default='link')
+    parser.add_argument('--workers', type=int, default=32)
+    args = parser.parse_args()
+
+    cls = LINK_CLASSES[args.cls]
+    # give every interface something to configure
+    params = {'bw': 100, 'delay': '1ms'} if cls is TCLink else {}
+
+    net = Mininet(topo=None, build=False, controller=None)
+    hosts = [net.addHost('h%d' % i, ip=None) for i in range(args.hosts)]
+    pairs = make_pairs(hosts, args.links)
+    try:
+        serial, serial_cmds = bench_serial(cls, pairs, params)
+        bulk, bulk_cmds = bench_bulk(cls, pairs, params, args.workers)
+    finally:
+        net.stop()
+        cleanup()
+
+    print('%-8s %6d links  %8.2f s  %8.1f links/s  %6.2f commands/link' %
+          ('serial', args.links, serial, args.links / serial, serial_cmds))
+    print('%-8s %6d links  %8.2f s  %8.1f links/s  %6.2f commands/link' %
+          ('bulk', args.links, bulk, args.links / bulk, bulk_cmds))
+    print('speedup: %.1fx' % (serial / bulk))
+
+
+if __name__ == '__main__':
+    setLogLevel('warning')
+    run()
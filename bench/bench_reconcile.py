@@ -0,0 +1,65 @@
+"""
+Reconciliation cost on a generated topology of TCLinks: a pass that
+finds nothing to do, passes that change the netem queue limit of a
+growing number of interfaces, and, for comparison, re-running config()
+on every interface (one 'tc -batch' per node).
+
+Run as root on a machine with mininet installed:
+    sudo python3 bench/bench_reconcile.py --family grid --rows 10 --cols 10 --changes 1,10,100
+"""
+import os, sys, argparse, time
+current_dir = os.path.dirname(os.path.realpath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.append(parent_dir)
+from mininet.net import Mininet
+from mininet.log import setLogLevel
+from link import TCLink, TCBatch
+from topogen import GeneratedTopo
+from teardown import fast_stop
+from reconcile import reconcile, desired_state, network_intfs
+
+
+def run():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--family', choices=['ring', 'grid', 'fat-tree', 'random'], default='grid')
+    parser.add_argument('--rows', type=int, default=10)
+    parser.add_argument('--cols', type=int, default=10)
+    parser.add_argument('--n', type=int, default=100, help='routers (ring, random)')
+    parser.add_argument('--k', type=int, default=8, help='fat-tree arity')
+    parser.add_argument('--changes', default='1,10,100', help='interfaces to change, comma separated')
+    args = parser.parse_args()
+
+    size = {'ring': {'n': args.n}, 'grid': {'rows': args.rows, 'cols': args.cols},
+            'fat-tree': {'k': args.k}, 'random': {'n': args.n}}[args.family]
+    topo = GeneratedTopo(args.family, hosts=2, link_opts={
+        'cls': TCLink, 'bw': 100, 'delay': '1ms', 'max_queue_size': 1000}, **size)
+    net = Mininet(topo=topo, controller=None)
+    rows = []
+    net.start()
+    try:
+        intfs = [intf for intf in network_intfs(net) if intf.shape]
+        s = reconcile(desired_state(intfs))
+        rows.append(('no-op', s))
+        for n in [int(c) for c in args.changes.split(',')]:
+            limit = 100 + len(rows)
+            s = reconcile({intf: {'shape': {'max_queue_size': limit}} for intf in intfs[:n]})
+            rows.append(('%d changed' % n, s))
+        start = time.monotonic()
+        with TCBatch():
+            for intf in intfs:
+                intf.config(**dict(intf.offload, **intf.shape))
+        config_s = time.monotonic() - start
+    finally:
+        fast_stop(net)
+
+    print('%d interfaces on %d nodes' % (len(intfs), len(set(i.node for i in intfs))))
+    print('%-12s %8s %8s %9s %9s %6s' % ('pass', 'changes', 'netlink', 'dump', 'apply', 'failed'))
+    for label, s in rows:
+        print('%-12s %8d %8d %6.1f ms %6.1f ms %6d' % (
+            label, s['changes'], s['netlink'], s['dump_s'] * 1e3, s['apply_s'] * 1e3, s['failed']))
+    print('config() on every interface: %.1f ms' % (config_s * 1e3))
+
+
+if __name__ == '__main__':
+    setLogLevel('warning')
+    run()
@@ -0,0 +1,55 @@
+"""
+Route compiler run time on grid topologies of routers with /30 links.
+
+    python3 bench/bench_routes.py --rows 40 --cols 50 [--ecmp]
+"""
+import os, sys, time, argparse
+current_dir = os.path.dirname(os.path.realpath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.append(parent_dir)
+from addr import int_to_ip, ip_to_int
+from routes import compile_fibs, route_batch
+
+
+def grid_links(rows, cols):
+    # (node1, intf1, ip1, node2, intf2, ip2) for a rows x cols grid
+    links = []
+    ports = {}
+    base = ip_to_int('10.0.0.0')
+
+    def intf(node):
+        ports[node] = ports.get(node, -1) + 1
+        return '%s-eth%d' % (node, ports[node])
+
+    for r in range(rows):
+        for c in range(cols):
+            for r2, c2 in ((r + 1, c), (r, c + 1)):
+                if r2 < rows and c2 < cols:
+                    n1, n2 = 'r%d_%d' % (r, c), 'r%d_%d' % (r2, c2)
+                    links.append((n1, intf(n1), int_to_ip(base + 1) + '/30',
+                                  n2, intf(n2), int_to_ip(base + 2) + '/30'))
+                    base += 4
+    return links
+
+
+def run():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=40)
+    parser.add_argument('--cols', type=int, default=50)
+    parser.add_argument('--ecmp', action='store_true')
+    parser.add_argument('--processes', type=int, default=None)
+    args = parser.parse_args()
+
+    links = grid_links(args.rows, args.cols)
+    start = time.time()
+    fibs = compile_fibs(links, [], ecmp=args.ecmp, processes=args.processes)
+    elapsed = time.time() - start
+    n_routes = sum(len(route_batch(fib)) for fib in fibs.values())
+    full = len(fibs) * (len(links) - 2)
+    print('%d routers, %d links: %.2f s' % (len(fibs), len(links), elapsed))
+    print('%.1f routes per router (about %.0f without compression)' %
+          (n_routes / len(fibs), full / len(fibs)))
+
+
+if __name__ == '__main__':
+    run()
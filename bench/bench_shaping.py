@@ -0,0 +1,71 @@
+"""
+Shaping accuracy: achieved vs configured rate on one TCLink, from
+1 Mbit/s to 40 Gbit/s, measured with iperf3. The link is reshaped in
+place between rates. --legacy shapes with the original fixed 15k burst
+at every rate, for comparison.
+
+Run as root on a machine with mininet and iperf3 installed:
+    sudo python3 bench/bench_shaping.py --rates 1,10,100,1000,10000,40000 [--tbf] [--legacy]
+"""
+import os, sys, argparse
+current_dir = os.path.dirname(os.path.realpath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.append(parent_dir)
+from mininet.net import Mininet
+from mininet.log import setLogLevel
+from link import TCLink, TCIntf
+from traffic import Flow, run_flows
+
+
+class LegacyTCIntf(TCIntf):
+    # htb/tbf with the original fixed bursts at every rate
+    def bursts(self, bw, gso=None):
+        return None
+
+
+def run():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rates', default='1,10,100,1000,10000,40000', help='Mbit/s, comma separated')
+    parser.add_argument('--seconds', type=int, default=10)
+    parser.add_argument('--parallel', type=int, default=4, help='iperf3 streams')
+    parser.add_argument('--tbf', action='store_true', help='shape with tbf instead of htb')
+    parser.add_argument('--qdisc', help="leaf qdisc, e.g. 'fq_codel'")
+    parser.add_argument('--no-offload', action='store_true', help='gro, tx and rx offloads off')
+    parser.add_argument('--legacy', action='store_true', help='fixed 15k bursts')
+    args = parser.parse_args()
+    rates = [float(r) for r in args.rates.split(',')]
+
+    params = {'bw': rates[0], 'use_tbf': args.tbf, 'qdisc': args.qdisc}
+    if args.no_offload:
+        params.update(gro=False, txo=False, rxo=False)
+    if args.legacy:
+        params.update(cls1=LegacyTCIntf, cls2=LegacyTCIntf)
+    net = Mininet(controller=None)
+    h1, h2 = net.addHost('h1', ip='10.0.0.1/24'), net.addHost('h2', ip='10.0.0.2/24')
+    link = net.addLink(h1, h2, cls=TCLink, **params)
+    net.start()
+    rows = []
+    try:
+        for rate in rates:
+            link.change(bw=rate)
+            result, = run_flows(net, [Flow('h1', 'h2', ['-P', str(args.parallel)])],
+                                duration=args.seconds)
+            rows.append((rate, result))
+    finally:
+        net.stop()
+
+    print('%-6s %12s %12s %8s %9s' % ('shaper', 'configured', 'achieved', 'ratio', 'retrans'))
+    for rate, r in rows:
+        shaper = ('tbf' if args.tbf else 'htb') + ('*' if args.legacy else '')
+        if r['error']:
+            print('%-6s %7.0f Mbps  error: %s' % (shaper, rate, r['error']))
+            continue
+        achieved = (r['goodput'] or 0) / 1e6
+        print('%-6s %7.0f Mbps %7.1f Mbps %8.3f %9s' % (
+            shaper, rate, achieved, achieved / rate,
+            r['retransmits'] if r['retransmits'] is not None else '-'))
+
+
+if __name__ == '__main__':
+    setLogLevel('warning')
+    run()
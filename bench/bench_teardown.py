@@ -0,0 +1,73 @@
+"""
+Teardown time: net.stop() vs teardown.fast_stop() on a generated topology.
+
+Run as root on a machine with mininet (and BIRD, for --bird) installed:
+    sudo python3 bench/bench_teardown.py --family grid --rows 10 --cols 10 --bird
+"""
+import os, sys, time, shutil, tempfile, argparse
+current_dir = os.path.dirname(os.path.realpath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.append(parent_dir)
+from mininet.net import Mininet
+from mininet.log import setLogLevel
+from mininet.clean import cleanup
+from utils import LinuxRouter, BirdRouter, BirdHost
+from birdconf import write_confs
+from birdctl import start_daemons
+from topogen import GeneratedTopo
+from teardown import fast_stop
+
+
+def make_net(args, conf_root):
+    size = {'ring': {'n': args.n}, 'grid': {'rows': args.rows, 'cols': args.cols},
+            'fat-tree': {'k': args.k}, 'random': {'n': args.n}}[args.family]
+    if args.bird:
+        opts = {'defer_bird': True, 'conf_root': conf_root}
+        topo = GeneratedTopo(args.family, hosts=args.hosts, router_cls=BirdRouter,
+                             router_opts=opts, host_opts=dict(opts, cls=BirdHost), **size)
+        write_confs(topo, topo.intf_ip, topo.host_ip, root=conf_root, profile='fast')
+    else:
+        topo = GeneratedTopo(args.family, hosts=args.hosts, router_cls=LinuxRouter, **size)
+    net = Mininet(topo=topo, controller=None)
+    net.start()
+    if args.bird:
+        start_daemons(net.hosts)
+    return net
+
+
+def run():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--family', choices=['ring', 'grid', 'fat-tree', 'random'], default='grid')
+    parser.add_argument('--rows', type=int, default=10)
+    parser.add_argument('--cols', type=int, default=10)
+    parser.add_argument('--n', type=int, default=100, help='routers (ring, random)')
+    parser.add_argument('--k', type=int, default=8, help='fat-tree arity')
+    parser.add_argument('--hosts', type=int, default=2)
+    parser.add_argument('--bird', action='store_true', help='run BIRD on every node')
+    args = parser.parse_args()
+
+    conf_root = tempfile.mkdtemp(prefix='bird-conf-')
+    try:
+        net = make_net(args, conf_root)
+        n_links = len(net.links)
+        start = time.monotonic()
+        net.stop()
+        serial = time.monotonic() - start
+        cleanup()
+
+        net = make_net(args, conf_root)
+        timings = fast_stop(net)
+        cleanup()
+    finally:
+        shutil.rmtree(conf_root, ignore_errors=True)
+
+    print('%d nodes, %d links' % (len(net.hosts), n_links))
+    print('%-12s %8.2f s' % ('net.stop()', serial))
+    for phase, seconds in timings.items():
+        print('%-12s %8.2f s' % (phase, seconds))
+    print('speedup: %.1fx' % (serial / timings['total']))
+
+
+if __name__ == '__main__':
+    setLogLevel('warning')
+    run()
@@ -0,0 +1,54 @@
+"""
+Qdisc telemetry overhead on a generated topology of TCLinks: samples
+every interface's qdiscs for a while and reports what a tick costs,
+how much of the time that is and the interval actually achieved.
+
+Run as root on a machine with mininet installed:
+    sudo python3 bench/bench_telemetry.py --family grid --rows 10 --cols 10 --interval 0.01 [--tc]
+"""
+import os, sys, argparse
+current_dir = os.path.dirname(os.path.realpath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.append(parent_dir)
+from mininet.net import Mininet
+from mininet.log import setLogLevel
+from link import TCLink
+from topogen import GeneratedTopo
+from teardown import fast_stop
+from telemetry import Sampler
+
+
+def run():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--family', choices=['ring', 'grid', 'fat-tree', 'random'], default='grid')
+    parser.add_argument('--rows', type=int, default=10)
+    parser.add_argument('--cols', type=int, default=10)
+    parser.add_argument('--n', type=int, default=100, help='routers (ring, random)')
+    parser.add_argument('--k', type=int, default=8, help='fat-tree arity')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--interval', type=float, default=0.01)
+    parser.add_argument('--max-overhead', type=float, default=0.05)
+    parser.add_argument('--tc', action='store_true', help="sample with 'tc -s -j' instead of netlink")
+    parser.add_argument('--out', help='stream the records to this file')
+    args = parser.parse_args()
+
+    size = {'ring': {'n': args.n}, 'grid': {'rows': args.rows, 'cols': args.cols},
+            'fat-tree': {'k': args.k}, 'random': {'n': args.n}}[args.family]
+    topo = GeneratedTopo(args.family, hosts=2, link_opts={
+        'cls': TCLink, 'bw': 100, 'delay': '1ms'}, **size)
+    net = Mininet(topo=topo, controller=None)
+    net.start()
+    try:
+        sampler = Sampler(net, interval=args.interval, path=args.out,
+                          max_overhead=args.max_overhead, source='tc' if args.tc else None)
+        sampler.run(args.seconds)
+        sampler.close()
+    finally:
+        fast_stop(net)
+    print('%d nodes' % len(sampler.nodes))
+    print(sampler.report(), end='')
+
+
+if __name__ == '__main__':
+    setLogLevel('warning')
+    run()
@@ -0,0 +1,57 @@
+"""
+Trace replay on every link of a generated topology: synthetic 100 Hz
+bandwidth/delay/loss traces on both ends of each link, reporting how
+far the updates drift from their schedule.
+
+Run as root on a machine with mininet installed:
+    sudo python3 bench/bench_tracelink.py --family grid --rows 10 --cols 10 --seconds 10
+"""
+import os, sys, argparse
+current_dir = os.path.dirname(os.path.realpath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.append(parent_dir)
+from mininet.net import Mininet
+from mininet.log import setLogLevel
+from link import TCLink
+from topogen import GeneratedTopo
+from tracelink import TraceReplay, synthetic_trace
+from teardown import fast_stop
+
+
+def run():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--family', choices=['ring', 'grid', 'fat-tree', 'random'], default='grid')
+    parser.add_argument('--rows', type=int, default=10)
+    parser.add_argument('--cols', type=int, default=10)
+    parser.add_argument('--n', type=int, default=100, help='routers (ring, random)')
+    parser.add_argument('--k', type=int, default=8, help='fat-tree arity')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--interval', type=float, default=0.01, help='trace sample interval (s)')
+    parser.add_argument('--drift', help='write the drift of every update to this CSV file')
+    args = parser.parse_args()
+
+    size = {'ring': {'n': args.n}, 'grid': {'rows': args.rows, 'cols': args.cols},
+            'fat-tree': {'k': args.k}, 'random': {'n': args.n}}[args.family]
+    topo = GeneratedTopo(args.family, hosts=2, **size)
+    net = Mininet(topo=topo, link=TCLink, controller=None)
+    net.start()
+    try:
+        traces = {}
+        for i, link in enumerate(net.links):
+            for intf in (link.intf1, link.intf2):
+                traces[intf] = synthetic_trace(args.seconds, interval=args.interval, seed=i)
+        replay = TraceReplay(traces)
+        replay.prepare()
+        replay.run()
+        if args.drift:
+            replay.write_drift(args.drift)
+    finally:
+        fast_stop(net)
+    print('%d links, %d interfaces, %.0f updates/s scheduled' % (
+        len(net.links), len(traces), len(traces) / args.interval))
+    print(replay.report(), end='')
+
+
+if __name__ == '__main__':
+    setLogLevel('warning')
+    run()
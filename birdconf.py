@@ -0,0 +1,162 @@
+import os, tempfile
+from routes import topo_links
+
+# bird.conf generator: writes one config per node of a mininet Topo, so
+# that big topologies don't need hand written copies under bird-conf/.
+# Routers run RIP on their router-facing interfaces only, hosts get a
+# static default route towards their router.
+
+# RIP timers in seconds. 'default' is what BIRD uses when nothing is set
+# (bird-2.0.8/proto/rip/rip.h), 'fast' is for failover experiments: short
+# timers, so routes through a silent neighbour expire in seconds.
+# 'triggered' sends updates only on changes (demand circuit, RFC 2091).
+# BIRD 2.0.8 never expires routes learned on a demand circuit (they get no
+# expiry time, and neighbours there never time out), so the timeouts do
+# nothing with it: only a link going down or an explicit withdrawal
+# removes a route. That's kept as a separate profile, 'triggered', and not
+# used for failover.
+# check_link (on in all of them) makes RIP drop the routes of an interface
+# as soon as its link goes down instead of waiting for them to time out
+PROFILES = {
+    'default': {
+        'update_time': 30,
+        'timeout_time': 180,
+        'garbage_time': 120,
+        'triggered': False,
+        'check_link': True,
+        'log_level': 'all',
+    },
+    'fast': {
+        'update_time': 1,
+        'timeout_time': 4,
+        'garbage_time': 2,
+        'triggered': False,
+        'check_link': True,
+        'log_level': ['warning', 'error', 'fatal'],
+    },
+    # route expiry disabled: timeout_time and garbage_time have no effect
+    'triggered': {
+        'update_time': 1,
+        'timeout_time': 4,
+        'garbage_time': 2,
+        'triggered': True,
+        'check_link': True,
+        'log_level': ['warning', 'error', 'fatal'],
+    },
+}
+
+
+def _log_classes(level):
+    # 'all' or a list of message classes => bird syntax
+    if isinstance(level, str):
+        return level
+    return '{ %s }' % ', '.join(level)
+
+
+def _header(options):
+    lines = ['log stderr %s;' % _log_classes(options['log_level'])]
+    if options.get('log_file'):
+        lines.append('log "%s" %s;' % (options['log_file'], _log_classes(options['log_level'])))
+    lines += [
+        '',
+        'protocol kernel {',
+        '        ipv4 {',
+        '                 import all;',
+        '                 export all;',
+        '        };',
+        '        persist;',
+        '}',
+        '',
+        'protocol device {',
+        '',
+        '}',
+        '',
+        'protocol direct {',
+        '        ipv4;',
+        '        interface "-arc*", "*"; #Exclude the ARCnets',
+        '}',
+    ]
+    return lines
+
+
+def router_conf(rip_intfs, **options):
+    # bird.conf for a router running RIP on rip_intfs
+    options = dict(PROFILES[options.pop('profile', 'default')], **options)
+    lines = _header(options)
+    if rip_intfs:
+        if options['update_time'] >= options['timeout_time']:
+            raise ValueError('RIP timeout time must be longer than update time')
+        lines += [
+            '',
+            'protocol rip {',
+            '        ipv4 {',
+            '                import all;',
+            '                export all;',
+            '        };',
+            '        interface %s {' % ', '.join('"%s"' % intf for intf in sorted(rip_intfs)),
+            '                update time %d;' % options['update_time'],
+            '                timeout time %d;' % options['timeout_time'],
+            '                garbage time %d;' % options['garbage_time'],
+        ]
+        if options['triggered']:
+            lines.append('                demand circuit yes;')
+        if not options['check_link']:
+            lines.append('                check link no;')
+        lines += ['        };', '}']
+    return '\n'.join(lines) + '\n'
+
+
+def host_conf(gateway, **options):
+    # bird.conf for an end host: no RIP, just a default route via gateway
+    options = dict(PROFILES[options.pop('profile', 'default')], **options)
+    lines = _header(options)
+    if gateway:
+        lines += [
+            '',
+            'protocol static {',
+            '        ipv4;',
+            '        route 0.0.0.0/0 via %s;' % gateway,
+            '}',
+        ]
+    return '\n'.join(lines) + '\n'
+
+
+def node_confs(topo, intf_ip, host_ip, **options):
+    # {node name: bird.conf text} for every node of topo
+    # intf_ip/host_ip: the address maps the topology was built with
+    # options: profile ('default', 'fast' or 'triggered') and any of the PROFILES keys
+    # to override it, plus log_file (default 'bird.log', None for no file)
+    options.setdefault('log_file', 'bird.log')
+    hosts = set(host_ip)
+    rip_intfs = {}
+    gateways = {}
+    for node1, intf1, ip1, node2, intf2, ip2 in topo_links(topo, intf_ip, host_ip):
+        if node1 in hosts and node2 not in hosts:
+            gateways[node1] = ip2 and ip2.split("/")[0]
+        elif node2 in hosts and node1 not in hosts:
+            gateways[node2] = ip1 and ip1.split("/")[0]
+        elif node1 not in hosts and node2 not in hosts:
+            # RIP only runs on the links between routers
+            rip_intfs.setdefault(node1, []).append(intf1)
+            rip_intfs.setdefault(node2, []).append(intf2)
+    confs = {}
+    for node in topo.nodes():
+        if node in hosts:
+            confs[node] = host_conf(gateways.get(node), **options)
+        else:
+            confs[node] = router_conf(rip_intfs.get(node, []), **options)
+    return confs
+
+
+def write_confs(topo, intf_ip, host_ip, root=None, **options):
+    # write <root>/<node>/bird.conf for every node, root being a new
+    # temporary directory by default; returns root (pass it to BirdRouter
+    # and BirdHost as conf_root)
+    if root is None:
+        root = tempfile.mkdtemp(prefix='bird-conf-')
+    for node, conf in node_confs(topo, intf_ip, host_ip, **options).items():
+        path = os.path.join(root, node)
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, 'bird.conf'), 'w') as f:
+            f.write(conf)
+    return root
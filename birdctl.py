@@ -0,0 +1,306 @@
+import asyncio, os, re, time
+from mininet.log import info, debug, error
+from tracing import record
+
+# asyncio client for BIRD's control socket (bird.ctl), so that routes and
+# protocol state can be read from many daemons without spawning birdc.
+#
+# BIRD replies with lines of the form 'CODE-text' (more lines follow),
+# 'CODE text' (last line of the reply) or ' text' (continues the previous
+# code). 0xxx codes are successes, 1xxx table entries, 2xxx table headers,
+# 8xxx runtime errors and 9xxx parse errors. See bird-2.0.8/doc/reply_codes.
+
+
+class BirdError(Exception):
+    def __init__(self, code, text):
+        Exception.__init__(self, '%04d %s' % (code, text))
+        self.code = code
+        self.text = text
+
+
+class BirdStartError(Exception):
+    def __init__(self, failed):
+        # failed: {node name: reason}
+        Exception.__init__(self, 'BIRD did not come up on: ' +
+                           ', '.join('%s (%s)' % item for item in sorted(failed.items())))
+        self.failed = failed
+
+
+class BirdClient:
+    # one connection to one daemon; commands can be pipelined, replies are
+    # matched to commands in order
+
+    def __init__(self, path, name=None):
+        self.path = path
+        self.name = name or path
+        self.version = None
+        self.reader = self.writer = None
+        self.pending = []
+        self.reply = []
+        self.read_task = None
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_unix_connection(self.path)
+        # BIRD greets us with '0001 BIRD 2.0.8 ready.'
+        welcome = (await self.reader.readline()).decode().rstrip('\n')
+        if not welcome.startswith('0001 '):
+            raise BirdError(0, 'unexpected greeting from %s: %r' % (self.name, welcome))
+        self.version = welcome[5:]
+        self.read_task = asyncio.ensure_future(self._read_replies())
+        return self
+
+    async def _read_replies(self):
+        code = 0
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    break
+                line = line.decode(errors='replace').rstrip('\n')
+                if line.startswith('+'):
+                    # spontaneous message, not part of any reply
+                    continue
+                if line.startswith(' '):
+                    self.reply.append((code, line[1:]))
+                    continue
+                if line.startswith('\t'):
+                    self.reply.append((code, line))
+                    continue
+                if len(line) < 5 or not line[:4].isdigit() or line[4] not in ' -':
+                    continue
+                code = int(line[:4])
+                self.reply.append((code, line[5:]))
+                if line[4] == ' ' and self.pending:
+                    future = self.pending.pop(0)
+                    reply, self.reply = self.reply, []
+                    if not future.done():
+                        future.set_result(reply)
+        finally:
+            # daemon went away (e.g. after 'down'): fail whatever is still waiting
+            for future in self.pending:
+                if not future.done():
+                    future.set_exception(ConnectionError('%s closed the connection' % self.name))
+            self.pending = []
+
+    def send(self, cmd):
+        # queue a command without waiting for its reply; returns a future
+        # with the list of (code, text) reply lines
+        future = asyncio.get_event_loop().create_future()
+        self.pending.append(future)
+        self.writer.write((cmd + '\n').encode())
+        return future
+
+    async def command(self, cmd):
+        # run a command, raise BirdError if BIRD reports an error
+        reply = await self.send(cmd)
+        code, text = reply[-1]
+        if code >= 8000:
+            raise BirdError(code, text)
+        return reply
+
+    async def show_route(self, args=''):
+        return parse_routes(await self.command(('show route ' + args).strip()))
+
+    async def show_protocols(self, args=''):
+        return parse_protocols(await self.command(('show protocols ' + args).strip()))
+
+    async def configure(self, args=''):
+        # returns the final (code, text), e.g. (3, 'Reconfigured')
+        return (await self.command(('configure ' + args).strip()))[-1]
+
+    async def down(self):
+        # shut the daemon down; it closes the connection after replying
+        try:
+            return (await self.command('down'))[-1]
+        except ConnectionError:
+            return (7, 'Shutdown ordered')
+        finally:
+            await self.close()
+
+    async def close(self):
+        if self.writer:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+            self.writer = None
+        if self.read_task:
+            await asyncio.gather(self.read_task, return_exceptions=True)
+            self.read_task = None
+
+
+_route_re = re.compile(r'^(\S*)\s+(\w+)\s+\[(\S+)\s+(.*?)(?:\s+from\s+(\S+))?\]\s*([*!])?\s*(.*)$')
+
+
+def parse_routes(reply):
+    # 'show route' reply => list of route dicts
+    # {'table', 'prefix', 'type', 'protocol', 'since', 'from', 'primary', 'info', 'nexthops'}
+    routes = []
+    table = prefix = None
+    for code, text in reply:
+        if code not in (1007, 1008):
+            continue
+        if text.startswith('Table '):
+            table = text[len('Table '):].rstrip(':')
+        elif text.startswith('\t'):
+            hop = text.split()
+            if routes and hop and hop[0] in ('via', 'dev'):
+                nexthop = {'via': hop[1], 'dev': hop[3]} if hop[0] == 'via' else {'dev': hop[1]}
+                routes[-1]['nexthops'].append(nexthop)
+        elif text.strip():
+            m = _route_re.match(text)
+            if not m:
+                continue
+            prefix = m.group(1) or prefix
+            routes.append({'table': table, 'prefix': prefix, 'type': m.group(2),
+                           'protocol': m.group(3), 'since': m.group(4), 'from': m.group(5),
+                           'primary': m.group(6) == '*', 'info': m.group(7), 'nexthops': []})
+    return routes
+
+
+def parse_protocols(reply):
+    # 'show protocols' reply => list of {'name', 'proto', 'table', 'state', 'since', 'info'}
+    protocols = []
+    for code, text in reply:
+        if code != 1002:
+            continue
+        fields = text.split(None, 4)
+        if len(fields) < 4:
+            continue
+        since, _, extra = (fields[4] if len(fields) > 4 else '').partition('  ')
+        protocols.append({'name': fields[0], 'proto': fields[1], 'table': fields[2],
+                          'state': fields[3], 'since': since.strip(), 'info': extra.strip()})
+    return protocols
+
+
+async def connect_all(paths):
+    # paths: {name: control socket path}; connects to all daemons at once
+    # returns {name: BirdClient}; raises for the first daemon that can't be reached
+    names = list(paths)
+    clients = await asyncio.gather(*[BirdClient(paths[n], n).connect() for n in names])
+    return dict(zip(names, clients))
+
+
+async def query_all(clients, method, *args):
+    # run the same query on every client concurrently: {name: result}
+    names = list(clients)
+    results = await asyncio.gather(*[getattr(clients[n], method)(*args) for n in names],
+                                   return_exceptions=True)
+    return dict(zip(names, results))
+
+
+async def close_all(clients):
+    await asyncio.gather(*[c.close() for c in clients.values()])
+
+
+def bird_query(nodes, method, *args):
+    # one-shot helper for BirdRouter/BirdHost nodes, e.g.
+    # bird_query(net.hosts, 'show_route') => {'r1': [...], ...}
+    async def run():
+        clients = await connect_all({node.name: node.ctl_path() for node in nodes})
+        try:
+            return await query_all(clients, method, *args)
+        finally:
+            await close_all(clients)
+    return asyncio.run(run())
+
+
+def start_daemons(nodes, timeout=30.0, poll_interval=0.05):
+    # start bird on all nodes at once (BirdRouter/BirdHost added with
+    # defer_bird=True) and wait until every control socket answers
+    # timeout: bound on the whole startup, from the first launch
+    # returns {node name: seconds from launch until the daemon answered}
+    # raises BirdStartError naming every daemon that failed or timed out
+    nodes = list(nodes)
+    start = time.monotonic()
+    deadline = start + timeout
+    cwd = os.getcwd()
+    launched = {}
+    for node in nodes:
+        launched[node.name] = time.monotonic()
+        node.sendCmd('cd %s && sudo bird -l; echo "bird exit $?"; cd %s' % (node.conf_dir(), cwd))
+    # 'bird -l' forks once its config is parsed and its socket is bound, so
+    # a non zero exit status means the daemon is not going to come up at all
+    failed = {}
+    for node in nodes:
+        output = node.waitOutput()
+        m = re.search(r'bird exit (\d+)', output)
+        if not m or m.group(1) != '0':
+            lines = [l for l in output.splitlines() if l.strip() and not l.startswith('bird exit')]
+            failed[node.name] = lines[-1].strip() if lines else 'exit status %s' % (m and m.group(1))
+    if failed:
+        raise BirdStartError(failed)
+
+    async def ready(node):
+        while True:
+            try:
+                client = await asyncio.wait_for(BirdClient(node.ctl_path(), node.name).connect(),
+                                                max(deadline - time.monotonic(), 0))
+                await client.close()
+                return time.monotonic() - launched[node.name]
+            except (OSError, BirdError, asyncio.TimeoutError):
+                if time.monotonic() + poll_interval >= deadline:
+                    return None
+                await asyncio.sleep(poll_interval)
+
+    async def ready_all():
+        return await asyncio.gather(*[ready(node) for node in nodes])
+
+    latencies = dict(zip([node.name for node in nodes], asyncio.run(ready_all())))
+    record('start bird', start, time.monotonic(), cat='bird', daemons=len(nodes))
+    for name, latency in latencies.items():
+        if latency is not None:
+            debug('*** bird on %s up after %.3f s\n' % (name, latency))
+            record('bird up', launched[name], launched[name] + latency, cat='bird', node=name)
+    failed = {name: 'no answer within %.1f s' % timeout
+              for name, latency in latencies.items() if latency is None}
+    if failed:
+        raise BirdStartError(failed)
+    if latencies:
+        slowest = max(latencies, key=latencies.get)
+        info('*** Started %d BIRD daemons in %.2f s (slowest: %s, %.3f s)\n' %
+             (len(latencies), time.monotonic() - start, slowest, latencies[slowest]))
+    return latencies
+
+
+def stop_daemons(nodes, timeout=10.0, poll_interval=0.05):
+    # shut down the bird daemons of all nodes at once over their control
+    # sockets and wait until every one has exited, i.e. its socket stops
+    # accepting connections
+    # returns {node name: seconds until the daemon was gone, None if it
+    # still answered after timeout}; nodes without a running daemon are 0
+    nodes = list(nodes)
+    start = time.monotonic()
+    deadline = start + timeout
+
+    async def stop(node):
+        try:
+            client = await asyncio.wait_for(BirdClient(node.ctl_path(), node.name).connect(),
+                                            timeout)
+        except (OSError, BirdError, asyncio.TimeoutError):
+            return 0.0
+        try:
+            await asyncio.wait_for(client.down(), max(deadline - time.monotonic(), 0))
+        except (OSError, BirdError, asyncio.TimeoutError):
+            pass
+        while time.monotonic() < deadline:
+            try:
+                client = await BirdClient(node.ctl_path(), node.name).connect()
+            except (OSError, BirdError):
+                return time.monotonic() - start
+            await client.close()
+            await asyncio.sleep(poll_interval)
+        return None
+
+    async def stop_all():
+        return await asyncio.gather(*[stop(node) for node in nodes])
+
+    latencies = dict(zip([node.name for node in nodes], asyncio.run(stop_all())))
+    record('stop bird', start, time.monotonic(), cat='bird', daemons=len(nodes))
+    for name, latency in latencies.items():
+        if latency:
+            record('bird down', start, start + latency, cat='bird', node=name)
+        if latency is None:
+            error('*** bird on %s still running after %.1f s\n' % (name, timeout))
+    return latencies
@@ -0,0 +1,226 @@
+import sys, threading, time
+from collections import Counter, defaultdict
+
+# Shell round trip accounting for link.py: counts the commands interfaces
+# and links run, per calling method and per node, with latency histograms.
+#   cmdstats.enable()
+#   net = Mininet(topo=topo); net.start()
+#   cmdstats.disable()
+#   print(cmdstats.report())    # or cmdstats.stats() for a dict
+# Every Intf.cmd() is one round trip to a node's shell; TCIntf.tc() goes
+# through it, so its commands are counted once, against the method that
+# called tc(). Link.makeIntfPair() is counted as a round trip of its own,
+# and so is every node's batch run by TCBatch.flush() or by
+# Link.makeIntfPairs() (the per-node 'ip -batch' Link.makeLinks() creates
+# veth pairs with), so the serial and bulk paths count alike; Link.__init__
+# only to get commands per link. Like tracing.py, the methods are only
+# wrapped between enable() and disable().
+
+_lock = threading.Lock()
+_local = threading.local()
+_patched = []
+_links = [0]
+# wrapped method -> [count, total ns, max ns, Counter(bucket)]
+_methods = defaultdict(lambda: [0, 0, 0, Counter()])
+_callers = Counter()
+_nodes = Counter()
+
+
+def _bucket(ns):
+    # log2 latency bucket: bucket b holds latencies below 2**b ns
+    return int(ns).bit_length()
+
+
+def _caller(frame):
+    # qualified name of the function frame runs, or of the one around it
+    # for comprehensions
+    while frame.f_code.co_name in ('<listcomp>', '<genexpr>', '<dictcomp>', '<setcomp>'):
+        frame = frame.f_back
+    code = frame.f_code
+    return getattr(code, 'co_qualname', code.co_name)
+
+
+def _time(method, ns):
+    # with _lock held
+    m = _methods[method]
+    m[0] += 1
+    m[1] += ns
+    m[2] = max(m[2], ns)
+    m[3][_bucket(ns)] += 1
+
+
+def _count(method, caller, node, ns):
+    with _lock:
+        _time(method, ns)
+        _callers[caller] += 1
+        _nodes[node] += 1
+
+
+def _wrapCmd(func):
+    def cmd(self, *args, **kwargs):
+        caller = getattr(_local, 'caller', None) or _caller(sys._getframe(1))
+        start = time.monotonic_ns()
+        try:
+            return func(self, *args, **kwargs)
+        finally:
+            _count('Intf.cmd', caller, self.node.name, time.monotonic_ns() - start)
+    return cmd
+
+
+def _wrapTC(func):
+    def tc(self, *args, **kwargs):
+        # the commands are counted by Intf.cmd, against our caller
+        outer = getattr(_local, 'caller', None)
+        _local.caller = outer or _caller(sys._getframe(1))
+        start = time.monotonic_ns()
+        try:
+            return func(self, *args, **kwargs)
+        finally:
+            _local.caller = outer
+            with _lock:
+                _time('TCIntf.tc', time.monotonic_ns() - start)
+    return tc
+
+
+def _wrapPair(func):
+    def makeIntfPair(cls, intfname1, intfname2, *args, **kwargs):
+        node1 = kwargs.get('node1', args[2] if len(args) > 2 else None)
+        start = time.monotonic_ns()
+        try:
+            return func(cls, intfname1, intfname2, *args, **kwargs)
+        finally:
+            _count('Link.makeIntfPair', _caller(sys._getframe(1)),
+                   node1.name if node1 is not None else '(root)', time.monotonic_ns() - start)
+    return makeIntfPair
+
+
+def _wrapFlush(func):
+    def flush(self, *args, **kwargs):
+        # one round trip per node, all running at once: counted with the
+        # time of the whole flush
+        caller = _caller(sys._getframe(1))
+        start = time.monotonic_ns()
+        outputs = func(self, *args, **kwargs)
+        ns = time.monotonic_ns() - start
+        for node in outputs:
+            _count('TCBatch.flush', caller, node.name, ns)
+        return outputs
+    return flush
+
+
+def _wrapPairs(func):
+    def makeIntfPairs(cls, batches):
+        # like flush: one round trip per node, with the time of them all
+        caller = _caller(sys._getframe(1))
+        start = time.monotonic_ns()
+        outputs = func(cls, batches)
+        ns = time.monotonic_ns() - start
+        for node in outputs:
+            _count('Link.makeIntfPairs', caller, node.name, ns)
+        return outputs
+    return makeIntfPairs
+
+
+def _wrapLink(func):
+    def __init__(self, *args, **kwargs):
+        func(self, *args, **kwargs)
+        with _lock:
+            _links[0] += 1
+    return __init__
+
+
+def enable():
+    # start counting (counts add up until reset())
+    if _patched:
+        return
+    from link import Intf, TCIntf, TCBatch, Link
+    for owner, name, wrap in ((Intf, 'cmd', _wrapCmd), (TCIntf, 'tc', _wrapTC),
+                              (TCBatch, 'flush', _wrapFlush), (Link, 'makeIntfPair', _wrapPair),
+                              (Link, 'makeIntfPairs', _wrapPairs),
+                              (Link, '__init__', _wrapLink)):
+        original = owner.__dict__[name]
+        if isinstance(original, classmethod):
+            wrapped = classmethod(wrap(original.__func__))
+        else:
+            wrapped = wrap(original)
+        setattr(owner, name, wrapped)
+        _patched.append((owner, name, original))
+
+
+def disable():
+    # stop counting; the counts are kept
+    while _patched:
+        owner, name, original = _patched.pop()
+        setattr(owner, name, original)
+
+
+def reset():
+    with _lock:
+        _methods.clear()
+        _callers.clear()
+        _nodes.clear()
+        _links[0] = 0
+
+
+def _percentile(histogram, count, longest, p):
+    # upper bound (ms) of the bucket the p-th latency falls in, at most
+    # the longest latency seen
+    seen = 0
+    for bucket in sorted(histogram):
+        seen += histogram[bucket]
+        if seen >= p * count:
+            return min(1 << bucket, longest) / 1e6
+    return 0.0
+
+
+def stats():
+    # counts so far: shell round trips ('commands': Intf.cmd, makeIntfPair(s)
+    # and TCBatch.flush), links built and commands per link, commands per
+    # caller and per node, and for every wrapped method its count,
+    # total/max latency (ms), percentiles (ms, rounded up to a power of two
+    # ns) and histogram ({upper bound in ms: count})
+    with _lock:
+        methods = {}
+        for name, (count, total, longest, histogram) in _methods.items():
+            methods[name] = {
+                'count': count,
+                'total_ms': total / 1e6,
+                'max_ms': longest / 1e6,
+                'p50_ms': _percentile(histogram, count, longest, 0.5),
+                'p90_ms': _percentile(histogram, count, longest, 0.9),
+                'p99_ms': _percentile(histogram, count, longest, 0.99),
+                'histogram': {(1 << b) / 1e6: n for b, n in sorted(histogram.items())},
+            }
+        commands = sum(_methods[m][0] for m in ('Intf.cmd', 'Link.makeIntfPair',
+                                                'Link.makeIntfPairs', 'TCBatch.flush')
+                       if m in _methods)
+        return {
+            'commands': commands,
+            'links': _links[0],
+            'per_link': commands / _links[0] if _links[0] else None,
+            'methods': methods,
+            'callers': dict(_callers),
+            'nodes': dict(_nodes),
+        }
+
+
+def report(top=10):
+    # printable version of stats(); top: callers and nodes to list
+    s = stats()
+    lines = ['%d commands, %d links, %s commands per link' % (
+        s['commands'], s['links'], '%.2f' % s['per_link'] if s['per_link'] is not None else '-')]
+    lines += ['', '%-20s %8s %10s %8s %8s %8s %8s' % ('method', 'count', 'total ms', 'p50',
+                                                      'p90', 'p99', 'max')]
+    for name, m in sorted(s['methods'].items()):
+        lines.append('%-20s %8d %10.1f %8.3f %8.3f %8.3f %8.3f' % (
+            name, m['count'], m['total_ms'], m['p50_ms'], m['p90_ms'], m['p99_ms'], m['max_ms']))
+    for name, m in sorted(s['methods'].items()):
+        lines += ['', '%s latency (ms)' % name]
+        most = max(m['histogram'].values())
+        for upper, n in m['histogram'].items():
+            lines.append('  < %10.3f %8d %s' % (upper, n, '#' * max(1, int(40 * n / most))))
+    for title, counts in (('caller', s['callers']), ('node', s['nodes'])):
+        lines += ['', '%-32s %8s' % (title, 'commands')]
+        for name, n in Counter(counts).most_common(top):
+            lines.append('%-32s %8d' % (name[:32], n))
+    return '\n'.join(lines) + '\n'
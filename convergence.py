@@ -0,0 +1,140 @@
+import time, select, hashlib
+from collections import namedtuple
+from mininet.log import info, error
+from rtnl import NetlinkSocket, RTMGRP_IPV4_ROUTE, RTM_NEWROUTE, RTM_DELROUTE
+
+# Route convergence detection: instead of sleeping for a fixed time after
+# starting BIRD or failing a link, watch the kernel routing tables of the
+# nodes and return once none of them has changed for a quiet period.
+
+# converged: whether the tables went quiet before the timeout
+# time: seconds from the start of monitoring to the last route change
+# elapsed: seconds spent waiting in total
+# changes: number of route changes seen
+Convergence = namedtuple('Convergence', ['converged', 'time', 'elapsed', 'changes'])
+
+# route types 'ip route' prints before the prefix
+ROUTE_TYPES = ('unicast', 'local', 'broadcast', 'multicast', 'anycast', 'throw',
+               'unreachable', 'prohibit', 'blackhole', 'nat')
+
+
+class RouteMonitor:
+    # create the monitor *before* doing whatever changes the routes (e.g.
+    # taking a link down), then call wait()
+
+    def __init__(self, nodes, method='netlink', poll_interval=0.2):
+        # nodes: nodes whose main routing table to watch
+        # method: 'netlink' subscribes to route events in every namespace,
+        # 'poll' runs 'ip route show' in every node each poll_interval
+        self.nodes = list(nodes)
+        self.method = method
+        self.poll_interval = poll_interval
+        self.start = self.last_change = time.monotonic()
+        self.changes = 0
+        self.socks = {}
+        self.tables = {}
+        if method == 'netlink':
+            for node in self.nodes:
+                pid = node.pid if node.inNamespace else None
+                self.socks[node] = NetlinkSocket(pid, groups=RTMGRP_IPV4_ROUTE, timeout=0)
+        elif method == 'poll':
+            self.tables = self._poll()
+        else:
+            raise ValueError('unknown method %s' % method)
+
+    def _poll(self):
+        # hash of every node's routing table, all nodes at once
+        for node in self.nodes:
+            node.sendCmd('ip -4 route show table main')
+        return {node: hashlib.md5(node.waitOutput().encode()).digest() for node in self.nodes}
+
+    def _route_count(self, node):
+        # distinct destination prefixes: BIRD re-exports connected prefixes
+        # as metric 32 duplicates of the kernel's routes, which shouldn't
+        # count towards min_routes (nor should ECMP 'nexthop' lines)
+        if self.method == 'netlink':
+            return len({(route['dst'], route['dstLen'])
+                        for route in NetlinkSocket.forNode(node).routes()})
+        prefixes = set()
+        for line in node.cmd('ip -4 route show table main').splitlines():
+            if not line or line[0].isspace():
+                continue
+            words = line.split()
+            if words[0] in ROUTE_TYPES and len(words) > 1:
+                words.pop(0)
+            prefixes.add(words[0] if '/' in words[0] or words[0] == 'default'
+                         else words[0] + '/32')
+        return len(prefixes)
+
+    def _routes_ready(self, min_routes):
+        # min_routes: int for every node, or {node name: int}
+        if min_routes is None:
+            return True
+        for node in self.nodes:
+            needed = min_routes.get(node.name, 0) if isinstance(min_routes, dict) else min_routes
+            if needed and self._route_count(node) < needed:
+                return False
+        return True
+
+    def _watch(self, timeout):
+        # wait up to timeout seconds for route changes, count them
+        if self.method == 'netlink':
+            ready, _, _ = select.select(list(self.socks.values()), [], [], max(timeout, 0))
+            for sock in ready:
+                try:
+                    msgs = sock.receive()
+                except OSError:
+                    continue
+                n = sum(1 for kind, _ in msgs if kind in (RTM_NEWROUTE, RTM_DELROUTE))
+                if n:
+                    self.changes += n
+                    self.last_change = time.monotonic()
+        else:
+            time.sleep(max(min(timeout, self.poll_interval), 0))
+            tables = self._poll()
+            n = sum(1 for node in self.nodes if tables[node] != self.tables[node])
+            self.tables = tables
+            if n:
+                self.changes += n
+                self.last_change = time.monotonic()
+
+    def wait(self, quiet=3.0, timeout=60.0, min_routes=None, require_change=False):
+        # quiet: seconds without any route change that count as converged
+        # timeout: give up after this many seconds from the start of monitoring
+        # min_routes: also wait until the nodes have at least this many routes
+        # require_change: don't converge before at least one change was seen
+        deadline = self.start + timeout
+        while True:
+            now = time.monotonic()
+            if (now - self.last_change >= quiet and (self.changes or not require_change)
+                    and self._routes_ready(min_routes)):
+                result = Convergence(True, self.last_change - self.start, now - self.start,
+                                     self.changes)
+                info('*** Routes converged in %.2f s (%d changes)\n' % (result.time, result.changes))
+                break
+            if now >= deadline:
+                result = Convergence(False, self.last_change - self.start, now - self.start,
+                                     self.changes)
+                error('*** Routes did not converge within %.1f s (%d changes)\n' %
+                      (timeout, result.changes))
+                break
+            wait_time = min(self.last_change + quiet, deadline) - now
+            if wait_time <= 0:
+                # quiet already, but still short of routes
+                wait_time = min(self.poll_interval, deadline - now)
+            self._watch(wait_time)
+        self.close()
+        return result
+
+    def close(self):
+        for sock in self.socks.values():
+            sock.close()
+        self.socks = {}
+
+
+def wait_for_convergence(nodes, quiet=3.0, timeout=60.0, min_routes=None,
+                         require_change=False, method='netlink'):
+    # start watching nodes now and wait until their routes are stable
+    return RouteMonitor(nodes, method=method).wait(quiet=quiet, timeout=timeout,
+                                                   min_routes=min_routes,
+                                                   require_change=require_change)
@@ -0,0 +1,450 @@
+"""
+fakenode.py: command-recording stand-in for mininet nodes
+
+A FakeNode has no shell, namespace or kernel interfaces behind it.
+Every command it is given is recorded and answered from a small model
+of its interfaces, so link.py (Link, TCLink, OVSLink, TCBatch,
+Link.makeLinks) runs unchanged, without root, and the Python side of
+building big topologies can be benchmarked, profiled and tested:
+
+    h1, h2 = FakeNode( 'h1' ), FakeNode( 'h2' )
+    TCLink( h1, h2, bw=10, delay='5ms' )
+    h1.commands
+    [ 'ip link add name h1-eth0 type veth peer name h2-eth0 netns ...',
+      'ifconfig h1-eth0 up', 'ethtool -K h1-eth0 gro off tx on rx on',
+      'tc qdisc show dev h1-eth0', ... ]
+
+The model covers what link.py asks: veth pairs made with 'ip link add'
+(also from 'ip -batch' files), moving, renaming and deleting them,
+addresses, MACs and up/down set with ifconfig, 'ifconfig <intf>' and
+'ip -j link show' output built from that state, and the qdiscs added
+with tc, for 'tc qdisc show'. tc -batch files and the scripts TCBatch
+runs with 'sh' are read and run line by line. Anything else succeeds
+with no output, unless one of the node's responses matches it first.
+"""
+
+import itertools
+import json
+import re
+import weakref
+
+from mininet.log import debug
+
+
+class FakeNode( object ):
+    "Node whose commands are recorded and answered from a model"
+
+    portBase = 0
+
+    # pid -> node, for 'netns <pid>' in commands
+    _nodes = weakref.WeakValueDictionary()
+    _pids = itertools.count( 100000 )
+    _macs = itertools.count( 1 )
+
+    def __init__( self, name, inNamespace=True, record=True,
+                  responses=None, log=None, **params ):
+        """name: node name
+           inNamespace: pretend to have a namespace of our own
+           record: keep every command in self.commands
+           responses: list of ( regex, output ) tried in order before
+                      the model; output is a string or a function of
+                      ( node, command ) returning one
+           log: list to append ( node name, command ) to, to see the
+                commands of several nodes in order
+           params: kept in self.params, like Node's"""
+        self.name = name
+        self.inNamespace = inNamespace
+        self.record = record
+        self.responses = [ ( re.compile( r ), output )
+                           for r, output in ( responses or [] ) ]
+        self.log = log
+        self.params = params
+        self.pid = next( FakeNode._pids )
+        FakeNode._nodes[ self.pid ] = self
+        self.commands = []
+        # commands run, recorded or not
+        self.count = 0
+        self.intfs = {}
+        self.ports = {}
+        self.nameToIntf = {}
+        # interface name -> dict( mac, ip, prefixLen, up, peer, qdiscs )
+        self.devices = {}
+        self.shell = None
+        self.waiting = False
+        self.lastOutput = ''
+
+    # Commands
+
+    def cmd( self, *args, **_kwargs ):
+        "Record a command and return its (fake) output"
+        cmd = ' '.join( str( arg ) for arg in args )
+        self.count += 1
+        if self.record:
+            self.commands.append( cmd )
+        if self.log is not None:
+            self.log.append( ( self.name, cmd ) )
+        for regex, output in self.responses:
+            if regex.search( cmd ):
+                return output( self, cmd ) if callable( output ) else output
+        return self.run( cmd )
+
+    def sendCmd( self, *args, **kwargs ):
+        "Run a command now; waitOutput() returns its output"
+        assert not self.waiting
+        self.lastOutput = self.cmd( *args, **kwargs )
+        self.waiting = True
+
+    def waitOutput( self, *_args, **_kwargs ):
+        "Return the output of the command sent with sendCmd()"
+        self.waiting = False
+        return self.lastOutput
+
+    def pexec( self, *args, **kwargs ):
+        "Return ( output, '', 0 ) for a command"
+        return self.cmd( *args, **kwargs ), '', 0
+
+    def run( self, cmd ):
+        "Apply a command to the model and return its output"
+        words = cmd.split()
+        if not words:
+            return ''
+        handler = self._handlers.get( words[ 0 ] )
+        return handler( self, words ) if handler else ''
+
+    def _ip( self, words ):
+        "ip link/-batch/-j link show"
+        opts = [ w for w in words[ 1: ] if w.startswith( '-' ) ]
+        args = [ w for w in words[ 1: ] if not w.startswith( '-' ) ]
+        if '-batch' in opts:
+            return self._batch( 'ip', args[ 0 ] )
+        if args[ :2 ] == [ 'link', 'show' ] and '-j' in opts:
+            return json.dumps( [
+                { 'ifindex': i + 1, 'ifname': name,
+                  'flags': [ 'UP', 'LOWER_UP' ] if dev[ 'up' ] else [],
+                  'mtu': 1500, 'address': dev[ 'mac' ] }
+                for i, ( name, dev ) in enumerate( self.devices.items() ) ] )
+        if args[ :2 ] == [ 'link', 'add' ]:
+            return self._linkAdd( args[ 2: ] )
+        if args[ :2 ] == [ 'link', 'del' ]:
+            return self._linkDel( args[ 2 ] )
+        if args[ :2 ] == [ 'link', 'set' ]:
+            return self._linkSet( args[ 2 ], args[ 3: ] )
+        return ''
+
+    def _linkAdd( self, args ):
+        "link add name A [address M] type veth peer name B [address M] [netns P]"
+        first, peer = args, []
+        if 'peer' in args:
+            i = args.index( 'peer' )
+            first, peer = args[ :i ], args[ i + 1: ]
+        spec1, spec2 = self._spec( first ), self._spec( peer )
+        if spec1[ 'name' ] in self.devices:
+            return 'RTNETLINK answers: File exists\n'
+        other = FakeNode._nodes.get( int( spec2.get( 'netns', 0 ) ), self )
+        dev1 = self.addDevice( spec1[ 'name' ], spec1.get( 'address' ) )
+        if spec2.get( 'name' ):
+            dev2 = other.addDevice( spec2[ 'name' ], spec2.get( 'address' ) )
+            dev1[ 'peer' ] = ( other, spec2[ 'name' ] )
+            dev2[ 'peer' ] = ( self, spec1[ 'name' ] )
+        return ''
+
+    @staticmethod
+    def _spec( args ):
+        "{ keyword: value } for 'name A address M netns P ...'"
+        return { k: v for k, v in zip( args, args[ 1: ] )
+                 if k in ( 'name', 'address', 'netns' ) }
+
+    def _linkDel( self, name ):
+        dev = self.devices.pop( name, None )
+        if dev is None:
+            return 'Cannot find device "%s"\n' % name
+        if dev[ 'peer' ]:
+            node, peerName = dev[ 'peer' ]
+            node.devices.pop( peerName, None )
+        return ''
+
+    def _linkSet( self, name, args ):
+        "link set A netns P / name B / up / down"
+        dev = self.devices.get( name )
+        if dev is None:
+            return 'Cannot find device "%s"\n' % name
+        if args[ :1 ] == [ 'netns' ]:
+            other = FakeNode._nodes.get( int( args[ 1 ] ), self )
+            other.devices[ name ] = self.devices.pop( name )
+            self._repoint( dev, other, name )
+        elif args[ :1 ] == [ 'name' ]:
+            self.devices[ args[ 1 ] ] = self.devices.pop( name )
+            self._repoint( dev, self, args[ 1 ] )
+        elif args[ :1 ] in ( [ 'up' ], [ 'down' ] ):
+            dev[ 'up' ] = args[ 0 ] == 'up'
+        return ''
+
+    @staticmethod
+    def _repoint( dev, node, name ):
+        "Tell dev's peer where dev went"
+        if dev[ 'peer' ]:
+            peerNode, peerName = dev[ 'peer' ]
+            peerDev = peerNode.devices.get( peerName )
+            if peerDev:
+                peerDev[ 'peer' ] = ( node, name )
+
+    def _ifconfig( self, words ):
+        "ifconfig A [ip/len] [up|down] [hw ether M]"
+        name, args = words[ 1 ], words[ 2: ]
+        dev = self.devices.get( name )
+        if dev is None:
+            return '%s: error fetching interface information: ' \
+                   'Device not found\n' % name
+        if not args:
+            return self._ifconfigText( name, dev )
+        if args[ :2 ] == [ 'hw', 'ether' ]:
+            dev[ 'mac' ] = args[ 2 ]
+            return ''
+        for arg in args:
+            if arg in ( 'up', 'down' ):
+                dev[ 'up' ] = arg == 'up'
+            elif '/' in arg:
+                dev[ 'ip' ], dev[ 'prefixLen' ] = arg.split( '/' )
+        return ''
+
+    @staticmethod
+    def _ifconfigText( name, dev ):
+        "ifconfig output, as far as Intf parses it"
+        lines = [ '%s: flags=%s  mtu 1500' % (
+            name, '4163<UP,BROADCAST,RUNNING,MULTICAST>' if dev[ 'up' ]
+            else '4098<BROADCAST,MULTICAST>' ) ]
+        if dev[ 'ip' ]:
+            lines.append( '        inet %s  netmask %s' % (
+                dev[ 'ip' ], _netmask( int( dev[ 'prefixLen' ] ) ) ) )
+        lines.append( '        ether %s  txqueuelen 1000  (Ethernet)' %
+                      dev[ 'mac' ] )
+        return '\n'.join( lines ) + '\n\n'
+
+    def _tc( self, words ):
+        "tc qdisc add/replace/change/del/show, tc -batch"
+        opts = [ w for w in words[ 1: ] if w.startswith( '-' ) ]
+        args = [ w for w in words[ 1: ] if not w.startswith( '-' ) ]
+        if '-batch' in opts:
+            return self._batch( 'tc', args[ 0 ] )
+        if len( args ) < 4 or args[ 2 ] != 'dev':
+            return ''
+        what, action, name, rest = args[ 0 ], args[ 1 ], args[ 3 ], args[ 4: ]
+        dev = self.devices.get( name )
+        if dev is None:
+            return 'Cannot find device "%s"\n' % name
+        if what != 'qdisc':
+            return ''
+        qdiscs = dev[ 'qdiscs' ]
+        if action == 'show':
+            if not qdiscs:
+                return 'qdisc noqueue 0: root refcnt 2\n'
+            return ''.join( 'qdisc %s %s %s %s\n' % (
+                q[ 'kind' ], q[ 'handle' ], q[ 'parent' ], q[ 'args' ] )
+                for q in qdiscs.values() )
+        spec = self._qdisc( rest )
+        if action == 'del':
+            if spec[ 'parent' ] == 'root':
+                if not qdiscs:
+                    return ( 'Error: Cannot delete qdisc with handle '
+                             'of zero.\n' )
+                qdiscs.clear()
+            else:
+                qdiscs.pop( spec[ 'handle' ], None )
+            return ''
+        if action == 'change':
+            qdisc = qdiscs.get( spec[ 'handle' ] )
+            if qdisc is None or qdisc[ 'kind' ] != spec[ 'kind' ]:
+                return 'Error: Specified qdisc not found.\n'
+            qdisc[ 'args' ] = spec[ 'args' ]
+            return ''
+        if action == 'add' and spec[ 'handle' ] in qdiscs:
+            return 'Error: Exclusivity flag on, cannot modify.\n'
+        if spec[ 'parent' ] == 'root':
+            qdiscs.clear()
+        qdiscs[ spec[ 'handle' ] ] = spec
+        return ''
+
+    @staticmethod
+    def _qdisc( args ):
+        "{ parent, handle, kind, args } for 'root|parent P handle H kind ...'"
+        spec = { 'parent': 'root', 'handle': '0:', 'kind': None, 'args': '' }
+        i = 0
+        while i < len( args ):
+            if args[ i ] == 'root':
+                i += 1
+            elif args[ i ] in ( 'parent', 'handle' ) and i + 1 < len( args ):
+                value = args[ i + 1 ]
+                if args[ i ] == 'handle':
+                    value = value.split( ':' )[ 0 ] + ':'
+                else:
+                    value = 'parent ' + value
+                spec[ args[ i ] ] = value
+                i += 2
+            else:
+                spec[ 'kind' ] = args[ i ]
+                spec[ 'args' ] = ' '.join( args[ i + 1: ] )
+                break
+        return spec
+
+    def _batch( self, tool, path ):
+        "Run the lines of an ip/tc -batch file, with its error output"
+        output = []
+        with open( path ) as f:
+            for n, line in enumerate( f, 1 ):
+                if not line.strip():
+                    continue
+                result = self.run( '%s %s' % ( tool, line.strip() ) )
+                if result:
+                    output.append( '%sCommand failed %s:%d\n' %
+                                   ( result, path, n ) )
+        return ''.join( output )
+
+    def _sh( self, words ):
+        "sh script: run its commands, as TCBatch.flush() does"
+        output = []
+        with open( words[ 1 ] ) as f:
+            for line in f:
+                # 'cmd >/dev/null 2>&1 || echo ...': no output
+                line, quiet, _status = line.partition( ' >/dev/null 2>&1' )
+                line = line.strip()
+                if line:
+                    result = self.cmd( line )
+                    if not quiet:
+                        output.append( result )
+        return ''.join( output )
+
+    def _sysctl( self, words ):
+        "sysctl [-w] key=value: echo it back"
+        setting = words[ -1 ]
+        return '%s\n' % setting.replace( '=', ' = ' ) if '=' in setting else ''
+
+    _handlers = { 'ip': _ip, 'ifconfig': _ifconfig, 'tc': _tc,
+                  'sh': _sh, 'sysctl': _sysctl }
+
+    # Interfaces, as in mininet's Node
+
+    def addDevice( self, name, mac=None ):
+        "Add a (fake) kernel interface; return its state dict"
+        if mac is None:
+            n = next( FakeNode._macs )
+            mac = '02:00:%02x:%02x:%02x:%02x' % (
+                n >> 24 & 255, n >> 16 & 255, n >> 8 & 255, n & 255 )
+        dev = { 'mac': mac, 'ip': None, 'prefixLen': None, 'up': False,
+                'peer': None, 'qdiscs': {} }
+        self.devices[ name ] = dev
+        return dev
+
+    def newPort( self ):
+        "Return the next port number to allocate."
+        if len( self.ports ) > 0:
+            return max( self.ports.values() ) + 1
+        return self.portBase
+
+    def addIntf( self, intf, port=None, moveIntfFn=None ):
+        """Add an interface.
+           intf: interface
+           port: port number (optional, typically OpenFlow port number)
+           moveIntfFn: function to move interface (optional)"""
+        if port is None:
+            port = self.newPort()
+        self.intfs[ port ] = intf
+        self.ports[ intf ] = port
+        self.nameToIntf[ intf.name ] = intf
+        debug( 'added intf %s (%d) to node %s\n' % ( intf, port, self.name ) )
+        if self.inNamespace:
+            if moveIntfFn:
+                moveIntfFn( intf.name, self )
+            elif intf.name not in self.devices:
+                # As mininet's moveIntf(), from the root namespace
+                self.cmd( 'ip link set', intf.name, 'netns', self.pid )
+
+    def delIntf( self, intf ):
+        "Remove interface from node's bookkeeping"
+        port = self.ports.get( intf )
+        if port is not None:
+            del self.intfs[ port ]
+            del self.ports[ intf ]
+            del self.nameToIntf[ intf.name ]
+
+    def deleteIntfs( self, checkName=True ):
+        "Delete all of our interfaces"
+        for intf in list( self.intfs.values() ):
+            if not checkName or self.name in intf.name:
+                intf.delete()
+
+    def intf( self, intf=None ):
+        "Return our interface object with the given name, or the default"
+        if not intf:
+            return self.defaultIntf()
+        if isinstance( intf, str ):
+            return self.nameToIntf[ intf ]
+        return intf
+
+    def defaultIntf( self ):
+        "Return interface for lowest port"
+        ports = self.intfs.keys()
+        if ports:
+            return self.intfs[ min( ports ) ]
+        return None
+
+    def intfList( self ):
+        "List of our interfaces sorted by port number"
+        return [ self.intfs[ p ] for p in sorted( self.intfs.keys() ) ]
+
+    def intfNames( self ):
+        "The names of our interfaces sorted by port number"
+        return [ str( i ) for i in self.intfList() ]
+
+    def IP( self, intf=None ):
+        "Return IP address of a node or specific interface."
+        intf = self.intf( intf )
+        return intf.IP() if intf else None
+
+    def MAC( self, intf=None ):
+        "Return MAC address of a node or specific interface."
+        intf = self.intf( intf )
+        return intf.MAC() if intf else None
+
+    def clearCommands( self ):
+        "Forget the commands recorded so far"
+        self.commands = []
+        self.count = 0
+
+    def terminate( self ):
+        "Nothing to kill"
+        pass
+
+    def stop( self, deleteIntfs=False ):
+        if deleteIntfs:
+            self.deleteIntfs()
+
+    def __repr__( self ):
+        return '<%s %s>' % ( self.__class__.__name__, self.name )
+
+    def __str__( self ):
+        return self.name
+
+
+def _netmask( prefixLen ):
+    "Dotted netmask for a prefix length"
+    mask = ( 0xffffffff << ( 32 - prefixLen ) ) & 0xffffffff
+    return '.'.join( str( mask >> s & 255 ) for s in ( 24, 16, 8, 0 ) )
+
+
+_switchClass = []
+
+
+def fakeSwitch( name, **params ):
+    """FakeNode that OVSLink takes for an OVSSwitch, so that links
+       between two of them are OVS patch links (needs mininet.node)"""
+    if not _switchClass:
+        # pylint: disable=import-outside-toplevel
+        from mininet.node import OVSSwitch
+
+        class FakeOVSSwitch( FakeNode, OVSSwitch ):
+            "FakeNode passing for an OVSSwitch"
+            def __init__( self, name, **params ):
+                FakeNode.__init__( self, name, inNamespace=False, **params )
+
+        _switchClass.append( FakeOVSSwitch )
+    return _switchClass[ 0 ]( name, **params )
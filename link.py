@@ -20,15 +20,28 @@ Basic division of labor:
 
 Intf: basic interface object that can configure itself
 TCIntf: interface with bandwidth limiting and delay via tc
+NetlinkIntf: interface configured over rtnetlink instead of ifconfig
 
 Link: basic link class for creating veth pairs
+NetlinkLink, NetlinkTCLink: links whose interfaces use netlink, for
+comparing setup time against the ifconfig-based classes
 """
 
+import json
+import os
 import re
+import socket
+import tempfile
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
 
-from mininet.log import info, error, debug
+from mininet.log import info, error, debug, warn
 from mininet.util import makeIntfPair
 
+from rtnl import ( NetlinkSocket, NetlinkError, RTM_NEWLINK, RTM_DELLINK,
+                   RTMGRP_LINK, tcHandle )
+
 # Make pylint happy:
 # pylint: disable=too-many-arguments
 
@@ -71,8 +84,14 @@ class Intf( object ):
 
     def ifconfig( self, *args ):
         "Configure ourselves using ifconfig"
+        if args:
+            self.linkState().invalidate()
         return self.cmd( 'ifconfig', self.name, *args )
 
+    def linkState( self ):
+        "Return the cached link state table of our node"
+        return LinkStateTable.forNode( self.node )
+
     def setIP( self, ipstr, prefixLen=None ):
         """Set our IP address"""
         # This is a sign that we should perhaps rethink our prefix
@@ -147,7 +166,8 @@ class Intf( object ):
             else:
                 return True
         else:
-            return "UP" in self.ifconfig()
+            state = self.linkState().get( self.name )
+            return bool( state and state[ 'up' ] )
 
     def rename( self, newname ):
         "Rename interface"
@@ -156,6 +176,7 @@ class Intf( object ):
             self.node.nameToIntf[newname] = self.node.nameToIntf.pop(self.name)
         self.ifconfig( 'down' )
         result = self.cmd( 'ip link set', self.name, 'name', newname )
+        self.linkState().invalidate()
         self.name = newname
         self.ifconfig( 'up' )
         return result
@@ -210,13 +231,18 @@ class Intf( object ):
         # if self.node.inNamespace:
         # Link may have been dumped into root NS
         # quietRun( 'ip link del ' + self.name )
+        self.forget()
+
+    def forget( self ):
+        """Detach us from our node without deleting the device,
+           e.g. because it went away with its veth peer"""
+        self.linkState().invalidate()
         self.node.delIntf( self )
         self.link = None
 
     def status( self ):
         "Return intf status as a string"
-        links, _err, _result = self.node.pexec( 'ip link show' )
-        if self.name in links:
+        if self.linkState().get( self.name ):
             return "OK"
         else:
             return "MISSING"
@@ -228,14 +254,159 @@ class Intf( object ):
         return self.name
 
 
+class LinkStateTable( object ):
+    """Cached link state for all interfaces in a node's namespace,
+       filled by one 'ip -j link show' (or one netlink dump) instead
+       of a command per Intf.status()/isUp() call.
+       Intf methods that change link state invalidate the table;
+       startMonitor() keeps it current from netlink link events, so
+       that changes made behind our back are seen too."""
+
+    # node -> LinkStateTable
+    _tables = weakref.WeakKeyDictionary()
+
+    def __init__( self, node, useNetlink=False ):
+        """node: node whose namespace we describe
+           useNetlink: refresh over netlink rather than with ip"""
+        self.node = node
+        self.useNetlink = useNetlink
+        self.links = {}
+        self.valid = False
+        self.lock = threading.Lock()
+        self.monitor = None
+
+    @classmethod
+    def forNode( cls, node, useNetlink=False ):
+        "Return the table for node, creating it if needed"
+        table = cls._tables.get( node )
+        if table is None:
+            table = cls._tables[ node ] = cls( node, useNetlink=useNetlink )
+        return table
+
+    def refresh( self ):
+        "Reload the state of every interface in the namespace"
+        if self.useNetlink:
+            links = NetlinkSocket.forNode( self.node ).links()
+        else:
+            # use pexec so that we don't read backgrounded CLI output
+            out, _err, _exitCode = self.node.pexec( 'ip -j link show' )
+            try:
+                links = [ { 'name': l[ 'ifname' ], 'index': l[ 'ifindex' ],
+                            'up': 'UP' in l.get( 'flags', [] ),
+                            'mac': l.get( 'address' ),
+                            'mtu': l.get( 'mtu' ) }
+                          for l in json.loads( out ) ]
+            except ( ValueError, KeyError ) as e:
+                error( '*** Error reading link state of %s: %s\n' %
+                       ( self.node, e ) )
+                links = []
+        with self.lock:
+            self.links = { l[ 'name' ]: l for l in links }
+            self.valid = True
+
+    def invalidate( self ):
+        "Forget our state; the next lookup refreshes it"
+        if not self.monitor:
+            self.valid = False
+
+    def get( self, name ):
+        "Return the state dict for interface name, or None"
+        if not self.valid:
+            self.refresh()
+        return self.links.get( name )
+
+    def _monitorLoop( self, sock ):
+        "Apply netlink link events to the table"
+        while self.monitor is sock:
+            try:
+                msgs = sock.receive()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            with self.lock:
+                for kind, payload in msgs:
+                    link = NetlinkSocket.parseLink( payload )
+                    if kind == RTM_NEWLINK:
+                        old = self.links.get( link[ 'name' ], {} )
+                        if old.get( 'index' ) not in ( None,
+                                                       link[ 'index' ] ):
+                            old = {}
+                        self.links[ link[ 'name' ] ] = dict( old, **link )
+                        # A rename leaves the old name behind
+                        for name, l in list( self.links.items() ):
+                            if ( l[ 'index' ] == link[ 'index' ] and
+                                 name != link[ 'name' ] ):
+                                del self.links[ name ]
+                    elif kind == RTM_DELLINK:
+                        self.links.pop( link[ 'name' ], None )
+
+    def startMonitor( self ):
+        "Keep the table current from netlink events in a thread"
+        if self.monitor:
+            return
+        pid = self.node.pid if self.node.inNamespace else None
+        # Time out now and then to notice stopMonitor()
+        self.monitor = NetlinkSocket( pid, groups=RTMGRP_LINK, timeout=.5 )
+        thread = threading.Thread( target=self._monitorLoop,
+                                   args=( self.monitor, ) )
+        thread.daemon = True
+        thread.start()
+        # Subscribe first, then dump, so that we can't miss a change
+        self.refresh()
+
+    def stopMonitor( self ):
+        "Stop following netlink events"
+        sock, self.monitor = self.monitor, None
+        self.valid = False
+        if sock:
+            sock.close()
+
+
+
 class TCIntf( Intf ):
     """Interface customized by tc (traffic control) utility
        Allows specification of bandwidth limits (various methods)
        as well as delay, loss and max queue length"""
 
-    # The parameters we use seem to work reasonably up to 1 Gb/sec
-    # For higher data rates, we will probably need to change them.
-    bwParamMax = 1000
+    # The original parameters worked reasonably up to 1 Gb/sec; above
+    # that, bursts are sized to the rate (see bursts())
+    bwParamMax = 100000
+
+    # Shape installed by config() (its parameters), the tc commands
+    # that built it, and the ethtool offload settings
+    shape = None
+    shapeInstalled = None
+    offload = {}
+
+    # Seconds of traffic an htb/tbf burst should hold: the shaper's
+    # timer can't refill more often than that without burning CPU
+    burstTime = 0.001
+    # Largest packet the shaper sees with GSO/TSO or GRO on (an
+    # aggregated skb), and without
+    gsoSize = 65536
+    mtu = 1514
+
+    # Leaf qdiscs config() can put at the end of the chain ( qdisc= )
+    leafQdiscs = ( 'fq', 'fq_codel', 'cake' )
+
+    def bursts( self, bw, gso=None ):
+        """Return ( burst, cburst, quantum ) in bytes for shaping to bw
+           Mbit/s, or None where the original 15k burst is still
+           enough (below ~120 Mbit/s), so those commands don't change.
+           Above that the burst holds burstTime of traffic, at least
+           one GSO/GRO aggregate when offloads are on, cburst is the
+           same (tc's default cburst is one MTU, which throttles
+           multi-gigabit rates), and quantum is the largest packet.
+           gso: offloads on (default: txo or gro from config())"""
+        burst = bw * 1e6 / 8 * self.burstTime
+        if burst <= 15 * 1024:
+            return None
+        if gso is None:
+            gso = self.offload.get( 'txo', True ) or self.offload.get( 'gro' )
+        packet = self.gsoSize if gso else self.mtu
+        burst = int( max( burst, packet ) )
+        return burst, burst, packet
 
     def bwCmds( self, bw=None, speedup=0, use_hfsc=False, use_tbf=False,
                 latency_ms=None, enable_ecn=False, enable_red=False ):
@@ -251,20 +422,26 @@ class TCIntf( Intf ):
             if ( speedup > 0 and
                  self.node.name[0:1] == 's' ):
                 bw = speedup
-            # This may not be correct - we should look more closely
-            # at the semantics of burst (and cburst) to make sure we
-            # are specifying the correct sizes. For now I have used
-            # the same settings we had in the mininet-hifi code.
+            # Up to ~120 Mbit/s these are the settings we had in the
+            # mininet-hifi code; above, bursts() sizes burst, cburst
+            # and quantum to the rate
+            bursts = self.bursts( bw ) if bw else None
             if use_hfsc:
                 cmds += [ '%s qdisc add dev %s root handle 5:0 hfsc default 1',
                           '%s class add dev %s parent 5:0 classid 5:1 hfsc sc '
                           + 'rate %fMbit ul rate %fMbit' % ( bw, bw ) ]
             elif use_tbf:
+                burst = bursts[ 0 ] if bursts else 15000
                 if latency_ms is None:
-                    latency_ms = 15.0 * 8 / bw
+                    latency_ms = burst * 8.0 / bw / 1000
                 cmds += [ '%s qdisc add dev %s root handle 5: tbf ' +
-                          'rate %fMbit burst 15000 latency %fms' %
-                          ( bw, latency_ms ) ]
+                          'rate %fMbit burst %d latency %fms' %
+                          ( bw, burst, latency_ms ) ]
+            elif bursts:
+                cmds += [ '%s qdisc add dev %s root handle 5:0 htb default 1',
+                          '%s class add dev %s parent 5:0 classid 5:1 htb ' +
+                          'rate %fMbit burst %d cburst %d quantum %d' %
+                          ( ( bw, ) + bursts ) ]
             else:
                 cmds += [ '%s qdisc add dev %s root handle 5:0 htb default 1',
                           '%s class add dev %s parent 5:0 classid 5:1 htb ' +
@@ -288,6 +465,19 @@ class TCIntf( Intf ):
                 parent = ' parent 6: '
         return cmds, parent
 
+    def leafCmds( self, parent, qdisc=None ):
+        """Internal method: return tc commands for a leaf qdisc
+           qdisc: 'fq', 'fq_codel' or 'cake', optionally followed by
+                  its arguments, e.g. 'fq_codel target 1ms'"""
+        if not qdisc:
+            return [], parent
+        kind = qdisc.split()[ 0 ]
+        if kind not in self.leafQdiscs:
+            error( 'Unsupported leaf qdisc', kind, '- ignoring\n' )
+            return [], parent
+        return [ '%s qdisc add dev %s ' + parent + ' handle 20: ' +
+                 qdisc ], ' parent 20: '
+
     @staticmethod
     def delayCmds( parent, delay=None, jitter=None,
                    loss=None, max_queue_size=None ):
@@ -310,6 +500,121 @@ class TCIntf( Intf ):
                 parent = ' parent 10:1 '
         return cmds, parent
 
+    def shapeCmds( self, bw=None, delay=None, jitter=None, loss=None,
+                   speedup=0, use_hfsc=False, use_tbf=False,
+                   latency_ms=None, enable_ecn=False, enable_red=False,
+                   max_queue_size=None, qdisc=None ):
+        """Internal method: return tc commands that build the qdisc
+           chain for a shape (config() parameters), and the last parent"""
+        bwcmds, parent = self.bwCmds( bw=bw, speedup=speedup,
+                                      use_hfsc=use_hfsc, use_tbf=use_tbf,
+                                      latency_ms=latency_ms,
+                                      enable_ecn=enable_ecn,
+                                      enable_red=enable_red )
+        delaycmds, parent = self.delayCmds( delay=delay, jitter=jitter,
+                                            loss=loss,
+                                            max_queue_size=max_queue_size,
+                                            parent=parent )
+        leafcmds, parent = self.leafCmds( parent, qdisc=qdisc )
+        return bwcmds + delaycmds + leafcmds, parent
+
+    # Everything up to the qdisc or class kind in a command from
+    # shapeCmds(), i.e. which qdisc/class it adds, and where
+    _layoutRegex = re.compile(
+        r'.*? (htb|hfsc|tbf|red|netem|fq_codel|fq|cake)\b' )
+
+    def _reshape( self, params, shape=None, installed=None ):
+        """Internal method: return the shape with params changed, its
+           commands and the change commands for it (see changeCmds());
+           shape, installed: the shape to start from and the commands
+           that built it (default: what we installed)"""
+        if installed is None:
+            shape, installed = self.shape, self.shapeInstalled
+        if installed is None:
+            return dict( params ), self.shapeCmds( **params )[ 0 ], None
+        shape = dict( shape, **params )
+        cmds, _parent = self.shapeCmds( **shape )
+        if len( cmds ) != len( installed ):
+            return shape, cmds, None
+        layout = self._layoutRegex.match
+        changes = []
+        for old, new in zip( installed, cmds ):
+            if layout( old ).group( 0 ) != layout( new ).group( 0 ):
+                return shape, cmds, None
+            if new != old:
+                changes.append( new.replace( ' add ', ' change ', 1 ) )
+        return shape, cmds, changes
+
+    def changeCmds( self, **params ):
+        """Return 'tc ... change' commands that reshape the installed
+           qdiscs and classes to params (config() shaping parameters;
+           the rest keep their installed values), one per qdisc or
+           class whose parameters differ, or None if params need a
+           different chain of qdiscs (or nothing was installed yet)"""
+        return self._reshape( params )[ 2 ]
+
+    def reshapeCmds( self, params, shape=None, installed=None ):
+        """Return the shape with params changed, the commands that
+           build it, and the tc commands that take the link there from
+           shape and installed (default: what we installed): 'change'
+           commands if the chain of qdiscs stays the same, else the
+           root qdisc deleted and the whole chain added again, so a
+           shaped link never loses its rate limit on the way"""
+        if installed is None:
+            shape, installed = self.shape, self.shapeInstalled
+        shape, cmds, changes = self._reshape( params, shape, installed )
+        if changes is None:
+            changes = ( [ '%s qdisc del dev %s root' ] if installed
+                        else [] ) + cmds
+        return shape, cmds, changes
+
+    def changeTC( self, cmds, shape, batch=None ):
+        """Internal method: run (or queue in batch) change commands
+           for shape; return their outputs (None if queued)"""
+        if batch:
+            batch.addTC( self, cmds )
+            return None
+        return [ self.tc( cmd ) for cmd in cmds ]
+
+    def change( self, batch=None, **params ):
+        """Reshape the link in place: only the qdiscs and classes whose
+           parameters differ get a 'tc ... change', so their queues
+           (and the packets in them) survive. Adding or removing a
+           stage (e.g. bw where there was none) or switching between
+           htb, hfsc and tbf falls back to a full config(); removing
+           every stage (e.g. delay=None on a delay-only link) deletes
+           the root qdisc.
+           params: config() shaping parameters, e.g. bw=50, delay='5ms'
+           batch: TCBatch to queue the commands in
+                  (default: TCBatch.active, if any)
+           returns: list of tc outputs ('' for success; None if queued
+                    or reconfigured)"""
+        if batch is None:
+            batch = TCBatch.active
+        shape, cmds, changes = self._reshape( params )
+        if changes is None and not cmds and self.shapeInstalled:
+            # Nothing left to shape: config() would return before
+            # touching the qdiscs, so take down what we installed
+            debug( '*** %s: removing the shaping qdiscs\n' % self )
+            self.shape, self.shapeInstalled = shape, []
+            outputs = TCIntf.changeTC(
+                self, [ '%s qdisc del dev %s root' ], shape, batch=batch )
+        elif changes is None:
+            debug( '*** %s: reshaping with config()\n' % self )
+            # ( up=None: leave the link state alone )
+            self.config( batch=batch, up=None,
+                         **dict( self.offload, **shape ) )
+            return None
+        else:
+            self.shape, self.shapeInstalled = shape, cmds
+            if not changes:
+                return []
+            outputs = self.changeTC( changes, shape, batch=batch )
+        for output in outputs or []:
+            if output != '':
+                error( "*** Error: %s" % output )
+        return outputs
+
     def tc( self, cmd, tc='tc' ):
         "Execute tc command for our interface"
         c = cmd % (tc, self)  # Add in tc command and our name
@@ -321,7 +626,7 @@ class TCIntf( Intf ):
                 gro=False, txo=True, rxo=True,
                 speedup=0, use_hfsc=False, use_tbf=False,
                 latency_ms=None, enable_ecn=False, enable_red=False,
-                max_queue_size=None, **params ):
+                max_queue_size=None, qdisc=None, batch=None, **params ):
         """Configure the port and set its properties.
            bw: bandwidth in b/s (e.g. '10m')
            delay: transmit delay (e.g. '1ms' )
@@ -336,50 +641,70 @@ class TCIntf( Intf ):
            latency_ms: TBF latency parameter
            enable_ecn: enable ECN (False)
            enable_red: enable RED (False)
-           max_queue_size: queue limit parameter for netem"""
+           max_queue_size: queue limit parameter for netem
+           qdisc: leaf qdisc after the shaping ones (or the root
+                  qdisc, alone): 'fq', 'fq_codel' or 'cake', with
+                  arguments if needed, e.g. 'fq_codel target 1ms'
+           batch: TCBatch to queue our commands in instead of running
+                  them now (default: TCBatch.active, if any)"""
 
         # Support old names for parameters
         gro = not params.pop( 'disable_gro', not gro )
+        self.offload = dict( gro=gro, txo=txo, rxo=rxo )
 
         result = Intf.config( self, **params)
 
+        if batch is None:
+            batch = TCBatch.active
+
         def on( isOn ):
             "Helper method: bool -> 'on'/'off'"
             return 'on' if isOn else 'off'
 
         # Set offload parameters with ethool
-        self.cmd( 'ethtool -K', self,
-                  'gro', on( gro ),
-                  'tx', on( txo ),
-                  'rx', on( rxo ) )
+        ethtool = ( 'ethtool -K %s gro %s tx %s rx %s' %
+                    ( self, on( gro ), on( txo ), on( rxo ) ) )
+        if batch:
+            batch.addCmd( self, ethtool )
+        else:
+            self.cmd( ethtool )
 
         # Optimization: return if nothing else to configure
         # Question: what happens if we want to reset things?
+        # (Answer: not here; change() with an empty shape deletes the
+        # root qdisc, and a new shape replaces the old one below)
         if ( bw is None and not delay and not loss
-             and max_queue_size is None ):
+             and max_queue_size is None and not qdisc ):
             return None
 
         # Clear existing configuration
-        tcoutput = self.tc( '%s qdisc show dev %s' )
-        if "priomap" not in tcoutput and "noqueue" not in tcoutput:
+        if batch:
+            # We can't look at the current qdisc without a round
+            # trip, so always delete it; the batch ignores the error
+            # when there is only the default qdisc to delete
             cmds = [ '%s qdisc del dev %s root' ]
         else:
-            cmds = []
+            tcoutput = self.tc( '%s qdisc show dev %s' )
+            if "priomap" not in tcoutput and "noqueue" not in tcoutput:
+                cmds = [ '%s qdisc del dev %s root' ]
+            else:
+                cmds = []
 
-        # Bandwidth limits via various methods
-        bwcmds, parent = self.bwCmds( bw=bw, speedup=speedup,
-                                      use_hfsc=use_hfsc, use_tbf=use_tbf,
-                                      latency_ms=latency_ms,
-                                      enable_ecn=enable_ecn,
-                                      enable_red=enable_red )
-        cmds += bwcmds
+        if bw and bw > 1000 and not ( txo or gro ):
+            warn( '*** %s: shaping %.0f Mbit/s with offloads off, one MTU '
+                  'at a time: expect to fall short\n' % ( self, bw ) )
 
-        # Delay/jitter/loss/max_queue_size using netem
-        delaycmds, parent = self.delayCmds( delay=delay, jitter=jitter,
-                                            loss=loss,
-                                            max_queue_size=max_queue_size,
-                                            parent=parent )
-        cmds += delaycmds
+        # Bandwidth limits, ECN/RED and delay/jitter/loss/max_queue_size
+        shape = dict( bw=bw, delay=delay, jitter=jitter, loss=loss,
+                      speedup=speedup, use_hfsc=use_hfsc, use_tbf=use_tbf,
+                      latency_ms=latency_ms, enable_ecn=enable_ecn,
+                      enable_red=enable_red, max_queue_size=max_queue_size,
+                      qdisc=qdisc )
+        shapecmds, parent = self.shapeCmds( **shape )
+        cmds += shapecmds
+
+        # Remember what we installed, for change()
+        self.shape, self.shapeInstalled = shape, shapecmds
 
         # Ugly but functional: display configuration info
         stuff = ( ( [ '%.2fMbit' % bw ] if bw is not None else [] ) +
@@ -387,9 +712,17 @@ class TCIntf( Intf ):
                   ( [ '%s jitter' % jitter ] if jitter is not None else [] ) +
                   ( ['%.5f%% loss' % loss ] if loss is not None else [] ) +
                   ( [ 'ECN' ] if enable_ecn else [ 'RED' ]
-                    if enable_red else [] ) )
+                    if enable_red else [] ) +
+                  ( [ qdisc.split()[ 0 ] ] if qdisc else [] ) )
         info( '(' + ' '.join( stuff ) + ') ' )
 
+        result[ 'parent' ] = parent
+
+        if batch:
+            # tcoutputs are filled in when the batch is flushed
+            batch.addTC( self, cmds, result )
+            return result
+
         # Execute all the commands in our node
         debug("at map stage w/cmds: %s\n" % cmds)
         tcoutputs = [ self.tc(cmd) for cmd in cmds ]
@@ -399,11 +732,192 @@ class TCIntf( Intf ):
         debug( "cmds:", cmds, '\n' )
         debug( "outputs:", tcoutputs, '\n' )
         result[ 'tcoutputs'] = tcoutputs
-        result[ 'parent' ] = parent
 
         return result
 
 
+# 'ip -batch' and 'tc -batch' report each failing line as
+# 'Command failed file:N', after what it printed
+_failedRegex = re.compile( r'Command failed .*:(\d+)\s*$' )
+
+
+def batchErrors( output, nLines ):
+    """Split the output of an 'ip -force -batch' or 'tc -force -batch'
+       of nLines lines into the error output of each line
+       returns: ( list of nLines outputs, '' for the lines that
+                  worked, output that no failing line claimed )"""
+    errors = [ '' ] * nLines
+    text = []
+    for line in output.splitlines():
+        m = _failedRegex.search( line )
+        if m and 0 < int( m.group( 1 ) ) <= nLines:
+            n = int( m.group( 1 ) ) - 1
+            errors[ n ] = '\n'.join( text + [ line ] ) + '\n'
+            text = []
+        elif line.strip():
+            text.append( line )
+    return errors, '\n'.join( text )
+
+
+def writeLines( lines, prefix, suffix='.batch' ):
+    "Write lines to a new temporary file; return its path"
+    fd, path = tempfile.mkstemp( prefix=prefix, suffix=suffix )
+    with os.fdopen( fd, 'w' ) as f:
+        f.write( ''.join( line + '\n' for line in lines ) )
+    return path
+
+
+def runScripts( scripts ):
+    """Run a command in every node's shell, all nodes at once, and
+       delete the files it used once it is done
+       scripts: { node: ( command, [ temporary file paths ] ) }
+       returns: { node: output }"""
+    for node, ( cmd, _paths ) in scripts.items():
+        debug( " *** executing on %s: %s\n" % ( node, cmd ) )
+        node.sendCmd( cmd )
+    outputs = {}
+    for node, ( _cmd, paths ) in scripts.items():
+        outputs[ node ] = node.waitOutput()
+        for path in paths:
+            os.unlink( path )
+    return outputs
+
+
+def runBatches( batches, tool='ip' ):
+    """Run lines as one '<tool> -force -batch' per node, all nodes
+       at once
+       batches: { node: [ lines ] }
+       returns: { node: output } (see batchErrors())"""
+    scripts = {}
+    for node, lines in batches.items():
+        path = writeLines( lines, prefix='mn-%s-' % tool )
+        scripts[ node ] = ( '%s -force -batch %s' % ( tool, path ),
+                            [ path ] )
+    return runScripts( scripts )
+
+
+class TCBatch( object ):
+    """Collects the commands that TCIntf.config() generates and runs
+       them as a single 'tc -batch' per node (i.e. per namespace),
+       saving a shell round trip for every tc and ethtool command.
+       Use it as a context manager around network construction:
+           with TCBatch():
+               net = Mininet( topo=topo, link=TCLink )
+       or pass batch=TCBatch() to particular links and flush() it."""
+
+    # Batch that TCIntf.config() uses by default, set by 'with'
+    active = None
+
+    def __init__( self, tc='tc' ):
+        "tc: tc command to run the batch with"
+        self.tc = tc
+        # node -> list of [ intf, ethtool cmds, tc cmds, result ]
+        self.pending = {}
+
+    def _entry( self, intf ):
+        "Return the (last) queued entry for intf, adding one if needed"
+        entries = self.pending.setdefault( intf.node, [] )
+        if not entries or entries[ -1 ][ 0 ] is not intf:
+            entries.append( [ intf, [], [], None ] )
+        return entries[ -1 ]
+
+    def addCmd( self, intf, cmd ):
+        """Queue a plain (non-tc) shell command for intf's node;
+           its output is discarded, its exit status is not"""
+        self._entry( intf )[ 1 ].append( cmd )
+
+    def addTC( self, intf, cmds, result=None ):
+        """Queue tc command templates for intf
+           cmds: '%s qdisc ... dev %s ...' templates as in TCIntf.tc()
+           result: config() result dict to receive 'tcoutputs'"""
+        entry = self._entry( intf )
+        entry[ 2 ] += cmds
+        if result is not None:
+            entry[ 3 ] = result
+
+    # What the script prints for a shell command that failed
+    _failedRegex = re.compile( r'^mn-cmd (\d+): (exit status \d+)\n?', re.M )
+
+    def _writeScript( self, entries ):
+        "Write the batch and script files for a node; return their paths"
+        # Leave the tc command itself out of the templates
+        batchPath = writeLines(
+            [ ( cmd % ( '', intf ) ).strip()
+              for intf, _cmds, tcCmds, _result in entries
+              for cmd in tcCmds ], prefix='mn-tc-' )
+        cmds = [ cmd for _intf, cmds, _tcCmds, _result in entries
+                 for cmd in cmds ]
+        scriptPath = writeLines(
+            [ '%s >/dev/null 2>&1 || echo "mn-cmd %d: exit status $?"' %
+              ( cmd, n ) for n, cmd in enumerate( cmds ) ] +
+            [ '%s -force -batch %s' % ( self.tc, batchPath ) ],
+            prefix='mn-tc-', suffix='.sh' )
+        return batchPath, scriptPath
+
+    def _distribute( self, node, entries, output ):
+        """Map the script's output back to the commands it came from:
+           shell commands' exit statuses, tc -batch errors"""
+        failed = {}
+        for match in self._failedRegex.finditer( output ):
+            failed[ int( match.group( 1 ) ) ] = match.group( 2 )
+        output = self._failedRegex.sub( '', output )
+        lines = []
+        for _intf, _cmds, tcCmds, _result in entries:
+            lines += tcCmds
+        outputs, text = batchErrors( output, len( lines ) )
+        for n, line in enumerate( lines ):
+            # The root qdisc may just be the default one
+            if line.endswith( 'qdisc del dev %s root' ):
+                outputs[ n ] = ''
+        if text:
+            error( '*** Error: unattributed tc output on %s: %s\n' %
+                   ( node, text ) )
+        n, c, allOutputs = 0, 0, []
+        for intf, cmds, tcCmds, result in entries:
+            cmdoutputs = [ failed.get( i, '' )
+                           for i in range( c, c + len( cmds ) ) ]
+            c += len( cmds )
+            for cmd, output in zip( cmds, cmdoutputs ):
+                if output:
+                    debug( '*** %s failed on %s: %s\n' % ( cmd, intf, output ) )
+            tcoutputs = outputs[ n : n + len( tcCmds ) ]
+            n += len( tcCmds )
+            for output in tcoutputs:
+                if output != '':
+                    error( "*** Error on %s: %s" % ( intf, output ) )
+            if result is not None:
+                debug( "outputs:", tcoutputs, '\n' )
+                result[ 'tcoutputs' ] = tcoutputs
+            allOutputs += cmdoutputs + tcoutputs
+        return allOutputs
+
+    def flush( self, node=None ):
+        """Run queued commands, one batch per node, in parallel
+           across nodes
+           node: only flush this node's commands (optional)
+           returns: { node: an output per queued command, in order
+                      ( an interface's shell commands, then its tc
+                      lines ), '' if it went through }"""
+        nodes = [ node ] if node else list( self.pending )
+        pending, scripts = {}, {}
+        for n in nodes:
+            entries = self.pending.pop( n, None )
+            if entries:
+                pending[ n ] = entries
+                paths = self._writeScript( entries )
+                scripts[ n ] = ( 'sh %s' % paths[ 1 ], list( paths ) )
+        return { n: self._distribute( n, pending[ n ], output )
+                 for n, output in runScripts( scripts ).items() }
+
+    def __enter__( self ):
+        self.prev, TCBatch.active = TCBatch.active, self
+        return self
+
+    def __exit__( self, *args ):
+        TCBatch.active = self.prev
+        self.flush()
+
+
 class Link( object ):
 
     """A basic link is just a veth pair.
@@ -413,7 +927,7 @@ class Link( object ):
     def __init__( self, node1, node2, port1=None, port2=None,
                   intfName1=None, intfName2=None, addr1=None, addr2=None,
                   intf=Intf, cls1=None, cls2=None, params1=None,
-                  params2=None, fast=True, **params ):
+                  params2=None, fast=True, pairCreated=False, **params ):
         """Create veth link to another node, making two new interfaces.
            node1: first node
            node2: second node
@@ -425,6 +939,8 @@ class Link( object ):
            intfName2: node2  interface name (optional)
            params1: parameters for interface 1 (optional)
            params2: parameters for interface 2 (optional)
+           pairCreated: veth pair already exists in the node namespaces
+                        (fast mode only; see makeLinks())
            **params: additional parameters for both interfaces"""
 
         # This is a bit awkward; it seems that having everything in
@@ -453,8 +969,9 @@ class Link( object ):
         if fast:
             params1.setdefault( 'moveIntfFn', self._ignore )
             params2.setdefault( 'moveIntfFn', self._ignore )
-            self.makeIntfPair( intfName1, intfName2, addr1, addr2,
-                               node1, node2, deleteIntfs=False )
+            if not pairCreated:
+                self.makeIntfPair( intfName1, intfName2, addr1, addr2,
+                                   node1, node2, deleteIntfs=False )
         else:
             self.makeIntfPair( intfName1, intfName2, addr1, addr2 )
 
@@ -473,6 +990,105 @@ class Link( object ):
 
     # pylint: enable=too-many-branches
 
+    @classmethod
+    def makeLinks( cls, specs, maxWorkers=32 ):
+        """Create many links of this class at once.
+           specs: list of ( node1, node2, params ) tuples, where params
+                  (a dict or None) are keyword arguments for cls
+           maxWorkers: maximum number of links configured at once
+           returns: list of links, in the same order as specs
+           Veth pairs are created up front with one 'ip -batch' per
+           namespace. The links are then constructed in rounds in
+           which no node appears twice, so every node's shell runs its
+           interface configuration concurrently with the others.
+           Links that don't make plain veth pairs (OVS patch links,
+           fast=False) still create them in their own constructor.
+           Add the links to net.links if they belong to a Mininet."""
+        specs = [ ( node1, node2, dict( params ) if params else {} )
+                  for node1, node2, params in specs ]
+        bulkPairs = getattr( cls.makeIntfPair, '__func__', None ) is (
+            Link.makeIntfPair.__func__ )
+
+        # Hand out ports and names first, since newPort() only moves
+        # on once an interface has actually been added to the node
+        nextPort = {}
+        pairs = {}
+        for node1, node2, params in specs:
+            for node, n in ( node1, '1' ), ( node2, '2' ):
+                port = params.get( 'port' + n,
+                                   ( params.get( 'params' + n ) or {} ).get(
+                                       'port' ) )
+                if port is None:
+                    port = nextPort.get( node )
+                    if port is None:
+                        port = node.newPort()
+                    nextPort[ node ] = port + 1
+                    params[ 'port' + n ] = port
+                if not params.get( 'intfName' + n ):
+                    # As intfName() does
+                    params[ 'intfName' + n ] = ( node.name + '-eth' +
+                                                 repr( port ) )
+            if bulkPairs and params.get( 'fast', True ):
+                addr1, addr2 = params.get( 'addr1' ), params.get( 'addr2' )
+                line = ( 'link add name %s%s type veth peer name %s%s '
+                         'netns %s' % (
+                             params[ 'intfName1' ],
+                             ' address %s' % addr1 if addr1 else '',
+                             params[ 'intfName2' ],
+                             ' address %s' % addr2 if addr2 else '',
+                             node2.pid ) )
+                pairs.setdefault( node1, [] ).append( ( line, params ) )
+
+        # Create the veth pairs from each node1, all nodes at once
+        errors = []
+        outputs = cls.makeIntfPairs(
+            { node: [ line for line, _ in lines ]
+              for node, lines in pairs.items() } )
+        for node, output in outputs.items():
+            failed, _text = batchErrors( output, len( pairs[ node ] ) )
+            for err, ( line, params ) in zip( failed, pairs[ node ] ):
+                if err:
+                    errors.append( line )
+                else:
+                    params[ 'pairCreated' ] = True
+            if any( failed ):
+                error( '*** Error on %s: %s' % ( node, output ) )
+        if errors:
+            raise Exception( 'Error creating interface pairs: %s' %
+                             '; '.join( errors ) )
+
+        # Group links into rounds in which every node appears once
+        rounds = []
+        for i, ( node1, node2, _params ) in enumerate( specs ):
+            for used, members in rounds:
+                if node1 not in used and node2 not in used:
+                    break
+            else:
+                used, members = set(), []
+                rounds.append( ( used, members ) )
+            used.update( ( node1, node2 ) )
+            members.append( i )
+
+        def build( i ):
+            "Construct link i"
+            node1, node2, params = specs[ i ]
+            return cls( node1, node2, **params )
+
+        links = [ None ] * len( specs )
+        with ThreadPoolExecutor( max_workers=maxWorkers ) as pool:
+            for _used, members in rounds:
+                for i, link in zip( members, pool.map( build, members ) ):
+                    links[ i ] = link
+        return links
+
+    @classmethod
+    def makeIntfPairs( cls, batches ):
+        """Run 'ip link add' lines in one 'ip -batch' per node, all
+           nodes at once (the bulk version of makeIntfPair())
+           batches: { node: [ lines ] }
+           returns: { node: output of its batch }"""
+        return runBatches( batches, tool='ip' )
+
     @staticmethod
     def _ignore( *args, **kwargs ):
         "Ignore any arguments"
@@ -505,7 +1121,8 @@ class Link( object ):
         "Delete this link"
         self.intf1.delete()
         self.intf1 = None
-        self.intf2.delete()
+        # Deleting one end of a veth pair deletes its peer as well
+        self.intf2.forget()
         self.intf2 = None
 
     def stop( self ):
@@ -559,6 +1176,16 @@ class OVSLink( Link ):
         else:
             return Link.makeIntfPair( *args, **kwargs )
 
+    def delete( self ):
+        "Patch ports are not a veth pair: delete both ends"
+        if self.isPatchLink:
+            self.intf1.delete()
+            self.intf1 = None
+            self.intf2.delete()
+            self.intf2 = None
+        else:
+            Link.delete( self )
+
 
 class TCLink( Link ):
     "Link with TC interfaces"
@@ -567,6 +1194,16 @@ class TCLink( Link ):
         kwargs.setdefault( 'cls2', TCIntf )
         Link.__init__( self, *args, **kwargs)
 
+    def change( self, params1=None, params2=None, batch=None, **params ):
+        """Reshape both ends in place (see TCIntf.change())
+           params: shaping parameters for both interfaces
+           params1, params2: parameters for one end only
+           returns: ( intf1 outputs, intf2 outputs )"""
+        return tuple( intf.change( batch=batch,
+                                   **dict( params, **( extra or {} ) ) )
+                      for intf, extra in ( ( self.intf1, params1 ),
+                                           ( self.intf2, params2 ) ) )
+
 
 class TCULink( TCLink ):
     """TCLink with default settings optimized for UserSwitch
@@ -581,3 +1218,216 @@ class TCULink( TCLink ):
     def __init__( self, *args, **kwargs ):
         kwargs.update( txo=False, rxo=False )
         TCLink.__init__( self, *args, **kwargs )
+
+
+class NetlinkIntf( Intf ):
+    """Interface that configures itself over rtnetlink rather than
+       by running and parsing ifconfig: addresses, MAC and link state
+       are set and read back as structured data, without spawning
+       any processes in the node."""
+
+    _index = None
+
+    def nl( self ):
+        "Return the netlink socket for our node's namespace"
+        return NetlinkSocket.forNode( self.node )
+
+    def linkState( self ):
+        "Return our node's link state table, refreshed over netlink"
+        return LinkStateTable.forNode( self.node, useNetlink=True )
+
+    def index( self ):
+        "Return our ifindex (cached, since it survives renames)"
+        if self._index is None:
+            self._index = self.nl().link( self.name )[ 'index' ]
+        return self._index
+
+    def request( self, *msgs ):
+        """Send netlink requests; return '' or an error message,
+           like the output of the equivalent ifconfig command"""
+        self.linkState().invalidate()
+        try:
+            self.nl().request( *msgs )
+        except NetlinkError as e:
+            return 'Error: %s: %s\n' % ( self.name, e )
+        return ''
+
+    def setIP( self, ipstr, prefixLen=None ):
+        """Set our IP address"""
+        if '/' in ipstr:
+            self.ip, self.prefixLen = ipstr.split( '/' )
+            up = True
+        else:
+            if prefixLen is None:
+                raise Exception( 'No prefix length set for IP address %s'
+                                 % ( ipstr, ) )
+            self.ip, self.prefixLen = ipstr, prefixLen
+            up = False
+        self.linkState().invalidate()
+        try:
+            self.nl().replaceAddr( self.index(), self.ip,
+                                   int( self.prefixLen ), up=up )
+        except NetlinkError as e:
+            return 'Error: %s: %s\n' % ( self.name, e )
+        return ''
+
+    def setMAC( self, macstr ):
+        """Set the MAC address for an interface.
+           macstr: MAC address as string"""
+        self.mac = macstr
+        try:
+            index = self.index()
+        except NetlinkError as e:
+            return 'Error: %s: %s\n' % ( self.name, e )
+        # down, set MAC and up again, in a single send
+        return self.request(
+            NetlinkSocket.setLinkMsg( index, up=False ),
+            NetlinkSocket.setLinkMsg( index, mac=macstr ),
+            NetlinkSocket.setLinkMsg( index, up=True ) )
+
+    def linkInfo( self ):
+        """Return our link state as a dict:
+           name, index, flags, up, mac, mtu and addrs, a list of
+           ( ip, prefixLen ) tuples"""
+        nl = self.nl()
+        link = nl.link( self.name )
+        self._index = link[ 'index' ]
+        link[ 'addrs' ] = [ ( a[ 'ip' ], a[ 'prefixLen' ] )
+                            for a in nl.addrs( link[ 'index' ] )
+                            if 'ip' in a ]
+        return link
+
+    def updateIP( self ):
+        "Return updated IP address based on netlink"
+        addrs = self.linkInfo()[ 'addrs' ]
+        self.ip = addrs[ 0 ][ 0 ] if addrs else None
+        return self.ip
+
+    def updateMAC( self ):
+        "Return updated MAC address based on netlink"
+        self.mac = self.linkInfo().get( 'mac' )
+        return self.mac
+
+    def updateAddr( self ):
+        "Return IP address and MAC address based on netlink"
+        link = self.linkInfo()
+        addrs = link[ 'addrs' ]
+        self.ip = addrs[ 0 ][ 0 ] if addrs else None
+        self.mac = link.get( 'mac' )
+        return self.ip, self.mac
+
+    def isUp( self, setUp=False ):
+        "Return whether interface is up"
+        if setUp:
+            try:
+                index = self.index()
+            except NetlinkError as e:
+                cmdOutput = str( e )
+            else:
+                cmdOutput = self.request(
+                    NetlinkSocket.setLinkMsg( index, up=True ) )
+            if cmdOutput:
+                error( "Error setting %s up: %s " % ( self.name, cmdOutput ) )
+                return False
+            else:
+                return True
+        else:
+            return Intf.isUp( self )
+
+    def delete( self ):
+        "Delete interface"
+        Intf.delete( self )
+        self._index = None
+
+
+class NetlinkTCIntf( NetlinkIntf, TCIntf ):
+    """TCIntf whose address, MAC and link state are set via netlink,
+       and whose htb, tbf and netem parameters change() changes via
+       netlink too (tens of microseconds instead of a tc process)"""
+
+    _rateRegex = re.compile( r' rate ([0-9.]+)Mbit' )
+    _latencyRegex = re.compile( r' latency ([0-9.]+)ms' )
+    _sizeRegex = re.compile( r' (burst|cburst|quantum) ([0-9]+)(k?)' )
+    _timeRegex = re.compile( r'^\s*([0-9.]+)\s*(s|sec|secs|ms|msec|msecs|'
+                             r'us|usec|usecs|ns|)\s*$' )
+    _usecPer = { 's': 1e6, 'sec': 1e6, 'secs': 1e6, 'ms': 1e3, 'msec': 1e3,
+                 'msecs': 1e3, 'us': 1, 'usec': 1, 'usecs': 1, 'ns': 1e-3,
+                 '': 1 }
+
+    @classmethod
+    def usec( cls, time ):
+        "tc time ('5ms', '100us', '1s'; plain numbers are us) -> us"
+        if time is None:
+            return 0
+        m = cls._timeRegex.match( str( time ) )
+        if not m:
+            raise ValueError( 'Bad time %r' % ( time, ) )
+        return float( m.group( 1 ) ) * cls._usecPer[ m.group( 2 ) ]
+
+    @classmethod
+    def sizes( cls, cmd ):
+        "{ 'burst': bytes, ... } for the sizes in an htb/tbf command"
+        return { name: int( n ) * ( 1024 if k else 1 )
+                 for name, n, k in cls._sizeRegex.findall( cmd ) }
+
+    @classmethod
+    def changeMsgs( cls, index, cmds, shape ):
+        """Return netlink requests that do what change commands for
+           shape do on link index, or None if one of them changes a
+           qdisc or class we can't change via netlink (hfsc, red)"""
+        msgs = []
+        for cmd in cmds:
+            kind = cls._layoutRegex.match( cmd ).group( 1 )
+            if kind == 'netem':
+                msgs.append( NetlinkSocket.netemMsg(
+                    index, tcHandle( '10:' ),
+                    delay=cls.usec( shape[ 'delay' ] ),
+                    jitter=cls.usec( shape[ 'jitter' ] ),
+                    loss=shape[ 'loss' ] or 0,
+                    limit=shape[ 'max_queue_size' ] or 1000 ) )
+            elif kind == 'htb' and ' class ' in cmd:
+                rate = float( cls._rateRegex.search( cmd ).group( 1 ) )
+                sizes = cls.sizes( cmd )
+                msgs.append( NetlinkSocket.htbClassMsg(
+                    index, tcHandle( '5:1' ), tcHandle( '5:0' ),
+                    rate * 1e6 / 8, sizes[ 'burst' ],
+                    cburst=sizes.get( 'cburst' ),
+                    quantum=sizes.get( 'quantum', 0 ) ) )
+            elif kind == 'tbf':
+                rate = float( cls._rateRegex.search( cmd ).group( 1 ) )
+                latency = float( cls._latencyRegex.search( cmd ).group( 1 ) )
+                msgs.append( NetlinkSocket.tbfMsg(
+                    index, tcHandle( '5:' ), rate * 1e6 / 8,
+                    cls.sizes( cmd )[ 'burst' ], latency * 1e3 ) )
+            else:
+                return None
+        return msgs
+
+    def changeTC( self, cmds, shape, batch=None ):
+        """Internal method: send change commands for shape as one
+           netlink request if we can, else run them with tc"""
+        try:
+            msgs = None if batch else self.changeMsgs( self.index(), cmds,
+                                                       shape )
+        except ( ValueError, NetlinkError ):
+            msgs = None
+        if msgs is None:
+            return TCIntf.changeTC( self, cmds, shape, batch=batch )
+        # One request: the first error is reported against the first
+        # command
+        return [ self.request( *msgs ) ] + [ '' ] * ( len( cmds ) - 1 )
+
+
+class NetlinkLink( Link ):
+    "Link with netlink-configured interfaces"
+    def __init__( self, *args, **kwargs ):
+        kwargs.setdefault( 'intf', NetlinkIntf )
+        Link.__init__( self, *args, **kwargs )
+
+
+class NetlinkTCLink( TCLink ):
+    "TCLink with netlink-configured interfaces"
+    def __init__( self, *args, **kwargs ):
+        kwargs.setdefault( 'cls1', NetlinkTCIntf )
+        kwargs.setdefault( 'cls2', NetlinkTCIntf )
+        TCLink.__init__( self, *args, **kwargs )
@@ -0,0 +1,199 @@
+import argparse, signal, socket, struct, sys, time
+from array import array
+
+# UDP probe stream for measuring how long traffic is black-holed while the
+# routing converges. Run the receiver and the sender inside the hosts:
+#   h2$ python3 probe.py recv --port 5001 --out probes.bin --duration 12
+#   (wait for it to print 'listening')
+#   h1$ python3 probe.py send 65.0.0.2 --port 5001 --rate 1000 --duration 10
+# Every probe carries a sequence number and its send time; the receiver
+# only records (seq, send time, receive time) and analysis happens later
+# with load()/analyze(). Times are time.monotonic_ns(), which is the same
+# clock in every network namespace, so one-way latency is exact and the
+# results can be lined up with scheduler.py's event log.
+
+# seq, send time (ns), in host byte order: both ends are on the same machine
+HEADER = struct.Struct('=QQ')
+
+
+def send(dst, port=5001, rate=1000, duration=10.0, size=64):
+    # send probes at rate per second for duration seconds
+    # returns (probes sent, monotonic ns of the first and the last one)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.connect((dst, port))
+    payload = bytearray(max(size, HEADER.size))
+    interval = 1e9 / rate
+    count = int(duration * rate)
+    start = time.monotonic_ns()
+    now = start
+    for seq in range(count):
+        # keep to an absolute schedule so that sleeping late doesn't slow the rate
+        due = start + seq * interval
+        if due > now:
+            time.sleep((due - now) / 1e9)
+        now = time.monotonic_ns()
+        HEADER.pack_into(payload, 0, seq, now)
+        try:
+            sock.send(payload)
+        except OSError:
+            # e.g. no route to host while routes are withdrawn: the probe is lost
+            pass
+    sock.close()
+    return count, start, now
+
+
+def receive(port=5001, duration=None, idle=None, ready=None):
+    # record probes until duration seconds have passed, until no probe came
+    # for idle seconds (once the first one arrived), or SIGTERM/SIGINT
+    # ready: called once the socket is bound, nothing sent before is seen
+    # returns array('Q') of (seq, send ns, receive ns) triples
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 << 20)
+    sock.bind(('', port))
+    if ready:
+        ready()
+    # the loop only copies the header and takes a timestamp per probe,
+    # everything else is done on whole arrays afterwards
+    headers = bytearray()
+    received = array('Q')
+    buf = bytearray(2048)
+    view = memoryview(buf)
+    now = time.monotonic_ns
+    end = now() + int(duration * 1e9) if duration else None
+    stop = []
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *args: stop.append(True))
+    while not stop:
+        timeout = idle if idle and received else 0.5
+        if end:
+            timeout = min(timeout, (end - now()) / 1e9)
+            if timeout <= 0:
+                break
+        sock.settimeout(timeout)
+        try:
+            n = sock.recv_into(buf)
+        except socket.timeout:
+            if idle and received:
+                break
+            continue
+        except InterruptedError:
+            continue
+        if n >= HEADER.size:
+            received.append(now())
+            headers += view[:HEADER.size]
+    sock.close()
+    probes = array('Q')
+    probes.frombytes(bytes(headers))
+    records = array('Q', bytes(len(received) * 24))
+    records[0::3] = probes[0::2]
+    records[1::3] = probes[1::2]
+    records[2::3] = received
+    return records
+
+
+def save(records, path):
+    with open(path, 'wb') as f:
+        records.tofile(f)
+
+
+def load(path):
+    # records written by 'probe.py recv --out'
+    records = array('Q')
+    with open(path, 'rb') as f:
+        records.frombytes(f.read())
+    return records
+
+
+def _percentile(values, p):
+    return values[min(int(len(values) * p), len(values) - 1)]
+
+
+def analyze(records, rate=None, sent=None):
+    # records: (seq, send ns, receive ns) triples in arrival order
+    # rate: probes per second, used to time losses at the end of the stream
+    # sent: number of probes sent, to catch losses after the last probe
+    # returns a dict with loss windows (monotonic ns start/end, probes lost
+    # and duration in ms), reordering and one-way latency in ms
+    seqs = records[0::3]
+    sent_ns = records[1::3]
+    recv_ns = records[2::3]
+    report = {'received': len(seqs), 'sent': sent, 'lost': 0, 'duplicates': 0,
+              'reordered': 0, 'windows': [], 'latency': None}
+    if not seqs:
+        return report
+    # reordering: probes arriving after a later one already did
+    highest = -1
+    seen = set()
+    for seq in seqs:
+        if seq in seen:
+            report['duplicates'] += 1
+            continue
+        seen.add(seq)
+        if seq < highest:
+            report['reordered'] += 1
+        else:
+            highest = seq
+    # loss windows: gaps in the sequence numbers, timed by the probes around them
+    by_seq = sorted(set(zip(seqs, sent_ns)))
+    interval = 1e9 / rate if rate else None
+    windows = []
+    if by_seq[0][0] > 0 and interval:
+        windows.append((by_seq[0][1] - by_seq[0][0] * interval, by_seq[0][1], by_seq[0][0]))
+    for (seq_a, ns_a), (seq_b, ns_b) in zip(by_seq, by_seq[1:]):
+        if seq_b > seq_a + 1:
+            windows.append((ns_a, ns_b, seq_b - seq_a - 1))
+    last_seq, last_ns = by_seq[-1]
+    if sent and last_seq < sent - 1 and interval:
+        windows.append((last_ns, last_ns + (sent - last_seq) * interval, sent - 1 - last_seq))
+    report['windows'] = [{'start': int(start), 'end': int(end), 'lost': lost,
+                          'duration_ms': (end - start) / 1e6} for start, end, lost in windows]
+    report['lost'] = sum(w['lost'] for w in report['windows'])
+    latencies = sorted((r - s) / 1e6 for s, r in zip(sent_ns, recv_ns))
+    report['latency'] = {'min': latencies[0], 'median': _percentile(latencies, 0.5),
+                         'p99': _percentile(latencies, 0.99), 'max': latencies[-1]}
+    return report
+
+
+def outages(report, failures):
+    # match loss windows to failures (monotonic seconds, e.g. the 'sent'
+    # times in scheduler.py's log): [(failure time, window or None)]
+    # the window is the first one that ends after the failure
+    matched = []
+    windows = sorted(report['windows'], key=lambda w: w['start'])
+    for t in sorted(failures):
+        t_ns = t * 1e9
+        window = next((w for w in windows if w['end'] >= t_ns), None)
+        matched.append((t, window))
+    return matched
+
+
+def main():
+    parser = argparse.ArgumentParser(description='UDP probe stream for measuring reroute outages')
+    sub = parser.add_subparsers(dest='mode', required=True)
+    s = sub.add_parser('send')
+    s.add_argument('dst')
+    s.add_argument('--port', type=int, default=5001)
+    s.add_argument('--rate', type=float, default=1000, help='probes per second')
+    s.add_argument('--duration', type=float, default=10.0, help='seconds')
+    s.add_argument('--size', type=int, default=64, help='bytes of UDP payload')
+    r = sub.add_parser('recv')
+    r.add_argument('--port', type=int, default=5001)
+    r.add_argument('--duration', type=float, help='stop after this many seconds')
+    r.add_argument('--idle', type=float, help='stop after this many seconds without probes '
+                   '(longer than any outage, or the outage ends the run)')
+    r.add_argument('--out', required=True, help='file to write the records to')
+    args = parser.parse_args()
+    if args.mode == 'send':
+        count, start, end = send(args.dst, args.port, args.rate, args.duration, args.size)
+        print('sent %d %d %d' % (count, start, end))
+    else:
+        # 'listening' tells whoever starts the sender that it can go ahead
+        records = receive(args.port, args.duration, args.idle,
+                          ready=lambda: print('listening', flush=True))
+        save(records, args.out)
+        print('received %d' % (len(records) // 3))
+    sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,368 @@
+import re, time
+from mininet.log import info, error, debug
+from link import TCIntf, TCBatch, NetlinkTCIntf
+from rtnl import (NetlinkSocket, EthtoolSocket, NetlinkError, RTM_NEWADDR, RTM_DELADDR,
+                  NLM_F_CREATE, NLM_F_REPLACE, TC_H_ROOT, TC_H_INGRESS, tcHandle)
+
+# Desired-state reconciliation of interface addresses, link state, offloads
+# and tc shaping across a whole network:
+#   stats = reconcile(desired_state(net))          # objects -> kernel
+#   stats = reconcile({intf: {'shape': dict(intf.shape, max_queue_size=50)}})
+# The desired state of an interface is a dict with any of
+#   'ip':      '10.0.0.1/24', the only IPv4 address it should have
+#   'up':      True or False
+#   'offload': {'gro': bool, 'txo': bool, 'rxo': bool} as in TCIntf.config()
+#   'shape':   TCIntf.config() shaping parameters, those left out keeping
+#              the interface's current ones ({} for no qdiscs at all)
+# and keys that are left out aren't looked at. Every namespace involved is
+# dumped over its netlink sockets (links, addresses, qdiscs, htb/hfsc
+# classes and ethtool features, no processes), the dumps are compared with
+# what the desired state would build, and only the differences are
+# applied: addresses, link state and htb/tbf/netem parameter changes as one
+# netlink request per node, everything else (offloads, red/hfsc/leaf qdisc
+# changes, qdisc chains that have to be rebuilt) as one TCBatch script per
+# node, all nodes in parallel. A network that already matches costs the
+# dumps and nothing else. Afterwards the interface objects hold the state
+# that was applied (ip, offload, shape), so config() and change() carry on
+# from there.
+
+# Relative difference up to which a dumped rate, size or time matches the
+# desired one (at least 1: a byte or a microsecond of rounding): the kernel
+# keeps bursts in scheduler ticks and tc rounds
+TOLERANCE = 0.01
+
+# (kind, option) -> absolute difference allowed instead: counts and packet
+# or byte limits are stored as given, netem loss (percent) as a fraction
+# of 2**32, i.e. to within 2.3e-8. (tbf's limit is tc's rounding of the
+# latency it was given, a size like any other)
+ABSOLUTE = {
+    ('netem', 'limit'): 0,
+    ('netem', 'loss'): 1e-6,
+    ('red', 'limit'): 0,
+    ('htb', 'default'): 0,
+    ('hfsc', 'default'): 0,
+}
+
+# TCIntf offload -> ethtool -K name, and the features it switches (any one
+# of them active counts as on)
+_OFFLOADS = {
+    'gro': ('gro', ('rx-gro',)),
+    'txo': ('tx', ('tx-checksum-ip-generic', 'tx-checksum-ipv4', 'tx-checksum-ipv6')),
+    'rxo': ('rx', ('rx-checksum',)),
+}
+
+# a shapeCmds() line: object, parent, handle, kind and its arguments
+_cmdRegex = re.compile(r'^%s (qdisc|class) add dev %s\s+(root|parent (\S+))\s+'
+                       r'(?:handle|classid) (\S+) (\S+)\s*(.*?)\s*$')
+
+_ROOT_MAJOR = TC_H_ROOT >> 16
+
+
+def network_intfs(net):
+    # every interface of a Mininet's nodes but loopback
+    return [intf for node in net.hosts + net.switches for intf in node.intfList()
+            if intf.name != 'lo']
+
+
+def desired_state(intfs):
+    # the state the interface objects describe: {intf: state}, from what
+    # config()/change()/setIP() last set. intfs: interfaces or a Mininet
+    if hasattr(intfs, 'hosts'):
+        intfs = network_intfs(intfs)
+    desired = {}
+    for intf in intfs:
+        state = {}
+        if intf.ip:
+            state['ip'] = '%s/%s' % (intf.ip, intf.prefixLen)
+        if isinstance(intf, TCIntf):
+            if intf.offload:
+                state['offload'] = dict(intf.offload)
+            if intf.shape is not None:
+                state['shape'] = dict(intf.shape)
+        desired[intf] = state
+    return desired
+
+
+def _netem_args(args):
+    # 'delay 5ms 1ms loss 0.1 limit 50' -> netem options as dumped
+    tokens, options = args.split(), {'delay': 0, 'jitter': 0, 'loss': 0, 'limit': 1000}
+    i = 0
+    while i < len(tokens):
+        word = tokens[i]
+        if word == 'delay':
+            options['delay'] = NetlinkTCIntf.usec(tokens[i + 1])
+            i += 1
+            if i + 1 < len(tokens) and tokens[i + 1][0].isdigit():
+                options['jitter'] = NetlinkTCIntf.usec(tokens[i + 1])
+                i += 1
+        elif word == 'loss':
+            options['loss'] = float(tokens[i + 1].rstrip('%'))
+            i += 1
+        elif word == 'limit':
+            options['limit'] = int(tokens[i + 1])
+            i += 1
+        i += 1
+    return options
+
+
+def _mbit(args, key='rate'):
+    # bytes/s of the '<key> <x>Mbit' in args
+    return float(re.search(r'\b%s ([0-9.]+)[Mm]bit' % key, args).group(1)) * 1e6 / 8
+
+
+def _expected(cmd):
+    # what a shapeCmds() line should leave in the kernel:
+    # (key, kind, options to compare or None when we can't read them back)
+    m = _cmdRegex.match(cmd)
+    if not m:
+        raise ValueError('unexpected tc command %r' % cmd)
+    obj, _where, parent, handle, kind, args = m.groups()
+    handle = tcHandle(handle)
+    if obj == 'class':
+        key = ('class', handle, kind)
+    else:
+        key = ('qdisc', handle, tcHandle(parent) >> 16 if parent else _ROOT_MAJOR, kind)
+    if kind in ('htb', 'hfsc') and obj == 'qdisc':
+        options = {'default': int(args.split()[-1])}
+    elif kind == 'htb':
+        options = dict(NetlinkTCIntf.sizes(args), rate=_mbit(args))
+    elif kind == 'hfsc':
+        options = {'fsc': _mbit(args), 'usc': _mbit(args, 'ul rate')}
+    elif kind == 'tbf':
+        rate, burst = _mbit(args), NetlinkTCIntf.sizes(args)['burst']
+        latency = NetlinkTCIntf.usec(re.search(r'latency (\S+)', args).group(1))
+        options = {'rate': rate, 'burst': burst, 'limit': int(rate * latency / 1e6 + burst)}
+    elif kind == 'netem':
+        options = _netem_args(args)
+    elif kind == 'red':
+        words = args.split()
+        options = {'limit': int(words[words.index('limit') + 1]),
+                   'min': int(words[words.index('min') + 1]),
+                   'max': int(words[words.index('max') + 1]), 'ecn': 'ecn' in words}
+    else:
+        options = None
+    return key, kind, options
+
+
+def _matches(want, have, kind=None):
+    # whether dumped options of a kind of qdisc/class have the wanted
+    # values, up to their ABSOLUTE tolerance or else TOLERANCE
+    for name, value in want.items():
+        got = have.get(name)
+        if got is None:
+            return False
+        if isinstance(value, bool):
+            if value != got:
+                return False
+            continue
+        tolerance = ABSOLUTE.get((kind, name))
+        if tolerance is None:
+            tolerance = max(TOLERANCE * abs(value), 1)
+        if abs(value - got) > tolerance:
+            return False
+    return True
+
+
+def _dump(node, names, offloads):
+    # the actual state of node's interfaces in names: {name: state} with
+    # index, up, ips, qdiscs and classes ({key: options}) and features
+    # (None: unknown); offloads: whether to read ethtool features
+    nl = NetlinkSocket.forNode(node)
+    links = {link['index']: link for link in nl.links() if link['name'] in names}
+    actual = {}
+    for index, link in links.items():
+        actual[link['name']] = {'index': index, 'up': link['up'], 'ips': set(),
+                                'qdiscs': {}, 'classes': {}, 'features': None}
+    for addr in nl.addrs():
+        if addr['index'] in links and 'ip' in addr:
+            actual[links[addr['index']]['name']]['ips'].add(
+                '%s/%d' % (addr['ip'], addr['prefixLen']))
+    classful = set()
+    for q in nl.qdiscs():
+        # handle 0 is the kernel's default qdisc, ingress isn't ours
+        if q['index'] not in links or not q['handle'] or q['parent'] == TC_H_INGRESS:
+            continue
+        key = ('qdisc', q['handle'], q['parent'] >> 16, q['kind'])
+        actual[links[q['index']]['name']]['qdiscs'][key] = q['options']
+        if q['kind'] in ('htb', 'hfsc'):
+            classful.add(q['index'])
+    for index in classful:
+        for c in nl.classes(index):
+            if c['kind'] in ('htb', 'hfsc'):
+                actual[links[index]['name']]['classes'][('class', c['handle'], c['kind'])] = c['options']
+    if offloads:
+        try:
+            features = EthtoolSocket.forNode(node).features(sorted(actual))
+        except (NetlinkError, OSError) as e:
+            debug('*** %s: no ethtool netlink (%s), setting offloads blindly\n' % (node, e))
+            features = {}
+        for name, state in actual.items():
+            state['features'] = features.get(name)
+    return actual
+
+
+class _Plan:
+    # what one interface needs: netlink requests, plain shell commands,
+    # tc command templates, and a readable line for each change
+    __slots__ = ('intf', 'msgs', 'cmds', 'tc', 'changes')
+
+    def __init__(self, intf):
+        self.intf = intf
+        self.msgs, self.cmds, self.tc, self.changes = [], [], [], []
+
+
+def _plan_addr(plan, want, have):
+    intf = plan.intf
+    if 'ip' in want and want['ip'] and have['ips'] != {want['ip']}:
+        ip, prefix_len = want['ip'].split('/')
+        for old in sorted(have['ips'] - {want['ip']}):
+            old_ip, old_len = old.split('/')
+            plan.msgs.append(NetlinkSocket.addrMsg(RTM_DELADDR, have['index'], old_ip, int(old_len)))
+        plan.msgs.append(NetlinkSocket.addrMsg(RTM_NEWADDR, have['index'], ip, int(prefix_len),
+                                               NLM_F_CREATE | NLM_F_REPLACE))
+        plan.changes.append('ip %s on %s' % (want['ip'], intf))
+    if want.get('up') is not None and want['up'] != have['up']:
+        plan.msgs.append(NetlinkSocket.setLinkMsg(have['index'], up=want['up']))
+        plan.changes.append('%s %s' % (intf, 'up' if want['up'] else 'down'))
+
+
+def _plan_offload(plan, want, have):
+    offload, features = want.get('offload'), have['features']
+    if not offload:
+        return
+    args = []
+    for key in ('gro', 'txo', 'rxo'):
+        if key not in offload:
+            continue
+        name, names = _OFFLOADS[key]
+        if features is None or bool(features & set(names)) != bool(offload[key]):
+            args.append('%s %s' % (name, 'on' if offload[key] else 'off'))
+    if args:
+        cmd = 'ethtool -K %s %s' % (plan.intf, ' '.join(args))
+        plan.cmds.append(cmd)
+        plan.changes.append(cmd)
+
+
+def _plan_shape(plan, want, have):
+    intf, shape = plan.intf, want.get('shape')
+    if shape is None or not isinstance(intf, TCIntf):
+        return None
+    shape = dict(intf.shape or {}, **shape) if shape else {}
+    cmds = intf.shapeCmds(**shape)[0] if shape else []
+    expected = [_expected(cmd) for cmd in cmds]
+    actual = dict(have['qdiscs'])
+    actual.update(have['classes'])
+    if set(key for key, _kind, _options in expected) != set(actual):
+        # a different chain: start over
+        if have['qdiscs']:
+            plan.tc.append('%s qdisc del dev %s root')
+        plan.tc += cmds
+        plan.changes.append('%s: rebuild qdiscs (%s)' % (
+            intf, ' '.join(kind for _key, kind, _options in expected) or 'none'))
+        return shape, cmds
+    installed = intf.shapeInstalled or []
+    for cmd, (key, kind, options) in zip(cmds, expected):
+        if options is None:
+            # (leaf qdiscs) we can only go by what we installed last
+            changed = cmd not in installed
+        else:
+            changed = not _matches(options, actual[key], kind)
+        if not changed:
+            continue
+        change = cmd.replace(' add ', ' change ', 1)
+        msgs = NetlinkTCIntf.changeMsgs(have['index'], [change], shape)
+        if msgs:
+            plan.msgs += msgs
+        else:
+            plan.tc.append(change)
+        plan.changes.append(change % ('tc', intf))
+    return shape, cmds
+
+
+def plan(desired):
+    # compare desired ({intf: state}) with the kernel: returns
+    # ([_Plan with changes], {intf: (shape, shape cmds)}, seconds dumping)
+    start = time.monotonic()
+    by_node = {}
+    for intf, want in desired.items():
+        by_node.setdefault(intf.node, []).append((intf, want))
+    plans, shapes = [], {}
+    for node, wants in by_node.items():
+        offloads = any(want.get('offload') for _intf, want in wants)
+        actual = _dump(node, set(intf.name for intf, _want in wants), offloads)
+        for intf, want in wants:
+            have = actual.get(intf.name)
+            if have is None:
+                error('*** %s: no interface %s, not reconciled\n' % (node, intf))
+                continue
+            p = _Plan(intf)
+            _plan_addr(p, want, have)
+            _plan_offload(p, want, have)
+            shaped = _plan_shape(p, want, have)
+            if shaped:
+                shapes[intf] = shaped
+            if p.changes:
+                plans.append(p)
+    return plans, shapes, time.monotonic() - start
+
+
+def reconcile(desired, dry_run=False):
+    # bring the kernel to desired ({intf: state}, see above, e.g. from
+    # desired_state()) and the interface objects along with it
+    # returns {'interfaces', 'changed' (interfaces), 'changes',
+    # 'netlink' (messages), 'commands' (shell/tc lines), 'failed' (netlink
+    # requests and commands), 'dump_s', 'apply_s', 'plan': {intf name: [change]}}
+    plans, shapes, dump_s = plan(desired)
+    stats = {'interfaces': len(desired), 'changed': len(plans),
+             'changes': sum(len(p.changes) for p in plans),
+             'netlink': sum(len(p.msgs) for p in plans),
+             'commands': sum(len(p.cmds) + len(p.tc) for p in plans),
+             'failed': 0, 'dump_s': dump_s, 'apply_s': 0.0,
+             'plan': {str(p.intf): p.changes for p in plans}}
+    if dry_run:
+        return stats
+    start = time.monotonic()
+    requests, batch = {}, TCBatch()
+    for p in plans:
+        if p.msgs:
+            requests.setdefault(p.intf.node, []).extend(p.msgs)
+        for cmd in p.cmds:
+            batch.addCmd(p.intf, cmd)
+        if p.tc:
+            batch.addTC(p.intf, p.tc)
+    failed = set()
+    for node, msgs in requests.items():
+        try:
+            NetlinkSocket.forNode(node).request(*msgs)
+        except NetlinkError as e:
+            stats['failed'] += 1
+            failed.add(node)
+            error('*** %s: reconciling failed: %s\n' % (node.name, e))
+    # an output per ethtool command and tc line, '' if it went through
+    for node, outputs in batch.flush().items():
+        errors = [output for output in outputs if output]
+        if errors:
+            stats['failed'] += len(errors)
+            failed.add(node)
+            error('*** %s: %d commands failed\n' % (node.name, len(errors)))
+    stats['apply_s'] = time.monotonic() - start
+    # the objects describe what we applied: nothing is known for sure about
+    # the interfaces we changed on a node that failed, so their objects stay
+    # as they were and the next reconcile() looks again
+    skip = set(p.intf for p in plans if p.intf.node in failed)
+    for intf, want in desired.items():
+        if intf in skip:
+            continue
+        if want.get('ip'):
+            intf.ip, intf.prefixLen = want['ip'].split('/')
+            intf.prefixLen = int(intf.prefixLen)
+        if want.get('offload') and isinstance(intf, TCIntf):
+            intf.offload = dict(intf.offload, **want['offload'])
+        if intf in shapes:
+            intf.shape, intf.shapeInstalled = shapes[intf]
+            intf.params.update((k, v) for k, v in intf.shape.items()
+                               if v is not None or k in intf.params)
+    if plans:
+        info('*** Reconciled %d changes on %d of %d interfaces in %.1f ms\n' % (
+            stats['changes'], len(plans), len(desired), (dump_s + stats['apply_s']) * 1e3))
+    return stats
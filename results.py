@@ -0,0 +1,443 @@
+import hashlib, json, os, re, time, uuid
+from array import array
+from bisect import bisect_left
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Append-only columnar store for experiment results, so that thousands of
+# runs can be compared without re-parsing text logs.
+#
+# <root>/<table>/meta.json    committed row count, column types, indexes
+# <root>/<table>/<col>.col    one fixed width value per row (int64,
+#                             float64, or int32 codes for strings)
+# <root>/<table>/<col>.dict   strings of a string column, one JSON per line,
+#                             line i is code i
+# <root>/<table>/<col>.idx    row ids sorted by value + where each value's
+#                             rows start, for the indexed columns
+#
+# Every row carries run_id, topo_hash and params (canonical JSON) plus one
+# param.<name> column per parameter; those columns are indexed. Appends
+# write the column files first and commit by rewriting meta.json, so a
+# reader never sees half a batch. Columns are read with numpy memmaps when
+# numpy is installed, array.array otherwise, and only the ones a query asks for.
+
+TYPES = {'int': 'q', 'float': 'd', 'str': 'i'}
+NULLS = {'int': -2 ** 63, 'float': float('nan'), 'str': -1}
+
+
+def new_run_id():
+    # sortable by start time: 20240101-120000-1a2b3c4d
+    return time.strftime('%Y%m%d-%H%M%S-') + uuid.uuid4().hex[:8]
+
+
+def topo_hash(topo, ignore=('conf_root',)):
+    # hash of a mininet Topo's nodes, links and their parameters
+    # ignore: node/link options that change from run to run (temp dirs)
+    def options(info):
+        return sorted((k, repr(v)) for k, v in info.items() if k not in ignore)
+    desc = {'nodes': sorted((n, options(topo.nodeInfo(n))) for n in topo.nodes()),
+            'links': sorted((src, dst, options(info))
+                            for src, dst, info in topo.links(withInfo=True))}
+    return hashlib.sha1(json.dumps(desc, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def _type_of(value):
+    if isinstance(value, bool) or isinstance(value, int):
+        return 'int'
+    if isinstance(value, float):
+        return 'float'
+    return 'str'
+
+
+class Table:
+
+    def __init__(self, path):
+        self.path = path
+        self.meta_path = os.path.join(path, 'meta.json')
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path) as f:
+                self.meta = json.load(f)
+        else:
+            os.makedirs(path, exist_ok=True)
+            self.meta = {'rows': 0, 'columns': {}, 'indexed': [], 'indexes': {}}
+        self.dicts = {}
+
+    @property
+    def rows(self):
+        return self.meta['rows']
+
+    @property
+    def columns(self):
+        return dict(self.meta['columns'])
+
+    def _file(self, name, ext):
+        return os.path.join(self.path, name + ext)
+
+    def _commit(self):
+        tmp = self.meta_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.meta, f)
+        os.replace(tmp, self.meta_path)
+
+    def _dict(self, name):
+        # (list of strings, {string: code}) of a string column
+        if name not in self.dicts:
+            strings = []
+            path = self._file(name, '.dict')
+            if os.path.exists(path):
+                with open(path) as f:
+                    strings = [json.loads(line) for line in f]
+            self.dicts[name] = (strings, {s: i for i, s in enumerate(strings)})
+        return self.dicts[name]
+
+    def _add_column(self, name, kind, indexed=False):
+        # new column: earlier rows get nulls
+        with open(self._file(name, '.col'), 'wb') as f:
+            array(TYPES[kind], [NULLS[kind]] * self.rows).tofile(f)
+        self.meta['columns'][name] = kind
+        if indexed:
+            self.meta['indexed'].append(name)
+
+    def _promote(self, name):
+        values = self.column(name)
+        null = NULLS['int']
+        with open(self._file(name, '.col'), 'wb') as f:
+            array('d', [NULLS['float'] if v == null else float(v) for v in values]).tofile(f)
+        self.meta['columns'][name] = 'float'
+        self.meta['indexes'].pop(name, None)
+
+    def append(self, rows, indexed=()):
+        # rows: list of {column: value}; missing values are stored as nulls
+        # indexed: names of new columns to index
+        # Every value is converted before anything is written, so a value
+        # that doesn't fit its column (ValueError) leaves the table as it was
+        if not rows:
+            return
+        columns = self.meta['columns']
+        kinds = dict(columns)
+        for row in rows:
+            for name, value in row.items():
+                if value is None:
+                    continue
+                if name not in kinds:
+                    kinds[name] = _type_of(value)
+                elif isinstance(value, float) and kinds[name] == 'int':
+                    # ints that turn out to be floats: the column becomes float
+                    kinds[name] = 'float'
+        converted = {}
+        for name, kind in kinds.items():
+            values = [row.get(name) for row in rows]
+            if kind != 'str':
+                null = NULLS[kind]
+                cast = float if kind == 'float' else int
+                for i, value in enumerate(values):
+                    if value is None:
+                        values[i] = null
+                        continue
+                    try:
+                        values[i] = cast(value)
+                        if kind == 'int' and not -2 ** 63 < values[i] < 2 ** 63:
+                            raise OverflowError
+                    except (TypeError, ValueError, OverflowError):
+                        raise ValueError('%s: %r in %s column %s' % (self.path, value, kind, name))
+            converted[name] = values
+        for name, kind in kinds.items():
+            if name not in columns:
+                self._add_column(name, kind, name in indexed)
+            elif kind != columns[name]:
+                self._promote(name)
+        for name, kind in columns.items():
+            values = converted[name]
+            if kind == 'str':
+                strings, codes = self._dict(name)
+                new = []
+                for i, value in enumerate(values):
+                    if value is None:
+                        values[i] = -1
+                        continue
+                    value = str(value)
+                    code = codes.get(value)
+                    if code is None:
+                        code = codes[value] = len(strings)
+                        strings.append(value)
+                        new.append(value)
+                    values[i] = code
+                if new:
+                    with open(self._file(name, '.dict'), 'a') as f:
+                        f.write(''.join(json.dumps(s) + '\n' for s in new))
+            with open(self._file(name, '.col'), 'ab') as f:
+                # a column file can be longer than meta's row count after a
+                # failed append: cut it back to the committed rows first
+                f.truncate(self.rows * array(TYPES[kind]).itemsize)
+                array(TYPES[kind], values).tofile(f)
+        self.meta['rows'] += len(rows)
+        self._commit()
+
+    def column(self, name, decode=True):
+        # values of column name for every row: a numpy array (memmap for
+        # numbers) or array.array; strings are decoded to a list unless
+        # decode=False, which returns the integer codes
+        kind = self.meta['columns'][name]
+        code = TYPES[kind]
+        n = self.rows
+        if np is not None:
+            values = np.memmap(self._file(name, '.col'), dtype=np.dtype(code), mode='r',
+                               shape=(n,)) if n else np.zeros(0, dtype=np.dtype(code))
+        else:
+            values = array(code)
+            with open(self._file(name, '.col'), 'rb') as f:
+                values.fromfile(f, n)
+        if kind == 'str' and decode:
+            strings = self._dict(name)[0]
+            return [strings[c] if c >= 0 else None for c in values]
+        return values
+
+    def _index(self, name):
+        # (rows sorted by code, start of every code's rows, distinct values)
+        # for a column, rebuilt when rows were added since it was written.
+        # Codes are the string codes, or positions in the distinct values
+        # for numbers; nulls are code -1 and come first
+        kind = self.meta['columns'][name]
+        value_code = 'd' if kind == 'float' else 'q'
+        path = self._file(name, '.idx')
+        if self.meta['indexes'].get(name) == self.rows and os.path.exists(path):
+            with open(path, 'rb') as f:
+                sizes = array('q')
+                sizes.fromfile(f, 3)
+                order, starts, values = array('q'), array('q'), array(value_code)
+                order.fromfile(f, sizes[0])
+                starts.fromfile(f, sizes[1])
+                values.fromfile(f, sizes[2])
+            return order, starts, values
+        codes = self.column(name, decode=False)
+        values = array(value_code)
+        if kind == 'str':
+            n_codes = len(self._dict(name)[0])
+        else:
+            null = NULLS[kind]
+            values.extend(sorted(set(v for v in codes if v == v and v != null)))
+            position = {v: i for i, v in enumerate(values)}
+            codes = [position.get(v, -1) for v in codes]
+            n_codes = len(values)
+        if np is not None:
+            codes = np.asarray(codes, dtype=np.int64)
+            order = np.argsort(codes, kind='stable')
+            starts = np.searchsorted(codes[order], np.arange(-1, n_codes + 1))
+            order, starts = array('q', order.tobytes()), array('q', starts.astype(np.int64).tobytes())
+        else:
+            order = array('q', sorted(range(len(codes)), key=codes.__getitem__))
+            sorted_codes = [codes[i] for i in order]
+            starts = array('q', [bisect_left(sorted_codes, c) for c in range(-1, n_codes + 1)])
+        with open(path, 'wb') as f:
+            array('q', [len(order), len(starts), len(values)]).tofile(f)
+            order.tofile(f)
+            starts.tofile(f)
+            values.tofile(f)
+        self.meta['indexes'][name] = self.rows
+        self._commit()
+        return order, starts, values
+
+    def lookup(self, name, value):
+        # row ids (sorted) where column name == value, through the index
+        order, starts, values = self._index(name)
+        if value is None:
+            code = -1
+        elif self.meta['columns'][name] == 'str':
+            code = self._dict(name)[1].get(str(value))
+        else:
+            i = bisect_left(values, value)
+            code = i if i < len(values) and values[i] == value else None
+        if code is None:
+            return []
+        # starts[0] is where the nulls (code -1) begin
+        return sorted(order[starts[code + 1]:starts[code + 2]])
+
+    def select(self, columns=None, where=None):
+        # columns: names to load (default: all), where: {column: value or
+        # list of values}; indexed columns are answered from their index,
+        # others by scanning that one column
+        # returns {column: list of values} for the matching rows
+        columns = list(columns or self.meta['columns'])
+        rows = None
+        for name, wanted in (where or {}).items():
+            if name not in self.meta['columns']:
+                return {c: [] for c in columns}
+            wanted = wanted if isinstance(wanted, (list, tuple, set)) else [wanted]
+            if name in self.meta['indexed']:
+                match = set()
+                for value in wanted:
+                    match.update(self.lookup(name, value))
+            else:
+                values = self.column(name)
+                wanted = set(wanted)
+                match = set(i for i, v in enumerate(values) if v in wanted)
+            rows = match if rows is None else rows & match
+        rows = sorted(rows) if rows is not None else None
+        result = {}
+        for name in columns:
+            kind = self.meta['columns'].get(name)
+            if kind is None:
+                result[name] = [None] * (len(rows) if rows is not None else self.rows)
+                continue
+            values = self.column(name)
+            values = [values[i] for i in rows] if rows is not None else list(values)
+            if kind == 'int':
+                values = [None if v == NULLS['int'] else int(v) for v in values]
+            elif kind == 'float':
+                values = [None if v != v else float(v) for v in values]
+            result[name] = values
+        return result
+
+
+class ResultStore:
+
+    def __init__(self, root):
+        self.root = root
+        self.tables = {}
+
+    def table(self, name):
+        if name not in self.tables:
+            self.tables[name] = Table(os.path.join(self.root, name))
+        return self.tables[name]
+
+    def append(self, table, rows, run_id, topo_hash=None, params=None):
+        # add rows to table, keyed by run_id, topology hash and parameters
+        params = params or {}
+        keys = {'run_id': run_id, 'topo_hash': topo_hash,
+                'params': json.dumps(params, sort_keys=True)}
+        keys.update(('param.' + k, v) for k, v in params.items())
+        indexed = set(keys)
+        self.table(table).append([dict(keys, **row) for row in rows], indexed=indexed)
+
+    def query(self, table, columns=None, **where):
+        # e.g. store.query('iperf', ['goodput', 'param.buffer'], topo_hash=h)
+        # parameter columns can also be given as param_<name>=value
+        where = {(k.replace('param_', 'param.', 1) if k.startswith('param_') else k): v
+                 for k, v in where.items()}
+        return self.table(table).select(columns, where)
+
+    def runs(self, table):
+        # run ids in table, in the order they were added
+        return list(dict.fromkeys(self.table(table).column('run_id')))
+
+
+# Parsers from the text logs the Parts write to rows
+
+_iperf_line = re.compile(r'^\[\s*(\w+)\]\s+([\d.]+)-\s*([\d.]+)\s+sec\s+([\d.]+)\s+(\w?)Bytes\s+'
+                         r'([\d.]+)\s+(\w?)bits/sec(?:\s+(\d+))?(?:\s+([\d.]+)\s+(\w?)Bytes)?'
+                         r'(?:\s+(sender|receiver))?')
+_scale = {'': 1, 'K': 1e3, 'M': 1e6, 'G': 1e9, 'T': 1e12}
+_byte_scale = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+
+
+def parse_iperf_text(text):
+    # iperf3 text output => one row per interval line (role: 'interval',
+    # 'sender' or 'receiver' for the summary lines)
+    rows = []
+    for line in text.splitlines():
+        m = _iperf_line.match(line.strip())
+        if not m or m.group(1) == 'ID':
+            continue
+        rows.append({
+            'stream': m.group(1),
+            'start': float(m.group(2)),
+            'end': float(m.group(3)),
+            'bytes': int(float(m.group(4)) * _byte_scale[m.group(5)]),
+            'bits_per_second': float(m.group(6)) * _scale[m.group(7)],
+            'retransmits': int(m.group(8)) if m.group(8) else None,
+            'cwnd': int(float(m.group(9)) * _byte_scale[m.group(10)]) if m.group(9) else None,
+            'role': m.group(11) or 'interval',
+        })
+    return rows
+
+
+def parse_iperf_json(output):
+    # 'iperf3 -J' output => (flow row, interval rows), see traffic.parse_iperf
+    from traffic import parse_iperf
+    result = parse_iperf(output)
+    intervals = result.pop('intervals', [])
+    return result, intervals
+
+
+def parse_route_table(text):
+    # 'route -n' output => one row per route
+    rows = []
+    for line in text.splitlines():
+        fields = line.split()
+        if len(fields) != 8 or not re.match(r'^[\d.]+$', fields[0]):
+            continue
+        rows.append({'destination': fields[0], 'gateway': fields[1], 'genmask': fields[2],
+                     'flags': fields[3], 'metric': int(fields[4]), 'iface': fields[7]})
+    return rows
+
+
+def parse_traceroute(text):
+    # traceroute output => one row per probe: hop, address (None for '*'), rtt in ms
+    rows = []
+    addr = None
+    for line in text.splitlines():
+        m = re.match(r'^\s*(\d+)\s+(.*)$', line)
+        if not m:
+            continue
+        hop = int(m.group(1))
+        addr = None
+        for token in re.findall(r'\*|[\d.]+ ms|\([\d.]+\)|[^\s()]+', m.group(2)):
+            if token == '*':
+                rows.append({'hop': hop, 'addr': None, 'rtt': None})
+            elif token.endswith(' ms'):
+                rows.append({'hop': hop, 'addr': addr, 'rtt': float(token[:-3])})
+            elif token.startswith('('):
+                addr = token[1:-1]
+            elif re.match(r'^\d+\.\d+\.\d+\.\d+$', token):
+                addr = token
+            elif token != 'ms':
+                # a host name; the address in brackets follows
+                addr = token
+    return rows
+
+
+def import_logs(store, log_dir, run_id, topo_hash=None, params=None):
+    # parse the logs a Part wrote into log_dir and add them to store:
+    # <node>-routing-table.txt => 'routes', traceroute-<src>-<dst>[-<n>].txt
+    # => 'traceroute', client_iperf_<label>.txt and iperf_<label>-<src>-<dst>-<port>.json
+    # (traffic.run_flows) => 'iperf' and 'iperf_intervals'
+    # returns {table: rows added}
+    added = {}
+
+    def add(table, rows):
+        if rows:
+            store.append(table, rows, run_id, topo_hash, params)
+            added[table] = added.get(table, 0) + len(rows)
+
+    for name in sorted(os.listdir(log_dir)):
+        path = os.path.join(log_dir, name)
+        m = re.match(r'^(.+)-routing-table\.txt$', name)
+        if m:
+            with open(path) as f:
+                add('routes', [dict(row, node=m.group(1)) for row in parse_route_table(f.read())])
+            continue
+        m = re.match(r'^traceroute-([^-]+)-([^-]+?)(?:-(\d+))?\.txt$', name)
+        if m:
+            with open(path) as f:
+                add('traceroute', [dict(row, src=m.group(1), dst=m.group(2), attempt=int(m.group(3) or 1))
+                                   for row in parse_traceroute(f.read())])
+            continue
+        m = re.match(r'^client_iperf_(.+)\.txt$', name)
+        if m:
+            with open(path) as f:
+                add('iperf_text', [dict(row, label=m.group(1)) for row in parse_iperf_text(f.read())])
+            continue
+        m = re.match(r'^iperf_(.+)-([^-]+)-([^-]+)-(\d+)\.json$', name)
+        if m:
+            keys = {'label': m.group(1), 'src': m.group(2), 'dst': m.group(3), 'port': int(m.group(4))}
+            with open(path) as f:
+                try:
+                    flow, intervals = parse_iperf_json(f.read())
+                except ValueError:
+                    continue
+            add('iperf', [dict(flow, **keys)])
+            add('iperf_intervals', [dict(row, **keys) for row in intervals])
+    return added
@@ -0,0 +1,242 @@
+import os, multiprocessing
+from collections import Counter
+from addr import MASKS, parse_cidr, int_to_ip
+from link import runBatches, batchErrors
+from tracing import span
+
+# Static route compiler: computes shortest paths between all routers of a
+# topology and turns them into small per-node FIBs (a default route plus
+# aggregated prefixes) that can be installed with one 'ip -batch' per node.
+
+
+def topo_links(topo, intf_ip, host_ip):
+    # list of (node1, intf1, ip1, node2, intf2, ip2) for every link of a mininet Topo
+    # intf_ip: {'r1-eth0': '62.0.0.1/8', ...}, host_ip: {'h1': '62.0.0.2/8', ...}
+    links = []
+    for _src, _dst, info in topo.links(sort=True, withInfo=True):
+        ends = []
+        for n in ('1', '2'):
+            node = info['node' + n]
+            intf = info.get('intfName' + n) or '%s-eth%s' % (node, info['port' + n])
+            params = info.get('params' + n) or {}
+            ip = intf_ip.get(intf) or params.get('ip') or host_ip.get(node)
+            ends += [node, intf, ip]
+        links.append(tuple(ends))
+    return links
+
+
+def compile_fibs(links, hosts, ecmp=False, compress=True, processes=None):
+    # links: as returned by topo_links, hosts: names of the end hosts
+    # ecmp: keep every equal cost next hop instead of one
+    # compress: use a default route and aggregate prefixes
+    # processes: number of processes to compute FIBs in (default: one per cpu
+    # for topologies of 500 routers or more)
+    # returns {node: [(dst, [(next_hop_ip, dev), ...]), ...]}, dst being a cidr or 'default'
+    hosts = set(hosts)
+    routers = sorted(set(n for l in links for n in (l[0], l[3]) if n not in hosts))
+    index = {r: i for i, r in enumerate(routers)}
+    fibs = {n: [] for n in routers}
+
+    # adjacency between routers: nbrs[u] = [v, ...], hops[u] = [(ip of v, dev on u), ...]
+    nbrs = [[] for _ in routers]
+    hops = [[] for _ in routers]
+    # routers attached to every network
+    attached = {}
+    for node1, intf1, ip1, node2, intf2, ip2 in links:
+        if node1 in hosts or node2 in hosts:
+            host, gw = (node1, ip2) if node1 in hosts else (node2, ip1)
+            dev = intf1 if node1 in hosts else intf2
+            if gw is not None:
+                fibs[host] = [('default', [(gw.split("/")[0], dev)])]
+        for node, ip in ((node1, ip1), (node2, ip2)):
+            if node in index and ip is not None:
+                net, prefix_len = parse_cidr(ip)
+                attached.setdefault((net & MASKS[prefix_len], prefix_len), set()).add(index[node])
+        if node1 in index and node2 in index:
+            u, v = index[node1], index[node2]
+            nbrs[u].append(v)
+            hops[u].append((ip2.split("/")[0], intf1))
+            nbrs[v].append(u)
+            hops[v].append((ip1.split("/")[0], intf2))
+    # point-to-point networks (the common case) get a faster path below
+    p2p = [(net, min(rs), max(rs)) for net, rs in attached.items() if len(rs) == 2]
+    others = [(net, sorted(rs)) for net, rs in attached.items() if len(rs) != 2]
+
+    # every router's FIB is independent of the others, so big topologies
+    # are split across processes (forked, so they share the graph)
+    global _graph
+    _graph = (nbrs, hops, p2p, others, ecmp, compress)
+    if processes is None:
+        processes = os.cpu_count() if len(routers) >= 500 else 1
+    try:
+        if processes > 1:
+            chunks = [range(i, len(routers), processes) for i in range(processes)]
+            with multiprocessing.get_context('fork').Pool(processes) as pool:
+                results = pool.map(_router_fibs, chunks)
+            for chunk, chunk_fibs in zip(chunks, results):
+                for u, fib in zip(chunk, chunk_fibs):
+                    fibs[routers[u]] = fib
+        else:
+            for u, fib in enumerate(_router_fibs(range(len(routers)))):
+                fibs[routers[u]] = fib
+    finally:
+        _graph = None
+    return fibs
+
+
+# graph that _router_fibs works on, set by compile_fibs
+_graph = None
+
+
+def _router_fibs(us):
+    nbrs, hops, p2p, others, ecmp, compress = _graph
+    unreachable = len(nbrs)
+    fibs = []
+    for u in us:
+        dist, first_hops = _bfs(u, nbrs)
+        routes = {}
+        for net, a, b in p2p:
+            da, db = dist[a], dist[b]
+            if da == 0 or db == 0 or (da < 0 and db < 0):
+                continue
+            if db < 0 or 0 < da < db:
+                mask = first_hops[a]
+            elif da < 0 or db < da:
+                mask = first_hops[b]
+            else:
+                mask = first_hops[a] | first_hops[b]
+            # without ecmp: lowest numbered neighbour, deterministically
+            routes[net] = mask if ecmp else mask & -mask
+        for net, rs in others:
+            if u in rs:
+                continue
+            d = min(dist[r] if dist[r] >= 0 else unreachable for r in rs)
+            if d == unreachable:
+                continue
+            mask = 0
+            for r in rs:
+                if dist[r] == d:
+                    mask |= first_hops[r]
+            routes[net] = mask if ecmp else mask & -mask
+        if compress:
+            routes = _compress(routes)
+        fibs.append([(dst if dst == 'default' else int_to_ip(dst[0]) + "/" + str(dst[1]),
+                      [hops[u][i] for i in _bits(mask)])
+                     for dst, mask in sorted(routes.items(), key=_route_order)])
+    return fibs
+
+
+def compile_routes(topo, intf_ip, host_ip, ecmp=False, compress=True, processes=None):
+    # compile FIBs straight from a mininet Topo and its address maps
+    with span('compile routes'):
+        return compile_fibs(topo_links(topo, intf_ip, host_ip), host_ip.keys(),
+                            ecmp=ecmp, compress=compress, processes=processes)
+
+
+def _bfs(u, nbrs):
+    # hop counts from u, and for every node the set of u's neighbour indexes
+    # (as a bitmask) that start a shortest path to it
+    dist = [-1] * len(nbrs)
+    first_hops = [0] * len(nbrs)
+    dist[u] = 0
+    frontier = []
+    for i, v in enumerate(nbrs[u]):
+        if dist[v] == -1:
+            dist[v] = 1
+            frontier.append(v)
+        if dist[v] == 1:
+            first_hops[v] |= 1 << i
+    while frontier:
+        next_frontier = []
+        for x in frontier:
+            d = dist[x] + 1
+            f = first_hops[x]
+            for y in nbrs[x]:
+                dy = dist[y]
+                if dy == -1:
+                    dist[y] = d
+                    first_hops[y] = f
+                    next_frontier.append(y)
+                elif dy == d:
+                    first_hops[y] |= f
+        frontier = next_frontier
+    return dist, first_hops
+
+
+def _bits(mask):
+    i = 0
+    while mask:
+        if mask & 1:
+            yield i
+        mask >>= 1
+        i += 1
+
+
+def _compress(routes):
+    # routes: {(net, prefix_len): next hop mask}
+    if not routes:
+        return routes
+    # 1. the most common next hops become the default route; their prefixes
+    # can go unless a shorter prefix via other next hops would catch them
+    default = Counter(routes.values()).most_common(1)[0][0]
+    others = {k: m for k, m in routes.items() if m != default}
+    compressed = _merge_siblings(others)
+    compressed['default'] = default
+    if others:
+        other_lens = sorted(set(k[1] for k in others))
+        for (net, prefix_len), mask in routes.items():
+            if mask == default and prefix_len > other_lens[0]:
+                if any((net & MASKS[p], p) in others for p in other_lens if p < prefix_len):
+                    compressed[(net, prefix_len)] = mask
+    return compressed
+
+
+def _merge_siblings(routes):
+    # 2. merge sibling prefixes with the same next hops into their parent
+    by_len = [[] for _ in range(33)]
+    for key in routes:
+        by_len[key[1]].append(key)
+    routes = dict(routes)
+    for prefix_len in range(32, 0, -1):
+        bit = 1 << (32 - prefix_len)
+        for key in by_len[prefix_len]:
+            net = key[0]
+            if net & bit:
+                continue
+            sibling = (net | bit, prefix_len)
+            mask = routes.get(key)
+            if mask is not None and routes.get(sibling) == mask:
+                parent = (net, prefix_len - 1)
+                if parent not in routes:
+                    del routes[key], routes[sibling]
+                    routes[parent] = mask
+                    by_len[prefix_len - 1].append(parent)
+    return routes
+
+
+def _route_order(route):
+    # default route last, then by address
+    dst = route[0]
+    return (1, 0, 0) if dst == 'default' else (0,) + dst
+
+
+def route_batch(fib):
+    # 'ip -batch' lines for one node's FIB
+    lines = []
+    for dst, next_hops in fib:
+        if len(next_hops) == 1:
+            lines.append('route add %s via %s dev %s' % (dst, next_hops[0][0], next_hops[0][1]))
+        else:
+            lines.append('route add %s %s' % (dst, ' '.join('nexthop via %s dev %s' % nh
+                                                         for nh in next_hops)))
+    return lines
+
+
+def install_routes(net, fibs):
+    # one 'ip -batch' per node, all nodes at once
+    # returns {node name: [error output per route]}
+    batches = {net[name]: route_batch(fib) for name, fib in fibs.items() if fib}
+    with span('install routes', nodes=len(batches)):
+        outputs = runBatches(batches, tool='ip')
+    return {node.name: batchErrors(output, len(batches[node]))[0]
+            for node, output in outputs.items()}
@@ -0,0 +1,769 @@
+"""
+rtnl.py: minimal rtnetlink client for configuring interfaces in
+mininet node namespaces without spawning processes
+
+A NetlinkSocket is a NETLINK_ROUTE socket that was opened inside a
+node's network namespace (we setns() into the namespace just long
+enough to create the socket), so everything we send through it
+applies to that namespace.
+
+Only what we need is implemented: reading links, IPv4 addresses and
+routes, setting link flags, MAC addresses and addresses, dumping and
+changing the parameters of existing qdiscs and classes (htb, tbf and
+netem), reading qdisc statistics, and reading interface offload
+features (ethtool netlink).
+"""
+
+import ctypes
+import ctypes.util
+import os
+import socket
+import struct
+import threading
+
+# pylint: disable=too-many-arguments
+
+NETLINK_ROUTE = 0
+NETLINK_GENERIC = 16
+CLONE_NEWNET = 0x40000000
+
+# Message types
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+RTM_NEWLINK = 16
+RTM_DELLINK = 17
+RTM_GETLINK = 18
+RTM_NEWADDR = 20
+RTM_DELADDR = 21
+RTM_GETADDR = 22
+RTM_NEWROUTE = 24
+RTM_DELROUTE = 25
+RTM_GETROUTE = 26
+RTM_NEWQDISC = 36
+RTM_GETQDISC = 38
+RTM_NEWTCLASS = 40
+RTM_GETTCLASS = 42
+
+# Message flags
+NLM_F_REQUEST = 0x1
+NLM_F_MULTI = 0x2
+NLM_F_ACK = 0x4
+NLM_F_DUMP = 0x300
+NLM_F_REPLACE = 0x100
+NLM_F_CREATE = 0x400
+
+# Multicast groups
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_ROUTE = 0x40
+
+# Link attributes and flags
+IFLA_ADDRESS = 1
+IFLA_IFNAME = 3
+IFLA_MTU = 4
+IFLA_OPERSTATE = 16
+IFF_UP = 0x1
+IFF_RUNNING = 0x40
+IFF_LOWER_UP = 0x10000
+
+# Address attributes
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+IFA_BROADCAST = 4
+
+# Route attributes and tables
+RTA_DST = 1
+RTA_OIF = 4
+RTA_GATEWAY = 5
+RTA_PRIORITY = 6
+RTA_MULTIPATH = 9
+RTA_TABLE = 15
+RT_TABLE_MAIN = 254
+
+# Traffic control attributes
+TCA_KIND = 1
+TCA_OPTIONS = 2
+TCA_STATS2 = 7
+TCA_STATS_BASIC = 1
+TCA_STATS_QUEUE = 3
+TC_H_ROOT = 0xFFFFFFFF
+TC_H_INGRESS = 0xFFFFFFF1
+TC_LINKLAYER_ETHERNET = 1
+TCA_HTB_PARMS = 1
+TCA_HTB_INIT = 2
+TCA_HTB_RATE64 = 6
+TCA_HTB_CEIL64 = 7
+TCA_TBF_PARMS = 1
+TCA_TBF_RATE64 = 4
+TCA_TBF_BURST = 6
+TCA_NETEM_LATENCY64 = 10
+TCA_NETEM_JITTER64 = 11
+TCA_RED_PARMS = 1
+TC_RED_ECN = 1
+TCA_HFSC_RSC = 1
+TCA_HFSC_FSC = 2
+TCA_HFSC_USC = 3
+
+# Generic netlink and its ethtool family
+GENL_ID_CTRL = 16
+CTRL_CMD_GETFAMILY = 3
+CTRL_ATTR_FAMILY_ID = 1
+CTRL_ATTR_FAMILY_NAME = 2
+NLA_F_NESTED = 0x8000
+ETHTOOL_MSG_FEATURES_GET = 11
+ETHTOOL_A_HEADER_DEV_NAME = 2
+ETHTOOL_A_FEATURES_HEADER = 1
+ETHTOOL_A_FEATURES_ACTIVE = 3
+ETHTOOL_A_BITSET_BITS = 3
+ETHTOOL_A_BITSET_BIT_NAME = 2
+
+_nlmsghdr = struct.Struct( '=LHHLL' )
+_ifinfomsg = struct.Struct( '=BxHiII' )
+_ifaddrmsg = struct.Struct( '=BBBBI' )
+_rtmsg = struct.Struct( '=BBBBBBBBI' )
+_rtattr = struct.Struct( '=HH' )
+_tcmsg = struct.Struct( '=BxxxiIII' )
+_ratespec = struct.Struct( '=BBHhHI' )
+_u32 = struct.Struct( '=I' )
+_s64 = struct.Struct( '=q' )
+_genlmsghdr = struct.Struct( '=BBxx' )
+_gnetBasic = struct.Struct( '=QI' )
+_gnetQueue = struct.Struct( '=IIIII' )
+
+
+class NetlinkError( Exception ):
+    "Error reported by the kernel for a netlink request"
+
+    def __init__( self, errno, msg='' ):
+        self.errno = errno
+        Exception.__init__( self, '%s%s' % ( msg and msg + ': ',
+                                              os.strerror( errno ) ) )
+
+
+def _align( n ):
+    "Round n up to the netlink alignment (4 bytes)"
+    return ( n + 3 ) & ~3
+
+
+def attr( kind, data ):
+    "Pack a single rtattr"
+    if isinstance( data, str ):
+        data = data.encode() + b'\0'
+    length = _rtattr.size + len( data )
+    return ( _rtattr.pack( length, kind ) + data +
+             b'\0' * ( _align( length ) - length ) )
+
+
+def iterAttrs( data, offset=0 ):
+    "Yield ( type, raw bytes ) for a run of rtattrs, in order"
+    end = len( data )
+    while offset + _rtattr.size <= end:
+        length, kind = _rtattr.unpack_from( data, offset )
+        if length < _rtattr.size:
+            break
+        # Strip the nested/byteorder flag bits
+        yield kind & 0x3fff, data[ offset + _rtattr.size: offset + length ]
+        offset += _align( length )
+
+
+def parseAttrs( data, offset=0 ):
+    "Parse a run of rtattrs into { type: raw bytes }"
+    return dict( iterAttrs( data, offset ) )
+
+
+def macToBytes( mac ):
+    "'00:11:22:33:44:55' -> bytes"
+    return bytes( int( x, 16 ) for x in mac.split( ':' ) )
+
+
+def bytesToMac( data ):
+    "bytes -> '00:11:22:33:44:55'"
+    return ':'.join( '%02x' % b for b in bytearray( data ) )
+
+
+def _cstr( data ):
+    "NUL-terminated attribute -> str"
+    return data.split( b'\0', 1 )[ 0 ].decode()
+
+
+def tcHandle( handle ):
+    "'5:1' -> 0x50001, 'root' -> TC_H_ROOT (tc handles are hex)"
+    if handle == 'root':
+        return TC_H_ROOT
+    major, _, minor = handle.partition( ':' )
+    return ( int( major or '0', 16 ) << 16 ) | int( minor or '0', 16 )
+
+
+_tickInUsec = None
+
+
+def _ticksPerUsec():
+    "Kernel packet scheduler ticks per microsecond, from /proc/net/psched"
+    global _tickInUsec  # pylint: disable=global-statement
+    if _tickInUsec is None:
+        with open( '/proc/net/psched' ) as f:
+            t2us, us2t, clockRes = [ int( x, 16 )
+                                     for x in f.read().split()[ :3 ] ]
+        if clockRes == 1000000000:
+            t2us = us2t
+        _tickInUsec = float( t2us ) / us2t * clockRes / 1e6
+    return _tickInUsec
+
+
+def ticks( usec ):
+    """Microseconds -> kernel packet scheduler ticks, as tc computes
+       them (from whole microseconds)"""
+    return int( min( int( usec ) * _ticksPerUsec(), 0xFFFFFFFF ) )
+
+
+def usecs( tickCount ):
+    "Kernel packet scheduler ticks -> microseconds (inverse of ticks())"
+    return tickCount / _ticksPerUsec()
+
+
+def _rate( rate ):
+    """Bytes/s -> ( tc_ratespec, rate64 attribute data or None );
+       rates that don't fit the ratespec's 32 bits go in the attribute"""
+    rate = int( rate )
+    big = rate >= 0xFFFFFFFF
+    spec = _ratespec.pack( 0, TC_LINKLAYER_ETHERNET, 0, 0, 0,
+                           0xFFFFFFFF if big else rate )
+    return spec, struct.pack( '=Q', rate ) if big else None
+
+
+def _rateOf( spec, rate64=None ):
+    "Bytes/s from a packed tc_ratespec and optional rate64 attribute"
+    if rate64 is not None:
+        return struct.unpack( '=Q', rate64 )[ 0 ]
+    return _ratespec.unpack_from( spec )[ 5 ]
+
+
+def _size( tickCount, rate ):
+    "Bytes a shaper sends at rate (bytes/s) in tickCount ticks"
+    return int( round( usecs( tickCount ) * rate / 1e6 ) )
+
+
+def _htbOptions( data, isClass ):
+    "htb TCA_OPTIONS -> dict: default class, or class rates and sizes"
+    attrs = parseAttrs( data )
+    if not isClass:
+        if TCA_HTB_INIT not in attrs:
+            return {}
+        _version, _r2q, default, _debug, _direct = struct.unpack_from(
+            '=IIIII', attrs[ TCA_HTB_INIT ] )
+        return { 'default': default }
+    parms = attrs[ TCA_HTB_PARMS ]
+    rate = _rateOf( parms, attrs.get( TCA_HTB_RATE64 ) )
+    ceil = _rateOf( parms[ _ratespec.size: ], attrs.get( TCA_HTB_CEIL64 ) )
+    buf, cbuf, quantum, _level, prio = struct.unpack_from(
+        '=IIIII', parms, 2 * _ratespec.size )
+    return { 'rate': rate, 'ceil': ceil, 'burst': _size( buf, rate ),
+             'cburst': _size( cbuf, ceil ), 'quantum': quantum,
+             'prio': prio }
+
+
+def _tbfOptions( data, _isClass ):
+    "tbf TCA_OPTIONS -> dict: rate, burst and limit (bytes)"
+    attrs = parseAttrs( data )
+    parms = attrs[ TCA_TBF_PARMS ]
+    rate = _rateOf( parms, attrs.get( TCA_TBF_RATE64 ) )
+    limit, buf, _mtu = struct.unpack_from( '=III', parms,
+                                           2 * _ratespec.size )
+    return { 'rate': rate, 'burst': _size( buf, rate ), 'limit': limit }
+
+
+def _netemOptions( data, _isClass ):
+    """netem TCA_OPTIONS -> dict: delay and jitter (microseconds),
+       loss (percent) and limit (packets)"""
+    latency, limit, loss, _gap, _duplicate, jitter = struct.unpack_from(
+        '=IIIIII', data )
+    options = { 'delay': usecs( latency ), 'jitter': usecs( jitter ),
+                'loss': loss * 100.0 / 0xFFFFFFFF, 'limit': limit }
+    attrs = parseAttrs( data, 24 )
+    for kind, name in ( ( TCA_NETEM_LATENCY64, 'delay' ),
+                        ( TCA_NETEM_JITTER64, 'jitter' ) ):
+        if kind in attrs:
+            options[ name ] = _s64.unpack( attrs[ kind ] )[ 0 ] / 1e3
+    return options
+
+
+def _redOptions( data, _isClass ):
+    "red TCA_OPTIONS -> dict: limit, min and max (bytes), ecn"
+    parms = parseAttrs( data )[ TCA_RED_PARMS ]
+    limit, qthMin, qthMax, _wlog, _plog, _scell, flags = struct.unpack_from(
+        '=IIIBBBB', parms )
+    return { 'limit': limit, 'min': qthMin, 'max': qthMax,
+             'ecn': bool( flags & TC_RED_ECN ) }
+
+
+def _hfscOptions( data, isClass ):
+    """hfsc TCA_OPTIONS -> dict: default class, or the class's service
+       curves' rates (bytes/s)"""
+    if not isClass:
+        return { 'default': struct.unpack_from( '=H', data )[ 0 ] }
+    attrs = parseAttrs( data )
+    options = {}
+    for kind, name in ( ( TCA_HFSC_RSC, 'rsc' ), ( TCA_HFSC_FSC, 'fsc' ),
+                        ( TCA_HFSC_USC, 'usc' ) ):
+        if kind in attrs:
+            _m1, _d, m2 = struct.unpack_from( '=III', attrs[ kind ] )
+            options[ name ] = m2
+    return options
+
+
+def _tcStats( data ):
+    """TCA_STATS2 -> ( bytes, packets, drops, overlimits, requeues,
+       backlog bytes, backlog packets )"""
+    nbytes = packets = qlen = backlog = drops = requeues = overlimits = 0
+    for kind, value in iterAttrs( data ):
+        if kind == TCA_STATS_BASIC:
+            nbytes, packets = _gnetBasic.unpack_from( value )
+        elif kind == TCA_STATS_QUEUE:
+            qlen, backlog, drops, requeues, overlimits = (
+                _gnetQueue.unpack_from( value ) )
+    return nbytes, packets, drops, overlimits, requeues, backlog, qlen
+
+
+# kind -> parser for the TCA_OPTIONS of the qdiscs and classes we build
+_tcOptions = { 'htb': _htbOptions, 'tbf': _tbfOptions,
+               'netem': _netemOptions, 'red': _redOptions,
+               'hfsc': _hfscOptions }
+
+
+_libc = None
+
+
+def setns( fd, nstype=CLONE_NEWNET ):
+    "Move the calling thread into the namespace referred to by fd"
+    if hasattr( os, 'setns' ):
+        os.setns( fd, nstype )  # pylint: disable=no-member
+        return
+    global _libc  # pylint: disable=global-statement
+    if _libc is None:
+        _libc = ctypes.CDLL( ctypes.util.find_library( 'c' ),
+                             use_errno=True )
+    if _libc.setns( fd, nstype ) != 0:
+        errno = ctypes.get_errno()
+        raise OSError( errno, os.strerror( errno ) )
+
+
+def socketInNamespace( pid, family=socket.AF_NETLINK,
+                       kind=socket.SOCK_RAW, proto=NETLINK_ROUTE ):
+    """Create a socket inside the network namespace of process pid.
+       Sockets stay in the namespace they were created in, so we
+       only have to switch this thread's namespace for the call."""
+    if pid is None:
+        return socket.socket( family, kind, proto )
+    home = os.open( '/proc/thread-self/ns/net', os.O_RDONLY )
+    try:
+        target = os.open( '/proc/%d/ns/net' % pid, os.O_RDONLY )
+        try:
+            setns( target )
+            try:
+                return socket.socket( family, kind, proto )
+            finally:
+                setns( home )
+        finally:
+            os.close( target )
+    finally:
+        os.close( home )
+
+
+class NetlinkSocket( object ):
+    "NETLINK_ROUTE socket in a node's namespace"
+
+    # pid -> NetlinkSocket, so that each namespace gets one socket
+    _sockets = {}
+    _socketsLock = threading.Lock()
+
+    # Netlink protocol we speak
+    proto = NETLINK_ROUTE
+
+    def __init__( self, pid=None, groups=0, timeout=None ):
+        """pid: process whose namespace we talk to (None: our own)
+           groups: multicast groups to subscribe to (for monitors)
+           timeout: socket timeout in seconds (None: block)"""
+        self.pid = pid
+        self.sock = socketInNamespace( pid, proto=self.proto )
+        self.sock.bind( ( 0, groups ) )
+        self.sock.settimeout( timeout )
+        self.seq = 0
+        self.lock = threading.Lock()
+
+    @classmethod
+    def forNode( cls, node ):
+        "Return the shared socket for node's namespace"
+        pid = node.pid if getattr( node, 'inNamespace', True ) else None
+        with cls._socketsLock:
+            sock = cls._sockets.get( pid )
+            if sock is None:
+                sock = cls._sockets[ pid ] = cls( pid )
+        return sock
+
+    @classmethod
+    def closeNode( cls, node ):
+        "Close the shared socket for node's namespace, if any"
+        with cls._socketsLock:
+            sock = cls._sockets.pop( getattr( node, 'pid', None ), None )
+        if sock:
+            sock.close()
+
+    def close( self ):
+        "Close our socket"
+        self.sock.close()
+
+    def fileno( self ):
+        "Allow select() on us"
+        return self.sock.fileno()
+
+    def _message( self, kind, flags, payload ):
+        "Return ( seq, packed message )"
+        self.seq += 1
+        return self.seq, ( _nlmsghdr.pack( _nlmsghdr.size + len( payload ),
+                                           kind, flags, self.seq, 0 ) +
+                           payload )
+
+    def messages( self, data ):
+        "Parse a datagram into ( type, flags, seq, payload ) tuples"
+        offset = 0
+        while offset + _nlmsghdr.size <= len( data ):
+            length, kind, flags, seq, _pid = _nlmsghdr.unpack_from(
+                data, offset )
+            if length < _nlmsghdr.size:
+                break
+            yield kind, flags, seq, data[ offset + _nlmsghdr.size:
+                                          offset + length ]
+            offset += _align( length )
+
+    def receive( self ):
+        """Block for the next datagram (e.g. a multicast event);
+           return its ( type, payload ) messages"""
+        return [ ( kind, payload ) for kind, _flags, _seq, payload
+                 in self.messages( self.sock.recv( 65536 ) ) ]
+
+    def request( self, *msgs ):
+        """Send ( type, flags, payload ) requests in one datagram
+           and wait for all of them to complete.
+           returns: list of reply payloads (of any type) per request
+           raises NetlinkError for the first failed request"""
+        with self.lock:
+            seqs, data = {}, b''
+            for kind, flags, payload in msgs:
+                # Ask for an ack on everything but dumps, so that we
+                # always know when a request is finished
+                if not ( kind % 4 == 2 and flags & NLM_F_DUMP ):
+                    flags |= NLM_F_ACK
+                seq, msg = self._message( kind, flags | NLM_F_REQUEST,
+                                          payload )
+                seqs[ seq ] = len( seqs )
+                data += msg
+            self.sock.send( data )
+            replies = [ [] for _ in msgs ]
+            pending, err = set( seqs ), None
+            while pending:
+                for kind, _flags, seq, payload in self.messages(
+                        self.sock.recv( 65536 ) ):
+                    if seq not in seqs:
+                        continue
+                    if kind == NLMSG_ERROR:
+                        errno = -struct.unpack_from( '=i', payload )[ 0 ]
+                        if errno and err is None:
+                            err = NetlinkError( errno )
+                        pending.discard( seq )
+                    elif kind == NLMSG_DONE:
+                        pending.discard( seq )
+                    else:
+                        replies[ seqs[ seq ] ].append( ( kind, payload ) )
+            if err:
+                raise err
+            return replies
+
+    # Links
+
+    @staticmethod
+    def parseLink( payload ):
+        "RTM_NEWLINK payload -> dict"
+        _family, _type, index, flags, _change = _ifinfomsg.unpack_from(
+            payload )
+        attrs = parseAttrs( payload, _ifinfomsg.size )
+        link = { 'index': index, 'flags': flags,
+                 'up': bool( flags & IFF_UP ),
+                 'name': _cstr( attrs.get( IFLA_IFNAME, b'' ) ) }
+        if IFLA_ADDRESS in attrs:
+            link[ 'mac' ] = bytesToMac( attrs[ IFLA_ADDRESS ] )
+        if IFLA_MTU in attrs:
+            link[ 'mtu' ] = struct.unpack( '=I', attrs[ IFLA_MTU ] )[ 0 ]
+        return link
+
+    def links( self ):
+        "Return a list of link dicts for every interface"
+        payload = _ifinfomsg.pack( socket.AF_UNSPEC, 0, 0, 0, 0 )
+        replies, = self.request( ( RTM_GETLINK, NLM_F_DUMP, payload ) )
+        return [ self.parseLink( p ) for kind, p in replies
+                 if kind == RTM_NEWLINK ]
+
+    def link( self, name ):
+        "Return the link dict for interface name"
+        payload = ( _ifinfomsg.pack( socket.AF_UNSPEC, 0, 0, 0, 0 ) +
+                    attr( IFLA_IFNAME, name ) )
+        replies, = self.request( ( RTM_GETLINK, 0, payload ) )
+        return self.parseLink( replies[ 0 ][ 1 ] )
+
+    @staticmethod
+    def setLinkMsg( index, up=None, mac=None ):
+        "Return a ( type, flags, payload ) request to change a link"
+        change = flags = 0
+        if up is not None:
+            change, flags = IFF_UP, IFF_UP if up else 0
+        payload = _ifinfomsg.pack( socket.AF_UNSPEC, 0, index,
+                                   flags, change )
+        if mac is not None:
+            payload += attr( IFLA_ADDRESS, macToBytes( mac ) )
+        return RTM_NEWLINK, 0, payload
+
+    def setLink( self, index, up=None, mac=None ):
+        "Set link state and/or MAC address"
+        self.request( self.setLinkMsg( index, up=up, mac=mac ) )
+
+    # Addresses
+
+    @staticmethod
+    def parseAddr( payload ):
+        "RTM_NEWADDR payload -> dict"
+        family, prefixLen, _flags, _scope, index = _ifaddrmsg.unpack_from(
+            payload )
+        attrs = parseAttrs( payload, _ifaddrmsg.size )
+        local = attrs.get( IFA_LOCAL, attrs.get( IFA_ADDRESS ) )
+        addr = { 'index': index, 'family': family,
+                 'prefixLen': prefixLen, 'raw': local }
+        if family == socket.AF_INET and local:
+            addr[ 'ip' ] = socket.inet_ntoa( local )
+        return addr
+
+    def addrs( self, index=None ):
+        "Return IPv4 address dicts, optionally only for one link"
+        payload = _ifaddrmsg.pack( socket.AF_INET, 0, 0, 0, 0 )
+        replies, = self.request( ( RTM_GETADDR, NLM_F_DUMP, payload ) )
+        addrs = [ self.parseAddr( p ) for kind, p in replies
+                  if kind == RTM_NEWADDR ]
+        if index is not None:
+            addrs = [ a for a in addrs if a[ 'index' ] == index ]
+        return addrs
+
+    @staticmethod
+    def addrMsg( kind, index, ip, prefixLen, flags=0 ):
+        "Return a ( type, flags, payload ) request for an IPv4 address"
+        local = socket.inet_aton( ip )
+        payload = ( _ifaddrmsg.pack( socket.AF_INET, prefixLen, 0, 0,
+                                     index ) +
+                    attr( IFA_LOCAL, local ) + attr( IFA_ADDRESS, local ) )
+        if kind == RTM_NEWADDR and prefixLen < 31:
+            host = ( 1 << ( 32 - prefixLen ) ) - 1
+            bcast = struct.unpack( '!I', local )[ 0 ] | host
+            payload += attr( IFA_BROADCAST, struct.pack( '!I', bcast ) )
+        return kind, flags, payload
+
+    def replaceAddr( self, index, ip, prefixLen, up=False ):
+        """Make ip/prefixLen the only IPv4 address on a link, like
+           'ifconfig intf ip/prefixLen [up]' does"""
+        msgs = [ self.addrMsg( RTM_DELADDR, index, a[ 'ip' ],
+                               a[ 'prefixLen' ] )
+                 for a in self.addrs( index ) if 'ip' in a ]
+        msgs.append( self.addrMsg( RTM_NEWADDR, index, ip, int( prefixLen ),
+                                   NLM_F_CREATE | NLM_F_REPLACE ) )
+        if up:
+            msgs.append( self.setLinkMsg( index, up=True ) )
+        self.request( *msgs )
+
+    # Routes
+
+    @staticmethod
+    def parseRoute( payload ):
+        "RTM_NEWROUTE/RTM_DELROUTE payload -> dict"
+        ( family, dstLen, _srcLen, _tos, table, protocol, scope, kind,
+          _flags ) = _rtmsg.unpack_from( payload )
+        attrs = parseAttrs( payload, _rtmsg.size )
+        if RTA_TABLE in attrs:
+            table = struct.unpack( '=I', attrs[ RTA_TABLE ] )[ 0 ]
+        route = { 'family': family, 'dstLen': dstLen, 'table': table,
+                  'protocol': protocol, 'scope': scope, 'type': kind }
+        if family == socket.AF_INET:
+            route[ 'dst' ] = ( socket.inet_ntoa( attrs[ RTA_DST ] )
+                               if RTA_DST in attrs else '0.0.0.0' )
+            if RTA_GATEWAY in attrs:
+                route[ 'gateway' ] = socket.inet_ntoa( attrs[ RTA_GATEWAY ] )
+        if RTA_OIF in attrs:
+            route[ 'oif' ] = struct.unpack( '=i', attrs[ RTA_OIF ] )[ 0 ]
+        if RTA_MULTIPATH in attrs:
+            route[ 'multipath' ] = True
+        return route
+
+    def routes( self, table=RT_TABLE_MAIN ):
+        "Return IPv4 route dicts for a routing table (None: all tables)"
+        payload = _rtmsg.pack( socket.AF_INET, 0, 0, 0, 0, 0, 0, 0, 0 )
+        replies, = self.request( ( RTM_GETROUTE, NLM_F_DUMP, payload ) )
+        routes = [ self.parseRoute( p ) for kind, p in replies
+                   if kind == RTM_NEWROUTE ]
+        if table is not None:
+            routes = [ r for r in routes if r[ 'table' ] == table ]
+        return routes
+
+    # Traffic control: dumps, and changes to qdiscs and classes that
+    # exist, i.e. no NLM_F_CREATE/NLM_F_REPLACE, which is what
+    # 'tc ... change' does
+
+    @staticmethod
+    def parseTC( payload, isClass=False ):
+        """RTM_NEWQDISC/RTM_NEWTCLASS payload -> dict with the index,
+           handle, parent, kind and the options we know how to parse"""
+        _family, index, handle, parent, _info = _tcmsg.unpack_from( payload )
+        attrs = parseAttrs( payload, _tcmsg.size )
+        tc = { 'index': index, 'handle': handle, 'parent': parent,
+               'kind': _cstr( attrs.get( TCA_KIND, b'' ) ), 'options': {} }
+        parse = _tcOptions.get( tc[ 'kind' ] )
+        if parse and TCA_OPTIONS in attrs:
+            tc[ 'options' ] = parse( attrs[ TCA_OPTIONS ], isClass )
+        return tc
+
+    def qdiscs( self, index=None ):
+        "Return qdisc dicts for every interface, or only for one link"
+        payload = _tcmsg.pack( socket.AF_UNSPEC, 0, 0, 0, 0 )
+        replies, = self.request( ( RTM_GETQDISC, NLM_F_DUMP, payload ) )
+        qdiscs = [ self.parseTC( p ) for kind, p in replies
+                   if kind == RTM_NEWQDISC ]
+        if index is not None:
+            qdiscs = [ q for q in qdiscs if q[ 'index' ] == index ]
+        return qdiscs
+
+    def qdiscStats( self ):
+        """Return ( index, handle, parent, kind, stats ) for every
+           qdisc, stats as from _tcStats(); options aren't parsed, to
+           keep frequent sampling cheap"""
+        payload = _tcmsg.pack( socket.AF_UNSPEC, 0, 0, 0, 0 )
+        replies, = self.request( ( RTM_GETQDISC, NLM_F_DUMP, payload ) )
+        qdiscs = []
+        for kind, p in replies:
+            if kind != RTM_NEWQDISC:
+                continue
+            _family, index, handle, parent, _info = _tcmsg.unpack_from( p )
+            attrs = parseAttrs( p, _tcmsg.size )
+            qdiscs.append( ( index, handle, parent,
+                             _cstr( attrs.get( TCA_KIND, b'' ) ),
+                             _tcStats( attrs.get( TCA_STATS2, b'' ) ) ) )
+        return qdiscs
+
+    def classes( self, index ):
+        "Return the class dicts of a link"
+        payload = _tcmsg.pack( socket.AF_UNSPEC, index, 0, 0, 0 )
+        replies, = self.request( ( RTM_GETTCLASS, NLM_F_DUMP, payload ) )
+        return [ self.parseTC( p, isClass=True ) for kind, p in replies
+                 if kind == RTM_NEWTCLASS ]
+
+    @staticmethod
+    def tcMsg( kind, index, handle, kindName, options, parent=0 ):
+        """Return a ( type, flags, payload ) request for a qdisc or class
+           kind: RTM_NEWQDISC or RTM_NEWTCLASS
+           handle, parent: numeric handles (see tcHandle()); qdiscs are
+             found by handle alone if parent is 0
+           kindName: 'htb', 'tbf', 'netem'...
+           options: packed TCA_OPTIONS payload"""
+        payload = ( _tcmsg.pack( socket.AF_UNSPEC, index, handle, parent, 0 ) +
+                    attr( TCA_KIND, kindName ) +
+                    attr( TCA_OPTIONS, options ) )
+        return kind, 0, payload
+
+    @classmethod
+    def netemMsg( cls, index, handle, delay=0, jitter=0, loss=0,
+                  limit=1000 ):
+        """Return a request changing netem qdisc handle
+           delay, jitter: microseconds; loss: percent; limit: packets
+           Like 'tc qdisc change', this resets anything not given."""
+        qopt = struct.pack( '=IIIIII', ticks( delay ), limit,
+                            int( round( loss / 100.0 * 0xFFFFFFFF ) ), 0, 0,
+                            ticks( jitter ) )
+        # netem's options are its struct followed by attributes; the
+        # 64 bit ones hold the exact delay and jitter in nanoseconds
+        latency, jitter = int( delay * 1e3 ), int( jitter * 1e3 )
+        options = ( qopt + attr( TCA_NETEM_LATENCY64, _s64.pack( latency ) ) +
+                    attr( TCA_NETEM_JITTER64, _s64.pack( jitter ) ) )
+        return cls.tcMsg( RTM_NEWQDISC, index, handle, 'netem', options )
+
+    @classmethod
+    def htbClassMsg( cls, index, classid, parent, rate, burst,
+                     cburst=None, quantum=0, mtu=1600 ):
+        """Return a request changing htb class classid
+           rate: bytes/s (the class's rate and ceil)
+           burst, cburst, quantum: bytes; the default cburst is tc's,
+             rate/HZ + mtu bytes, and quantum 0 lets the kernel pick"""
+        spec, rate64 = _rate( rate )
+        if cburst is None:
+            cburst = rate / 1e9 + mtu
+        hopt = ( spec + spec +
+                 struct.pack( '=IIIII', ticks( 1e6 * burst / rate ),
+                              ticks( 1e6 * cburst / rate ), quantum, 0,
+                              0 ) )
+        options = attr( TCA_HTB_PARMS, hopt )
+        if rate64:
+            options += ( attr( TCA_HTB_RATE64, rate64 ) +
+                         attr( TCA_HTB_CEIL64, rate64 ) )
+        return cls.tcMsg( RTM_NEWTCLASS, index, classid, 'htb', options,
+                          parent=parent )
+
+    @classmethod
+    def tbfMsg( cls, index, handle, rate, burst, latency ):
+        """Return a request changing tbf qdisc handle
+           rate: bytes/s; burst: bytes; latency: microseconds"""
+        spec, rate64 = _rate( rate )
+        limit = int( rate * latency / 1e6 + burst )
+        qopt = ( spec + _ratespec.pack( 0, 0, 0, 0, 0, 0 ) +
+                 struct.pack( '=III', limit, ticks( 1e6 * burst / rate ), 0 ) )
+        options = attr( TCA_TBF_PARMS, qopt ) + attr( TCA_TBF_BURST,
+                                                       _u32.pack( burst ) )
+        if rate64:
+            options += attr( TCA_TBF_RATE64, rate64 )
+        return cls.tcMsg( RTM_NEWQDISC, index, handle, 'tbf', options )
+
+
+class EthtoolSocket( NetlinkSocket ):
+    """Generic netlink socket for the ethtool family (Linux 5.6+) in a
+       node's namespace, for reading offload features without running
+       ethtool; raises NetlinkError( ENOENT ) if the kernel lacks it"""
+
+    proto = NETLINK_GENERIC
+    _sockets = {}
+
+    def __init__( self, pid=None, timeout=None ):
+        NetlinkSocket.__init__( self, pid, timeout=timeout )
+        payload = ( _genlmsghdr.pack( CTRL_CMD_GETFAMILY, 1 ) +
+                    attr( CTRL_ATTR_FAMILY_NAME, 'ethtool' ) )
+        try:
+            replies, = self.request( ( GENL_ID_CTRL, 0, payload ) )
+        except NetlinkError:
+            self.close()
+            raise
+        attrs = parseAttrs( replies[ 0 ][ 1 ], _genlmsghdr.size )
+        self.family = struct.unpack( '=H', attrs[ CTRL_ATTR_FAMILY_ID ] )[ 0 ]
+
+    def features( self, names ):
+        """Return { interface name: set of active feature names } for
+           the interfaces in names (one request, no dump)"""
+        msgs = []
+        for name in names:
+            header = attr( ETHTOOL_A_FEATURES_HEADER | NLA_F_NESTED,
+                           attr( ETHTOOL_A_HEADER_DEV_NAME, name ) )
+            msgs.append( ( self.family, 0,
+                           _genlmsghdr.pack( ETHTOOL_MSG_FEATURES_GET, 1 ) +
+                           header ) )
+        features = {}
+        for name, replies in zip( names, self.request( *msgs ) ):
+            for kind, p in replies:
+                if kind != self.family:
+                    continue
+                attrs = parseAttrs( p, _genlmsghdr.size )
+                bits = parseAttrs( attrs.get( ETHTOOL_A_FEATURES_ACTIVE,
+                                              b'' ) )
+                # A list of bits, each a nest holding the bit's name
+                features[ name ] = set(
+                    _cstr( parseAttrs( bit )[ ETHTOOL_A_BITSET_BIT_NAME ] )
+                    for _kind, bit in iterAttrs(
+                        bits.get( ETHTOOL_A_BITSET_BITS, b'' ) ) )
+        return features
@@ -0,0 +1,254 @@
+import time, select, json
+from collections import namedtuple, deque
+from mininet.log import info, error
+from rtnl import NetlinkSocket, NetlinkError
+
+# Failure injection scheduler: runs a timeline of link down/up, netem
+# (delay/loss) changes and node stops/starts against a running Mininet.
+# Events due at the same time are compiled ahead of time into one netlink
+# request (link state) and one shell command (tc, bird) per node. Netlink
+# requests are sent straight from the loop, no process is forked for them;
+# node shells are driven from the same loop with sendCmd/select, so
+# hundreds of links can change at once without a thread per event.
+# Times are in seconds from the start of the run; everything is logged with
+# time.monotonic() timestamps, which are the same in every namespace.
+
+# t: seconds from the start, action: 'down', 'up', 'netem', 'stop' or
+# 'start', target: (node1, node2) for link actions, a node name otherwise,
+# params: dict, netem settings (delay, jitter, loss) for 'netem'
+Event = namedtuple('Event', ['t', 'action', 'target', 'params'])
+
+LINK_ACTIONS = ('down', 'up', 'netem')
+NODE_ACTIONS = ('stop', 'start')
+
+
+def at(t, action, target, **params):
+    # a single event, e.g. at(10, 'down', ('r3', 'r4')) or
+    # at(15, 'netem', ('r2', 'r4'), delay='20ms', loss=1)
+    if action not in LINK_ACTIONS + NODE_ACTIONS:
+        raise ValueError('unknown action %s' % action)
+    return [Event(float(t), action, target, params)]
+
+
+def flap(target, start, end, period, down_time=None):
+    # take link target down every period seconds from start until end,
+    # bringing it back up after down_time seconds (default: half a period)
+    if down_time is None:
+        down_time = period / 2.0
+    if not 0 < down_time < period:
+        raise ValueError('down time must be shorter than the flap period')
+    events = []
+    t = float(start)
+    while t < end:
+        events.append(Event(t, 'down', target, {}))
+        events.append(Event(min(t + down_time, end), 'up', target, {}))
+        t += period
+    return events
+
+
+def timeline(*groups):
+    # merge lists of events (from at() and flap()) into one sorted timeline
+    return sorted((e for group in groups for e in group), key=lambda e: e.t)
+
+
+def _netem_args(params):
+    args = []
+    if params.get('delay') is not None:
+        args += ['delay', str(params['delay'])]
+        if params.get('jitter') is not None:
+            args.append(str(params['jitter']))
+    if params.get('loss') is not None:
+        args += ['loss', '%s%%' % params['loss']]
+    return ' '.join(args)
+
+
+class Scheduler:
+
+    def __init__(self, net, events):
+        # net: running Mininet, events: list of Event (see timeline())
+        self.net = net
+        self.events = sorted(events, key=lambda e: e.t)
+        self.log = []
+
+    def _link_intfs(self, target):
+        node1, node2 = self.net[target[0]], self.net[target[1]]
+        links = self.net.linksBetween(node1, node2)
+        if not links:
+            raise ValueError('no link between %s and %s' % target)
+        return [links[0].intf1, links[0].intf2]
+
+    def _index(self, intf):
+        # interface index, looked up once per node at compile time
+        node = intf.node
+        if node not in self.indexes:
+            self.indexes[node] = {link['name']: link['index']
+                                  for link in NetlinkSocket.forNode(node).links()}
+        return self.indexes[node][intf.name]
+
+    def _netem_cmds(self, intf, params):
+        # shell commands for a netem event on intf. A TCIntf is reshaped the
+        # way TCIntf.change() would: its qdiscs changed in place, or the
+        # whole chain (bw included) rebuilt if a netem stage comes or goes,
+        # so a shaped link keeps its rate. Each event starts from the shape
+        # the previous ones left, 'tc change' resets whatever it isn't told.
+        # A plain Intf gets a netem root qdisc restating every setting so far.
+        if intf not in self.shapes:
+            self.shapes[intf] = (getattr(intf, 'shape', None) or {},
+                                 getattr(intf, 'shapeInstalled', None) or [])
+        shape, installed = self.shapes[intf]
+        if hasattr(intf, 'reshapeCmds'):
+            shape, installed, cmds = intf.reshapeCmds(params, shape, installed)
+            self.shapes[intf] = (shape, installed)
+            return [cmd % ('tc', intf) for cmd in cmds]
+        shape = dict(shape, **params)
+        self.shapes[intf] = (shape, installed)
+        args = _netem_args(shape)
+        if not args:
+            return ['tc qdisc del dev %s root' % intf]
+        return ['tc qdisc replace dev %s root netem %s' % (intf, args)]
+
+    def _commands(self, event):
+        # [(node, netlink requests, shell commands, intfs to refresh)] for one event
+        if event.action in LINK_ACTIONS:
+            cmds = []
+            for intf in self._link_intfs(event.target):
+                if event.action == 'netem':
+                    cmds.append((intf.node, [], self._netem_cmds(intf, event.params), []))
+                else:
+                    msg = NetlinkSocket.setLinkMsg(self._index(intf), up=event.action == 'up')
+                    cmds.append((intf.node, [msg], [], [intf]))
+            return cmds
+        node = self.net[event.target]
+        intfs = [intf for intf in node.intfList() if intf.name != 'lo']
+        msgs = [NetlinkSocket.setLinkMsg(self._index(intf), up=event.action == 'start')
+                for intf in intfs]
+        shell = []
+        if hasattr(node, 'ctl_path'):
+            # BirdRouter/BirdHost: stop or restart the routing daemon too
+            if event.action == 'stop':
+                shell.append('birdc -s %s down >/dev/null' % node.ctl_path())
+            else:
+                shell.append('(cd %s && bird -l)' % node.conf_dir())
+        return [(node, msgs, shell, intfs)]
+
+    def compile(self):
+        # group events by time: [(t, [events], {node: (requests, commands, intfs)})]
+        self.indexes = {}
+        self.shapes = {}    # intf => (shape, installed commands) after the last netem event
+        batches = []
+        for event in self.events:
+            if not batches or batches[-1][0] != event.t:
+                batches.append((event.t, [], {}))
+            t, events, cmds = batches[-1]
+            events.append(event)
+            for node, msgs, shell, intfs in self._commands(event):
+                node_cmds = cmds.setdefault(node, ([], [], []))
+                node_cmds[0].extend(msgs)
+                node_cmds[1].extend(shell)
+                node_cmds[2].extend(intfs)
+        return batches
+
+    def run(self, start_delay=0.1):
+        # run the timeline, returns the event log (see write_log)
+        # start_delay: seconds between compiling and t=0
+        batches = self.compile()
+        start = time.monotonic() + start_delay
+        info('*** Running %d events (%d batches) from monotonic time %.6f\n' %
+             (len(self.events), len(batches), start))
+        queued = {}     # node => deque of (cmd, intfs, record) waiting for the shell
+        running = {}    # node => (intfs, record, output so far) being run
+        fds = {}
+        i = 0
+        while i < len(batches) or queued or running:
+            now = time.monotonic()
+            # dispatch every batch that is due
+            while i < len(batches) and start + batches[i][0] <= now:
+                t, events, cmds = batches[i]
+                record = {'t': t, 'events': [e._asdict() for e in events],
+                          'due': start + t, 'sent': time.monotonic(), 'done': None,
+                          'pending': len(cmds), 'errors': {}}
+                self.log.append(record)
+                for node, (msgs, shell, intfs) in cmds.items():
+                    if msgs:
+                        try:
+                            NetlinkSocket.forNode(node).request(*msgs)
+                        except NetlinkError as e:
+                            record['errors'][node.name] = str(e)
+                    if shell:
+                        queued.setdefault(node, deque()).append(('; '.join(shell), intfs, record))
+                    else:
+                        self._finish(node, intfs, record, '')
+                i += 1
+            # start commands on idle shells
+            for node in list(queued):
+                if node not in running:
+                    cmd, intfs, record = queued[node].popleft()
+                    if not queued[node]:
+                        del queued[node]
+                    node.sendCmd(cmd)
+                    running[node] = (intfs, record, [])
+                    fds[node.stdout.fileno()] = node
+            # wait for output or the next batch, whichever comes first
+            timeout = start + batches[i][0] - time.monotonic() if i < len(batches) else None
+            if running:
+                ready, _, _ = select.select(list(fds), [], [], max(timeout, 0) if timeout is not None else None)
+            else:
+                ready = []
+                if timeout is not None and timeout > 0:
+                    time.sleep(timeout)
+            for fd in ready:
+                node = fds[fd]
+                intfs, record, output = running[node]
+                output.append(node.monitor(timeoutms=0))
+                if not node.waiting:
+                    self._finish(node, intfs, record, ''.join(output))
+                    del running[node], fds[fd]
+        for intf, (shape, installed) in self.shapes.items():
+            # what TCIntf.change() would have recorded, for later reshapes
+            if hasattr(intf, 'reshapeCmds'):
+                intf.shape, intf.shapeInstalled = shape, installed
+        for record in self.log:
+            self._report(record, start)
+        return self.log
+
+    def _finish(self, node, intfs, record, output):
+        if output.strip():
+            record['errors'][node.name] = (record['errors'].get(node.name, '') + '\n' +
+                                           output.strip()).strip()
+        for intf in intfs:
+            # drop link.py's cached link state, it changed behind its back
+            if hasattr(intf, 'linkState'):
+                intf.linkState().invalidate()
+        record['pending'] -= 1
+        if not record['pending']:
+            record['done'] = time.monotonic()
+
+    def _report(self, record, start):
+        events = record['events']
+        what = ', '.join('%s %s' % (e['action'], '-'.join(e['target']) if isinstance(e['target'], tuple)
+                                    else e['target']) for e in events[:3])
+        if len(events) > 3:
+            what += ' and %d more' % (len(events) - 3)
+        info('*** t=%.3f mono=%.6f %s (late %.1f ms, took %.1f ms)\n' %
+             (record['t'], record['sent'], what, (record['sent'] - record['due']) * 1000,
+              (record['done'] - record['sent']) * 1000))
+        for name, output in record['errors'].items():
+            error('*** %s: %s\n' % (name, output))
+
+    def write_log(self, path):
+        # one JSON object per batch: t, events, due/sent/done monotonic
+        # timestamps and the output of any command that printed something
+        with open(path, 'w') as f:
+            for record in self.log:
+                record = dict(record)
+                record.pop('pending')
+                f.write(json.dumps(record) + '\n')
+
+
+def run_timeline(net, events, log_path=None):
+    # run a timeline on net, optionally writing the event log to log_path
+    scheduler = Scheduler(net, events)
+    log = scheduler.run()
+    if log_path:
+        scheduler.write_log(log_path)
+    return log
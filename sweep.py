@@ -0,0 +1,116 @@
+import re
+from mininet.log import info, error
+from link import runBatches, batchErrors
+from reconcile import reconcile
+
+# Buffer size sweep for bufferbloat experiments: router queue limits are
+# set to multiples of each link's bandwidth-delay product, one 'tc -batch'
+# per router, and a measurement runs at every point on the same network.
+# With link.TCLink interfaces, shape_limits() does it through reconcile()
+# instead: only netem qdiscs whose limit differs are changed, over netlink,
+# and the interfaces' shape keeps describing what is installed.
+
+MTU = 1500
+
+
+def measure_rtt(node, dst_ip, count=5):
+    # smallest ping rtt from node to dst_ip in seconds (the smallest, so
+    # that queueing doesn't inflate the BDP), None if nothing came back
+    output = node.cmd('ping -n -q -c %d -i 0.2 %s' % (count, dst_ip))
+    m = re.search(r'= ([\d.]+)/([\d.]+)/([\d.]+)', output)
+    return float(m.group(1)) / 1000 if m else None
+
+
+def bdp_packets(intf, rtt, mtu=MTU):
+    # bandwidth-delay product of intf's link (TCLink bw in Mbit/s) in packets
+    bw = intf.params.get('bw')
+    if not bw:
+        raise ValueError('%s has no bandwidth limit' % intf)
+    return bw * 1e6 * rtt / 8 / mtu
+
+
+def limit_cmd(intf, limit, loss=None):
+    # 'tc -batch' line setting intf's netem queue limit to limit packets.
+    # TCIntf puts its netem qdisc at handle 10:, 'change' has to restate
+    # the link's delay and jitter or netem would drop them; a link without
+    # one gets a netem root qdisc, as the experiment did by hand before
+    params = intf.params
+    args = ['limit %d' % limit]
+    if params.get('delay') is not None:
+        args.append('delay %s' % params['delay'])
+        if params.get('jitter') is not None:
+            args.append(str(params['jitter']))
+    if loss is None:
+        loss = params.get('loss')
+    if loss:
+        args.append('loss %.5f%%' % loss)
+    if params.get('delay') is not None or params.get('loss'):
+        return 'qdisc change dev %s handle 10: netem %s' % (intf, ' '.join(args))
+    return 'qdisc replace dev %s root netem %s' % (intf, ' '.join(args))
+
+
+def set_limits(limits, loss=None):
+    # limits: {intf: packets}, applied with one 'tc -batch' per node
+    # returns the number of commands that failed
+    batches = {}
+    for intf, limit in limits.items():
+        batches.setdefault(intf.node, []).append(limit_cmd(intf, limit, loss))
+    failed = 0
+    for node, output in runBatches(batches, tool='tc').items():
+        for line, err in zip(batches[node], batchErrors(output, len(batches[node]))[0]):
+            if err:
+                error('*** %s: %s: %s' % (node.name, line, err))
+                failed += 1
+    return failed
+
+
+def shape_limits(limits, loss=None):
+    # like set_limits() for link.TCIntfs: their shape's max_queue_size (and
+    # loss) through reconcile(); returns the number of changes that failed
+    desired = {}
+    for intf, limit in limits.items():
+        shape = {'max_queue_size': limit}
+        if loss is not None:
+            shape['loss'] = loss
+        desired[intf] = {'shape': shape}
+    return reconcile(desired)['failed']
+
+
+def sweep_limits(intfs, rtt, multiples, mtu=MTU):
+    # [(multiple, {intf: packets})], at least one packet per queue
+    return [(m, {intf: max(1, int(round(m * bdp_packets(intf, rtt, mtu)))) for intf in intfs})
+            for m in multiples]
+
+
+def run_sweep(intfs, rtt, multiples, measure, loss=None, mtu=MTU, apply=set_limits):
+    # for each multiple of the BDP: set every queue in intfs with
+    # apply(limits, loss) (set_limits or shape_limits), then call
+    # measure(label) which returns traffic.run_flows results
+    # returns one row per point: multiple, limit (packets, smallest queue),
+    # goodput (bit/s, all flows), retransmits, rtt (ms, mean over flows)
+    rows = []
+    for multiple, limits in sweep_limits(intfs, rtt, multiples, mtu):
+        limit = min(limits.values())
+        info('*** Buffer %.2f x BDP (%d packets)\n' % (multiple, limit))
+        if apply(limits, loss):
+            error('*** Some queue limits were not set, measuring anyway\n')
+        results = [r for r in measure('%g-bdp-%d' % (multiple, limit)) if not r['error']]
+        rtts = [r['rtt'] for r in results if r.get('rtt') is not None]
+        rows.append({
+            'multiple': multiple,
+            'limit': limit,
+            'goodput': sum(r['goodput'] or 0 for r in results),
+            'retransmits': sum(r['retransmits'] or 0 for r in results),
+            'rtt': sum(rtts) / len(rtts) if rtts else None,
+            'flows': len(results),
+        })
+    return rows
+
+
+def format_sweep(rows):
+    lines = ['%8s %8s %12s %8s %9s' % ('x BDP', 'packets', 'goodput', 'retrans', 'rtt')]
+    for row in rows:
+        lines.append('%8g %8d %7.2f Mbps %8d %9s' % (
+            row['multiple'], row['limit'], row['goodput'] / 1e6, row['retransmits'],
+            '%.1f ms' % row['rtt'] if row['rtt'] is not None else '-'))
+    return '\n'.join(lines) + '\n'
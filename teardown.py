@@ -0,0 +1,183 @@
+import os, signal, time
+from collections import OrderedDict
+from itertools import groupby
+from mininet.log import info, error
+from mininet.term import cleanUpScreens
+from birdctl import stop_daemons
+from tracing import record
+from link import LinkStateTable, runBatches, batchErrors
+from rtnl import NetlinkSocket, EthtoolSocket
+
+# Bulk teardown, in place of net.stop() for big topologies. net.stop()
+# stops every link, switch and host in turn; each BirdRouter/BirdHost runs
+# a blocking 'birdc down' and every veth end gets its own 'ip link del'.
+# Here all BIRD daemons are shut down at once over their control sockets,
+# then the namespaces of the hosts are dropped: every process in them is
+# killed (the shell, and whatever was started with popen() or in the
+# background, which would keep the namespace alive), and once the last one
+# is gone the kernel deletes every interface in it together with its veth
+# peer. Links with no end in a dropped namespace, and peers that are still
+# there afterwards, are deleted explicitly, one 'ip link del' per pair and
+# one 'ip -batch' per node.
+
+# seconds to wait for killed processes to go, before giving up on them
+KILL_TIMEOUT = 2.0
+
+
+def _forget(intf):
+    # link.Intf.forget(), for mininet's own Intf classes as well
+    if hasattr(intf, 'forget'):
+        intf.forget()
+    else:
+        intf.node.delIntf(intf)
+        intf.link = None
+
+
+def _netns(pid):
+    # (device, inode) of the network namespace of process pid, None if
+    # the process is gone (or a zombie, which doesn't hold it any more)
+    try:
+        st = os.stat('/proc/%s/ns/net' % pid)
+    except OSError:
+        return None
+    return st.st_dev, st.st_ino
+
+
+def _namespace_pids(namespaces):
+    # {namespace: [pids]} of the processes in any of namespaces
+    pids = {}
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            ns = _netns(entry)
+            if ns in namespaces:
+                pids.setdefault(ns, []).append(int(entry))
+    return pids
+
+
+def _kill(pids, sig=signal.SIGKILL):
+    for pid in pids:
+        try:
+            os.kill(pid, sig)
+        except ProcessLookupError:
+            pass
+
+
+def fast_stop(net, bird_timeout=10.0):
+    # stop net like net.stop() does; returns {phase: seconds}
+    timings = OrderedDict()
+    start = time.monotonic()
+
+    def done(phase, since):
+        now = time.monotonic()
+        timings[phase] = now - since
+        record('stop ' + phase, since, now)
+        return now
+
+    t = start
+    for controller in net.controllers:
+        controller.stop()
+    if net.terms:
+        cleanUpScreens()
+        net.terms = []
+    t = done('controllers', t)
+
+    # nodes whose daemon doesn't stop keep their namespace alive, so their
+    # links are deleted by hand below
+    bird_nodes = [node for node in net.hosts if hasattr(node, 'ctl_path')]
+    lingering = set(name for name, latency in stop_daemons(bird_nodes, bird_timeout).items()
+                    if latency is None)
+    t = done('bird', t)
+
+    dropped = [node for node in net.hosts if node.inNamespace and node.name not in lingering]
+    for node in dropped:
+        # while the shell still runs commands
+        if getattr(node, 'privateDirs', None):
+            node.unmountPrivateDirs()
+        # an open netlink socket would keep the namespace alive
+        LinkStateTable.forNode(node).stopMonitor()
+        NetlinkSocket.closeNode(node)
+        EthtoolSocket.closeNode(node)
+    namespaces = {}
+    for node in dropped:
+        ns = _netns(node.pid)
+        if ns is not None and ns != _netns('self'):
+            namespaces[ns] = node
+    shells = set(node.shell.pid for node in dropped if node.shell)
+    for ns, pids in _namespace_pids(namespaces).items():
+        _kill(pid for pid in pids if pid not in shells)
+    for node in dropped:
+        if node.shell and node.shell.poll() is None:
+            os.killpg(node.shell.pid, signal.SIGHUP)
+    for node in dropped:
+        # close the ptys and reap the shell; Node.cleanup rather than
+        # terminate(), which the router classes override with commands
+        node.cleanup()
+    # anything that forked in the meantime, or was slow to die
+    deadline = time.monotonic() + KILL_TIMEOUT
+    remaining = _namespace_pids(namespaces)
+    while remaining and time.monotonic() < deadline:
+        for pids in remaining.values():
+            _kill(pids)
+        time.sleep(0.01)
+        remaining = _namespace_pids(namespaces)
+    for ns, pids in remaining.items():
+        error('*** %s: namespace kept alive by pids %s\n' % (
+            namespaces[ns].name, ' '.join(map(str, sorted(pids)))))
+    t = done('namespaces', t)
+
+    dropped = set(dropped)
+    batches = {}
+    peers = {}      # node => names of its interfaces whose peer was dropped
+    for link in net.links:
+        intf1, intf2 = link.intf1, link.intf2
+        if intf1 is None or intf2 is None:
+            continue
+        if intf1.node in dropped or intf2.node in dropped:
+            # gone with the namespace; an end outside it is checked below
+            for intf in (intf1, intf2):
+                if intf.node not in dropped:
+                    peers.setdefault(intf.node, set()).add(intf.name)
+            _forget(intf1)
+            _forget(intf2)
+        elif getattr(link, 'isPatchLink', False):
+            link.stop()
+            continue
+        else:
+            batches.setdefault(intf1.node, []).append('link del %s' % intf1.name)
+            _forget(intf1)
+            _forget(intf2)
+        link.intf1 = link.intf2 = None
+    for node, names in peers.items():
+        # one link dump per node; the kernel may still be tearing the
+        # namespace down, so a peer that goes meanwhile isn't an error
+        left = names & set(link['name'] for link in NetlinkSocket.forNode(node).links())
+        batches.setdefault(node, []).extend('link del %s' % name for name in sorted(left))
+    for node, output in runBatches(batches).items():
+        for line, err in zip(batches[node], batchErrors(output, len(batches[node]))[0]):
+            if err and 'Cannot find device' not in err:
+                error('*** %s: %s: %s\n' % (node.name, line, err))
+    t = done('links', t)
+
+    stopped = set()
+    for swclass, switches in groupby(sorted(net.switches, key=lambda s: str(type(s))), type):
+        switches = tuple(switches)
+        if hasattr(swclass, 'batchShutdown'):
+            stopped.update(swclass.batchShutdown(switches) or ())
+    for switch in net.switches:
+        if switch not in stopped:
+            switch.stop(deleteIntfs=False)
+        switch.terminate()
+    t = done('switches', t)
+
+    # what is left: hosts outside a namespace or with a daemon that
+    # wouldn't stop, the slow way
+    for node in net.hosts:
+        if node not in dropped:
+            node.terminate()
+    done('hosts', t)
+
+    timings['total'] = time.monotonic() - start
+    info('*** Stopped %d hosts, %d switches and %d links in %.2f s (%s)\n' % (
+        len(net.hosts), len(net.switches), len(net.links), timings['total'],
+        ', '.join('%s %.2f s' % item for item in timings.items() if item[0] != 'total')))
+    return timings
@@ -0,0 +1,338 @@
+import json, math, struct, threading, time
+from collections import namedtuple
+from mininet.log import info, error, debug
+from link import TCIntf
+from rtnl import NetlinkSocket, NetlinkError, TC_H_ROOT
+
+# Queue telemetry: samples the statistics of the qdiscs on TCIntfs while an
+# experiment runs, to explain its throughput with backlog and drops.
+#   sampler = Sampler(router_intfs, interval=0.01, path='logs/qdisc.bin')
+#   sampler.start()
+#   ... run flows, sampler.mark('1-bdp') ...
+#   sampler.stop()
+#   print(sampler.report())
+# Every tick does one RTM_GETQDISC dump per namespace over the node's
+# netlink socket (or, where that fails, runs 'tc -s -j qdisc show' in the
+# node, all nodes at once). Each qdisc we installed (the kernel's default
+# ones, handle 0, are left out) is a series; a sample of it is a RECORD:
+# the time, the series, what its bytes, packets, drops, overlimits and
+# requeues counters went up by since the previous sample, and its backlog
+# (bytes and packets) at that time. Samples of a series that is idle (no
+# counter moved, backlog as last recorded) are not recorded. Records go
+# into a Ring of fixed size that is written out to path whenever it fills
+# up (without a path the oldest records are overwritten); path + '.json'
+# gets the series, marks and stats when the sampler stops. load() reads
+# both back.
+# Overhead: each tick's cost is timed. When ticks cost more than
+# max_overhead of the interval, the sampler stretches the interval so that
+# they don't, and report() says by how much.
+
+# t (monotonic ns), series, bytes, packets, drops, overlimits, requeues
+# (deltas), backlog bytes, backlog packets
+RECORD = struct.Struct('=QIQIIIIII')
+Sample = namedtuple('Sample', ['t', 'series', 'bytes', 'packets', 'drops', 'overlimits',
+                               'requeues', 'backlog', 'qlen'])
+
+# shortest interval we sample at, in seconds
+MIN_INTERVAL = 0.01
+
+# counters we take deltas of, in RECORD order
+_COUNTERS = 5
+
+
+def _handle(handle):
+    # 0x50000 -> '5:', 0x50001 -> '5:1', like tc prints them
+    if handle == TC_H_ROOT:
+        return 'root'
+    major, minor = handle >> 16, handle & 0xffff
+    return '%x:%s' % (major, '%x' % minor if minor else '')
+
+
+class Ring:
+    # fixed number of RECORDs; when full, they are written to sink (a
+    # binary file) or, without one, the oldest are overwritten
+
+    def __init__(self, capacity=65536, sink=None):
+        self.capacity = capacity
+        self.buf = bytearray(capacity * RECORD.size)
+        self.sink = sink
+        self.start = 0
+        self.count = 0
+        self.written = 0
+        self.overwritten = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, *fields):
+        if self.count == self.capacity:
+            if self.sink is not None:
+                self.flush()
+            else:
+                self.start = (self.start + 1) % self.capacity
+                self.count -= 1
+                self.overwritten += 1
+        RECORD.pack_into(self.buf, (self.start + self.count) % self.capacity * RECORD.size, *fields)
+        self.count += 1
+
+    def _spans(self):
+        # (start, end) byte offsets of the buffered records, oldest first
+        first = self.start * RECORD.size
+        end = first + self.count * RECORD.size
+        if end <= len(self.buf):
+            return [(first, end)]
+        return [(first, len(self.buf)), (0, end - len(self.buf))]
+
+    def flush(self):
+        # write the buffered records to sink, oldest first, and empty the ring
+        if self.sink is None or not self.count:
+            return
+        view = memoryview(self.buf)
+        for start, end in self._spans():
+            self.sink.write(view[start:end])
+        self.written += self.count
+        self.start = self.count = 0
+
+    def records(self):
+        # the buffered records as Samples, oldest first
+        for start, end in self._spans():
+            for fields in RECORD.iter_unpack(self.buf[start:end]):
+                yield Sample(*fields)
+
+
+class Sampler:
+
+    def __init__(self, intfs, interval=0.1, path=None, capacity=65536, max_overhead=0.05,
+                 source=None):
+        # intfs: TCIntfs, or a Mininet (all of its TCIntfs)
+        # interval: seconds between ticks, MIN_INTERVAL at least
+        # path: file to stream the records to (None: keep the last
+        #   capacity records in memory)
+        # max_overhead: largest fraction of the time the sampler may spend
+        #   sampling before it stretches the interval
+        # source: 'netlink' or 'tc' (None: netlink, tc where that fails)
+        if hasattr(intfs, 'hosts'):
+            intfs = [intf for node in intfs.hosts + intfs.switches
+                     for intf in node.intfList() if isinstance(intf, TCIntf)]
+        if interval < MIN_INTERVAL:
+            raise ValueError('interval must be %g s or more' % MIN_INTERVAL)
+        self.nodes = {}
+        for intf in intfs:
+            self.nodes.setdefault(intf.node, {})[intf.name] = intf
+        self.interval = interval
+        self.max_overhead = max_overhead
+        self.source = source
+        self.path = path
+        self.sink = open(path, 'wb') if path else None
+        self.ring = Ring(capacity, self.sink)
+        # (node name, intf, handle, parent, kind) per series, and the
+        # series number of each (node, ifindex or name, handle, kind)
+        self.series = []
+        self._series = {}
+        self._last = []
+        self.marks = []
+        self.sources = {}
+        self._indexes = {}
+        # tick costs and start times (s), and the stretched interval
+        self.costs = []
+        self.starts = []
+        self.stretched = 0
+        self.errors = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    # where the numbers come from
+
+    def _netlink(self, node):
+        # [(intf, handle, parent, kind, stats)] of node's qdiscs over netlink
+        nl = NetlinkSocket.forNode(node)
+        indexes = self._indexes.get(node)
+        if indexes is None:
+            indexes = self._indexes[node] = {
+                nl.link(name)['index']: intf for name, intf in self.nodes[node].items()}
+        return [(indexes[index], handle, parent, kind, stats)
+                for index, handle, parent, kind, stats in nl.qdiscStats()
+                if handle and index in indexes]
+
+    def _tc(self, node, output):
+        # the same from 'tc -s -j qdisc show' output
+        intfs = self.nodes[node]
+        qdiscs = []
+        for q in json.loads(output or '[]'):
+            intf = intfs.get(q.get('dev'))
+            if intf is None or q['handle'] == '0:':
+                continue
+            handle = int(q['handle'].rstrip(':'), 16) << 16
+            parent = q.get('parent', 'root')
+            stats = tuple(q.get(k, 0) for k in ('bytes', 'packets', 'drops', 'overlimits',
+                                                'requeues', 'backlog', 'qlen'))
+            qdiscs.append((intf, handle, TC_H_ROOT if parent == 'root' else parent, q['kind'], stats))
+        return qdiscs
+
+    def _source(self, node):
+        source = self.sources.get(node)
+        if source is None:
+            source = self.source or 'netlink'
+            if source == 'netlink':
+                try:
+                    self._netlink(node)
+                except (NetlinkError, OSError) as e:
+                    debug('*** %s: no netlink qdisc stats (%s), using tc\n' % (node, e))
+                    source = 'tc'
+            self.sources[node] = source
+        return source
+
+    # sampling
+
+    def _record(self, now, node, qdiscs):
+        for intf, handle, parent, kind, stats in qdiscs:
+            key = (intf, handle, kind)
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = len(self.series)
+                self.series.append((node.name, intf.name, _handle(handle),
+                                    parent if isinstance(parent, str) else _handle(parent), kind))
+                self._last.append(stats)
+                continue
+            last = self._last[series]
+            self._last[series] = stats
+            # a counter that went down belongs to a new qdisc: count from 0
+            deltas = [new - old if new >= old else new
+                      for new, old in zip(stats[:_COUNTERS], last[:_COUNTERS])]
+            if any(deltas) or stats[_COUNTERS:] != last[_COUNTERS:]:
+                self.ring.append(now, series, *(deltas + list(stats[_COUNTERS:])))
+
+    def sample(self):
+        # one tick: every node's qdisc stats, one request (or tc) per node
+        now = time.monotonic_ns()
+        procs = {}
+        for node in self.nodes:
+            if self._source(node) == 'tc':
+                procs[node] = node.popen(['tc', '-s', '-j', 'qdisc', 'show'])
+                continue
+            try:
+                self._record(now, node, self._netlink(node))
+            except (NetlinkError, OSError) as e:
+                self.errors += 1
+                error('*** %s: qdisc stats failed: %s\n' % (node.name, e))
+        for node, proc in procs.items():
+            output, _err = proc.communicate()
+            try:
+                self._record(now, node, self._tc(node, output.decode() if isinstance(output, bytes)
+                                                 else output))
+            except ValueError as e:
+                self.errors += 1
+                error('*** %s: bad tc output: %s\n' % (node.name, e))
+
+    def mark(self, label):
+        # note the time something happened (e.g. a measurement starts)
+        self.marks.append((time.monotonic_ns(), label))
+
+    def run(self, duration=None):
+        # sample every interval until stop() (or for duration seconds)
+        start = time.monotonic()
+        end = start + duration if duration is not None else None
+        due = start
+        while not self._stop.is_set() and (end is None or due <= end):
+            began = time.monotonic()
+            self.sample()
+            cost = time.monotonic() - began
+            self.starts.append(began - start)
+            self.costs.append(cost)
+            # keep within max_overhead: stretch the interval while ticks
+            # cost more than that, go back once they don't
+            interval = max(self.interval, cost / self.max_overhead)
+            if interval > self.interval:
+                self.stretched += 1
+            due = max(due + interval, time.monotonic())
+            self._stop.wait(max(0, due - time.monotonic()))
+
+    def start(self):
+        # sample in a background thread
+        info('*** Sampling qdiscs on %d nodes every %g ms\n' % (len(self.nodes), self.interval * 1e3))
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name='qdisc-telemetry', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        # stop sampling, write out what is buffered and the series
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.close()
+        return self.stats()
+
+    def close(self):
+        if self.sink is None:
+            return
+        self.ring.flush()
+        self.sink.close()
+        self.sink = self.ring.sink = None
+        with open(self.path + '.json', 'w') as f:
+            json.dump({'record': Sample._fields, 'interval': self.interval,
+                       'series': self.series, 'marks': self.marks, 'stats': self.stats()}, f)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def stats(self):
+        # ticks, records kept, sampling cost per tick (ms) and the share of
+        # the time it took, the mean time between ticks (ms), ticks that
+        # stretched the interval, failed requests
+        costs = sorted(self.costs)
+        n = len(costs)
+        elapsed = self.starts[-1] + self.costs[-1] if n else 0
+
+        def pct(p):
+            return costs[min(n - 1, int(math.ceil(p * n)) - 1)] * 1e3 if n else None
+        return {
+            'ticks': n,
+            'series': len(self.series),
+            'records': self.ring.written + len(self.ring),
+            'overwritten': self.ring.overwritten,
+            'mean_ms': sum(costs) / n * 1e3 if n else None,
+            'p99_ms': pct(0.99),
+            'max_ms': costs[-1] * 1e3 if n else None,
+            'overhead': sum(costs) / elapsed if elapsed else None,
+            'interval_ms': self.starts[-1] / (n - 1) * 1e3 if n > 1 else None,
+            'stretched': self.stretched,
+            'errors': self.errors,
+            'sources': sorted(set(self.sources.values())),
+        }
+
+    def report(self):
+        s = self.stats()
+        if not s['ticks']:
+            return '0 ticks\n'
+        return ('%d ticks over %d qdiscs (%s), %d records (%d overwritten), %d failed\n'
+                'tick cost: mean %.3f ms, p99 %.3f ms, max %.3f ms; %.2f%% of the time, '
+                'every %.1f ms (asked %g ms, stretched %d times)\n' % (
+                    s['ticks'], s['series'], '/'.join(s['sources']), s['records'],
+                    s['overwritten'], s['errors'], s['mean_ms'], s['p99_ms'], s['max_ms'],
+                    s['overhead'] * 100, s['interval_ms'] or self.interval * 1e3,
+                    self.interval * 1e3, s['stretched']))
+
+
+def load(path):
+    # what a Sampler with path wrote: (metadata, [Sample])
+    with open(path + '.json') as f:
+        meta = json.load(f)
+    with open(path, 'rb') as f:
+        data = f.read()
+    return meta, [Sample(*fields) for fields in RECORD.iter_unpack(data)]
+
+
+def write_csv(path, csv_path):
+    # the records at path as CSV, one line per sample with its series
+    meta, samples = load(path)
+    with open(csv_path, 'w') as f:
+        f.write('t_ns,node,intf,handle,parent,kind,bytes,packets,drops,overlimits,requeues,'
+                'backlog,qlen\n')
+        for s in samples:
+            f.write('%d,%s,%s,%s,%s,%s,%d,%d,%d,%d,%d,%d,%d\n' % (
+                (s.t,) + tuple(meta['series'][s.series]) + tuple(s[2:])))
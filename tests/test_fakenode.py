@@ -0,0 +1,170 @@
+"""
+Commands link.py sends to build links, recorded by fakenode.FakeNode:
+Link, TCLink and OVSLink one at a time and with Link.makeLinks(), the
+lines of the 'ip -batch'/'tc -batch' files, and the commands per link
+bench/bench_links.py reports (cmdstats) for each.
+
+Needs mininet importable (link.py imports it), no root:
+    python3 -m pytest tests
+"""
+import os, subprocess, sys, unittest
+current_dir = os.path.dirname(os.path.realpath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.append(parent_dir)
+
+try:
+    from link import Link, TCLink, OVSLink, OVSIntf, TCBatch
+    from fakenode import FakeNode, fakeSwitch
+    import cmdstats
+except ImportError:
+    Link = None
+
+SHAPE = {'bw': 10, 'delay': '1ms'}
+
+
+@unittest.skipIf(Link is None, 'needs mininet')
+class FakeLinksTest(unittest.TestCase):
+
+    def setUp(self):
+        # node name => [lines of every -batch file it ran]
+        self.batches = {}
+        cmdstats.reset()
+        cmdstats.enable()
+
+    def tearDown(self):
+        cmdstats.disable()
+        cmdstats.reset()
+
+    def _batch(self, node, cmd):
+        # the batch file is gone once the command returns: keep its lines
+        with open(cmd.split()[-1]) as f:
+            self.batches.setdefault(node.name, []).extend(
+                line.strip() for line in f if line.strip())
+        return node.run(cmd)
+
+    def nodes(self, *names):
+        return [FakeNode(name, responses=[(r' -batch ', self._batch)]) for name in names]
+
+    def mesh(self, nodes, params=None):
+        return [(n1, n2, dict(params or {})) for i, n1 in enumerate(nodes)
+                for n2 in nodes[i + 1:]]
+
+    def per_link(self):
+        return cmdstats.stats()['per_link']
+
+    def test_link(self):
+        a, b = self.nodes('a', 'b')
+        link = Link(a, b)
+        self.assertEqual(a.commands, [
+            'ip link add name a-eth0 type veth peer name b-eth0 netns %d' % b.pid,
+            'ifconfig a-eth0 up'])
+        self.assertEqual(b.commands, ['ifconfig b-eth0 up'])
+        self.assertEqual(a.devices['a-eth0']['peer'], (b, 'b-eth0'))
+        self.assertEqual((link.intf1.name, link.intf2.name), ('a-eth0', 'b-eth0'))
+        self.assertEqual(self.per_link(), 3)
+        self.assertEqual(a.count + b.count, 3)
+
+    def test_tclink(self):
+        a, b = self.nodes('a', 'b')
+        link = TCLink(a, b, **SHAPE)
+        for node, intf in ((a, link.intf1), (b, link.intf2)):
+            tc = ['tc qdisc show dev %s' % intf] + [cmd % ('tc', intf)
+                                                     for cmd in intf.shapeInstalled]
+            self.assertEqual(node.commands[-6:], [
+                'ifconfig %s up' % intf, 'ethtool -K %s gro off tx on rx on' % intf] + tc)
+            self.assertEqual([cmd.split()[5:] for cmd in tc[1:]], [
+                ['root', 'handle', '5:0', 'htb', 'default', '1'],
+                ['parent', '5:0', 'classid', '5:1', 'htb',
+                 'rate', '10.000000Mbit', 'burst', '15k'],
+                ['parent', '5:1', 'handle', '10:', 'netem', 'delay', '1ms']])
+        self.assertEqual(len(a.commands), 7)
+        # a veth pair, and 6 commands for each end
+        self.assertEqual(self.per_link(), 13)
+
+    def test_make_links(self):
+        a, b, c, d = nodes = self.nodes('a', 'b', 'c', 'd')
+        links = Link.makeLinks(self.mesh(nodes))
+        self.assertEqual([str(link) for link in links], [
+            'a-eth0<->b-eth0', 'a-eth1<->c-eth0', 'a-eth2<->d-eth0',
+            'b-eth1<->c-eth1', 'b-eth2<->d-eth1', 'c-eth2<->d-eth2'])
+        line = 'link add name %s type veth peer name %s netns %d'
+        self.assertEqual(self.batches, {
+            'a': [line % ('a-eth0', 'b-eth0', b.pid), line % ('a-eth1', 'c-eth0', c.pid),
+                  line % ('a-eth2', 'd-eth0', d.pid)],
+            'b': [line % ('b-eth1', 'c-eth1', c.pid), line % ('b-eth2', 'd-eth1', d.pid)],
+            'c': [line % ('c-eth2', 'd-eth2', d.pid)]})
+        # one 'ip -batch' per node that has pairs to make, nothing per link
+        for node in nodes:
+            self.assertFalse([cmd for cmd in node.commands if cmd.startswith('ip link')])
+            self.assertEqual(len([cmd for cmd in node.commands if ' -batch ' in cmd]),
+                             1 if node is not d else 0)
+        for link in links:
+            self.assertEqual(link.intf1.node.devices[link.intf1.name]['peer'],
+                             (link.intf2.node, link.intf2.name))
+        # 3 batches and 12 ifconfigs for 6 links
+        self.assertEqual(self.per_link(), 2.5)
+
+    def test_make_links_tc_batch(self):
+        nodes = self.nodes('a', 'b', 'c')
+        with TCBatch():
+            links = TCLink.makeLinks(
+                [(nodes[i], nodes[(i + 1) % 3], dict(SHAPE)) for i in range(3)])
+        for link in links:
+            for intf in (link.intf1, link.intf2):
+                node = intf.node
+                tc = ['qdisc del dev %s root' % intf] + [
+                    (cmd % ('', intf)).strip() for cmd in intf.shapeInstalled]
+                self.assertEqual([line for line in self.batches[node.name]
+                                  if ' dev %s ' % intf in line + ' '], tc)
+                self.assertIn('ethtool -K %s gro off tx on rx on' % intf, node.commands)
+                self.assertEqual(node.devices[intf.name]['qdiscs']['10:']['kind'], 'netem')
+        for node in nodes:
+            # no tc command of its own: veths, ifconfigs and one tc script
+            self.assertFalse([cmd for cmd in node.commands if cmd.startswith('tc qdisc')])
+            self.assertEqual(len([cmd for cmd in node.commands if cmd.startswith('sh ')]), 1)
+        # per node: a veth batch, a tc script; 2 ifconfigs per link
+        self.assertEqual(self.per_link(), 4)
+
+    def test_batch_outputs(self):
+        # the script under a real shell: an output per shell command (its
+        # exit status if it failed) then per tc line, as reconcile counts them
+        def sh(node, cmd):
+            return subprocess.run(cmd.split(), stdout=subprocess.PIPE,
+                                  universal_newlines=True).stdout
+        a, b = FakeNode('a', responses=[(r'^sh ', sh)]), FakeNode('b')
+        link = Link(a, b)
+        batch = TCBatch(tc='true')
+        batch.addCmd(link.intf1, 'false')
+        batch.addCmd(link.intf1, 'true')
+        batch.addTC(link.intf1, ['%s qdisc add dev %s root handle 5: htb'])
+        batch.addCmd(link.intf1, 'sh -c "exit 3"')
+        self.assertEqual(batch.flush(), {a: ['exit status 1', '', 'exit status 3', '']})
+        # FakeNode's own sh: quiet commands go through
+        batch.addCmd(link.intf2, 'ethtool -K b-eth0 gro off')
+        self.assertEqual(batch.flush(), {b: ['']})
+        self.assertIn('ethtool -K b-eth0 gro off', b.commands)
+
+    def test_ovslink(self):
+        a, b = self.nodes('a', 'b')
+        OVSLink(a, b)
+        self.assertEqual(a.commands[0],
+                         'ip link add name a-eth0 type veth peer name b-eth0 netns %d' % b.pid)
+        s1, s2 = fakeSwitch('s1'), fakeSwitch('s2')
+        link = OVSLink(s1, s2)
+        self.assertTrue(link.isPatchLink)
+        self.assertIsInstance(link.intf1, OVSIntf)
+        self.assertEqual(s1.commands + s2.commands, [])
+        self.assertEqual(self.per_link(), 1.5)
+
+    def test_ovslink_make_links(self):
+        # OVSLink makes its own pairs: makeLinks() can't batch them
+        nodes = self.nodes('a', 'b', 'c')
+        OVSLink.makeLinks([(nodes[i], nodes[(i + 1) % 3], {}) for i in range(3)])
+        self.assertEqual(self.batches, {})
+        self.assertEqual(sum(cmd.startswith('ip link add') for node in nodes
+                             for cmd in node.commands), 3)
+        self.assertEqual(self.per_link(), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
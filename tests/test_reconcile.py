@@ -0,0 +1,69 @@
+"""
+Tolerances reconcile.py compares dumped qdisc/class options with.
+
+Needs mininet importable (reconcile.py imports link.py), no root:
+    python3 -m pytest tests
+"""
+import os, sys, unittest
+current_dir = os.path.dirname(os.path.realpath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.append(parent_dir)
+
+try:
+    from link import TCIntf
+    from reconcile import _expected, _matches
+except ImportError:
+    TCIntf = None
+
+
+def dumped_loss(percent):
+    # netem loss after a round trip through the kernel (rtnl._netemOptions)
+    return int(percent / 100.0 * 0xFFFFFFFF) * 100.0 / 0xFFFFFFFF
+
+
+@unittest.skipIf(TCIntf is None, 'needs mininet')
+class MatchesTest(unittest.TestCase):
+
+    def netem(self, **params):
+        cmds, _parent = TCIntf.delayCmds(' root ', **params)
+        key, kind, options = _expected(cmds[0])
+        self.assertEqual(kind, 'netem')
+        return options
+
+    def test_netem_options(self):
+        want = self.netem(delay='5ms', jitter='1ms', loss=0.5, max_queue_size=50)
+        self.assertEqual(want, {'delay': 5000, 'jitter': 1000, 'loss': 0.5, 'limit': 50})
+
+    def test_loss_round_trip_matches(self):
+        for loss in (0.001, 0.5, 1, 33.3, 100):
+            want = self.netem(loss=loss)
+            self.assertTrue(_matches(want, dict(want, loss=dumped_loss(loss)), 'netem'))
+
+    def test_small_loss_change(self):
+        want = self.netem(delay='5ms', loss=0.5)
+        for old in (0.4, 0.499, 0, 0.01):
+            self.assertFalse(_matches(want, dict(want, loss=dumped_loss(old)), 'netem'))
+
+    def test_limit_is_exact(self):
+        want = self.netem(max_queue_size=1000)
+        self.assertTrue(_matches(want, dict(want), 'netem'))
+        self.assertFalse(_matches(want, dict(want, limit=999), 'netem'))
+        self.assertFalse(_matches(want, dict(want, limit=1001), 'netem'))
+
+    def test_rates_and_times_are_relative(self):
+        want = {'rate': 1.25e6, 'burst': 15360}
+        self.assertTrue(_matches(want, {'rate': 1.25e6 * 1.005, 'burst': 15370}, 'htb'))
+        self.assertFalse(_matches(want, {'rate': 1.25e6 * 1.02, 'burst': 15360}, 'htb'))
+        self.assertFalse(_matches(want, {'rate': 1.25e6, 'burst': 15000}, 'htb'))
+        want = self.netem(delay='5ms')
+        self.assertTrue(_matches(want, dict(want, delay=5001), 'netem'))
+        self.assertFalse(_matches(want, dict(want, delay=5100), 'netem'))
+
+    def test_missing_and_bool_options(self):
+        self.assertFalse(_matches({'limit': 10}, {}, 'red'))
+        self.assertTrue(_matches({'ecn': True}, {'ecn': True}, 'red'))
+        self.assertFalse(_matches({'ecn': True}, {'ecn': False}, 'red'))
+
+
+if __name__ == '__main__':
+    unittest.main()
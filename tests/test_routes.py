@@ -0,0 +1,127 @@
+"""
+FIBs routes.py compiles for generated topologies: every address is
+reached from every node by following the routes hop by hop, without
+a loop, with and without ECMP and prefix compression.
+
+Needs mininet importable (topogen.py and routes.py import it), no root:
+    python3 -m pytest tests
+"""
+import os, sys, unittest
+current_dir = os.path.dirname(os.path.realpath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.append(parent_dir)
+
+from addr import MASKS, parse_cidr, ip_to_int
+
+try:
+    from topogen import GeneratedTopo
+    from routes import compile_routes, route_batch, _compress, _merge_siblings
+except ImportError:
+    GeneratedTopo = None
+
+
+def net(cidr):
+    ip, prefix_len = parse_cidr(cidr)
+    return ip & MASKS[prefix_len], prefix_len
+
+
+@unittest.skipIf(GeneratedTopo is None, 'needs mininet')
+class FibWalkTest(unittest.TestCase):
+
+    def walk(self, topo, fibs):
+        # address => node, node => [(network, prefix_len), ...] it is attached to
+        owner, attached = {}, {}
+        for name, cidr in list(topo.intf_ip.items()) + list(topo.host_ip.items()):
+            node = name.split('-')[0]
+            owner[parse_cidr(cidr)[0]] = node
+            attached.setdefault(node, []).append(net(cidr))
+        tables = {node: [(None if dst == 'default' else net(dst), hops)
+                         for dst, hops in fib] for node, fib in fibs.items()}
+
+        def lookup(node, dst):
+            # longest prefix match, the default route matching everything
+            best = None
+            for prefix, hops in tables[node]:
+                if prefix is None or dst & MASKS[prefix[1]] == prefix[0]:
+                    length = -1 if prefix is None else prefix[1]
+                    if best is None or length > best[0]:
+                        best = (length, hops)
+            self.assertIsNotNone(best, 'no route on %s' % node)
+            return best[1]
+
+        def reach(node, dst, path):
+            # every path through all of the next hops on the way
+            self.assertNotIn(node, path, 'loop %s' % (path + [node]))
+            if any(dst & MASKS[p] == n for n, p in attached[node]):
+                return [len(path)]
+            hops = []
+            for via, dev in lookup(node, dst):
+                self.assertEqual(dev.split('-')[0], node)
+                hops += reach(owner[ip_to_int(via)], dst, path + [node])
+            return hops
+
+        for node in tables:
+            for dst in owner:
+                lengths = reach(node, dst, [])
+                # equal cost next hops all lead there in as many hops
+                self.assertEqual(len(set(lengths)), 1, (node, dst, lengths))
+
+    def check(self, topo):
+        sizes = {}
+        for ecmp in (False, True):
+            for compress in (False, True):
+                fibs = compile_routes(topo, topo.intf_ip, topo.host_ip,
+                                      ecmp=ecmp, compress=compress)
+                self.walk(topo, fibs)
+                for fib in fibs.values():
+                    self.assertEqual(len(route_batch(fib)), len(fib))
+                sizes[ecmp, compress] = sum(len(fib) for fib in fibs.values())
+        for ecmp in (False, True):
+            self.assertLess(sizes[ecmp, True], sizes[ecmp, False])
+        return fibs
+
+    def test_ring(self):
+        for n, prefix_len in ((5, 30), (6, 31)):
+            topo = GeneratedTopo('ring', n=n, hosts=n, link_prefix_len=prefix_len)
+            fibs = self.check(topo)
+            # an even ring has two shortest paths to the opposite side
+            if n % 2 == 0:
+                self.assertTrue(any(len(hops) == 2 for fib in fibs.values()
+                                    for _dst, hops in fib))
+
+    def test_grid(self):
+        topo = GeneratedTopo('grid', rows=3, cols=4, hosts=6)
+        fibs = self.check(topo)
+        self.assertEqual(fibs['h1'], [('default', [('172.16.0.1', 'h1-eth0')])])
+        self.assertTrue(any(len(hops) > 1 for fib in fibs.values() for _dst, hops in fib))
+
+
+@unittest.skipIf(GeneratedTopo is None, 'needs mininet')
+class CompressTest(unittest.TestCase):
+
+    def test_merge_siblings(self):
+        routes = {net('10.0.0.0/26'): 1, net('10.0.0.64/26'): 1,
+                  net('10.0.0.128/25'): 1, net('10.0.1.0/24'): 2}
+        self.assertEqual(_merge_siblings(routes),
+                         {net('10.0.0.0/24'): 1, net('10.0.1.0/24'): 2})
+        # a parent route of its own stays, and so do its children
+        routes = {net('10.0.0.0/25'): 1, net('10.0.0.128/25'): 1, net('10.0.0.0/24'): 2}
+        self.assertEqual(_merge_siblings(routes), routes)
+
+    def test_compress(self):
+        routes = {net('10.0.0.0/30'): 1, net('10.0.0.4/30'): 1, net('10.0.1.0/30'): 1,
+                  net('10.0.0.0/16'): 2, net('172.16.0.0/24'): 4}
+        compressed = _compress(routes)
+        self.assertEqual(compressed['default'], 1)
+        # the /30s via 1 are inside 10.0.0.0/16 via 2: the default can't cover them
+        self.assertEqual(compressed, {'default': 1, net('10.0.0.0/30'): 1,
+                                      net('10.0.0.4/30'): 1, net('10.0.1.0/30'): 1,
+                                      net('10.0.0.0/16'): 2, net('172.16.0.0/24'): 4})
+        routes = {net('10.0.0.0/30'): 1, net('10.0.0.4/30'): 1, net('10.1.0.0/30'): 2,
+                  net('10.1.0.4/30'): 2, net('172.16.0.0/24'): 1}
+        self.assertEqual(_compress(routes), {'default': 1, net('10.1.0.0/29'): 2})
+        self.assertEqual(_compress({}), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
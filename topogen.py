@@ -0,0 +1,162 @@
+import random
+from mininet.topo import Topo
+from addr import MASKS, parse_cidr, int_to_ip
+from utils import LinuxRouter
+
+# Topology generator: fat-tree, grid, ring and random router graphs of any
+# size, with addresses allocated automatically. The Topo it builds carries
+# the same intf_ip/host_ip maps the Parts scripts define by hand, e.g.
+#   topo = GeneratedTopo('grid', rows=20, cols=20, hosts=4)
+#   fibs = compile_routes(topo, topo.intf_ip, topo.host_ip)
+
+
+class AddressPool:
+    # hands out aligned subnets of a pool, lowest first; only the next free
+    # address is kept, as an integer
+
+    def __init__(self, cidr):
+        net, prefix_len = parse_cidr(cidr)
+        self.prefix_len = prefix_len
+        self.next = net & MASKS[prefix_len]
+        self.end = self.next + (1 << (32 - prefix_len))
+
+    def allocate(self, prefix_len):
+        # next free /prefix_len as an integer network address
+        if prefix_len < self.prefix_len:
+            raise ValueError('/%d does not fit in a /%d pool' % (prefix_len, self.prefix_len))
+        size = 1 << (32 - prefix_len)
+        net = (self.next + size - 1) & MASKS[prefix_len]
+        if net + size > self.end:
+            raise ValueError('address pool exhausted')
+        self.next = net + size
+        return net
+
+    def remaining(self, prefix_len):
+        # how many more /prefix_len subnets fit
+        size = 1 << (32 - prefix_len)
+        return max(0, (self.end - ((self.next + size - 1) & MASKS[prefix_len])) // size)
+
+
+# Router graphs: (number of routers, edges between router indexes,
+# routers hosts should attach to in order of preference)
+
+def ring_edges(n):
+    if n < 3:
+        raise ValueError('a ring needs at least 3 routers')
+    return n, [(i, (i + 1) % n) for i in range(n)], list(range(n))
+
+
+def grid_edges(rows, cols):
+    edges = []
+    for r in range(rows):
+        for c in range(cols):
+            i = r * cols + c
+            if c + 1 < cols:
+                edges.append((i, i + 1))
+            if r + 1 < rows:
+                edges.append((i, i + cols))
+    # hosts go to the corners first, then everywhere else
+    corners = sorted(set([0, cols - 1, (rows - 1) * cols, rows * cols - 1]))
+    return rows * cols, edges, corners + [i for i in range(rows * cols) if i not in corners]
+
+
+def fat_tree_edges(k):
+    # k-ary fat-tree: (k/2)^2 core routers, k pods of k/2 aggregation and
+    # k/2 edge routers; hosts attach to edge routers
+    if k < 2 or k % 2:
+        raise ValueError('fat-tree k must be even')
+    half = k // 2
+    n_core = half * half
+    edges, edge_routers = [], []
+    for pod in range(k):
+        agg = [n_core + pod * k + i for i in range(half)]
+        edge = [n_core + pod * k + half + i for i in range(half)]
+        edge_routers += edge
+        for j, a in enumerate(agg):
+            edges += [(a, e) for e in edge]
+            edges += [(j * half + c, a) for c in range(half)]
+    # spread hosts over the pods: first edge router of every pod first
+    order = sorted(edge_routers, key=lambda e: ((e - n_core) % k, e))
+    return n_core + k * k, edges, order
+
+
+def random_edges(n, degree=3, seed=0):
+    # connected random graph with an average degree of about degree:
+    # a random spanning tree plus random extra edges
+    rnd = random.Random(seed)
+    nodes = list(range(n))
+    rnd.shuffle(nodes)
+    edges = set()
+    for i in range(1, n):
+        a, b = nodes[i], nodes[rnd.randrange(i)]
+        edges.add((min(a, b), max(a, b)))
+    target = min(int(n * degree / 2), n * (n - 1) // 2)
+    while len(edges) < target:
+        a, b = rnd.randrange(n), rnd.randrange(n)
+        if a != b:
+            edges.add((min(a, b), max(a, b)))
+    return n, sorted(edges), list(range(n))
+
+
+FAMILIES = {
+    'ring': ring_edges,
+    'grid': grid_edges,
+    'fat-tree': fat_tree_edges,
+    'random': random_edges,
+}
+
+
+class GeneratedTopo(Topo):
+
+    def build(self, family, hosts=2, link_pool='10.0.0.0/8', link_prefix_len=30,
+              host_pool='172.16.0.0/12', host_prefix_len=24, router_cls=LinuxRouter,
+              router_opts=None, host_opts=None, link_opts=None, **size):
+        # family: 'ring' (n), 'grid' (rows, cols), 'fat-tree' (k) or
+        # 'random' (n, degree, seed); size: those parameters
+        # hosts: number of end hosts, one per router, spread by family
+        # link_prefix_len: 30 or 31 for the router to router links
+        # router_opts/host_opts/link_opts: extra addHost/addLink options,
+        # e.g. link_opts={'cls': TCLink, 'bw': 100, 'delay': '30ms'}
+        if link_prefix_len not in (30, 31):
+            raise ValueError('router links must be /30 or /31')
+        n_routers, edges, host_routers = FAMILIES[family](**size)
+        if hosts > len(host_routers):
+            raise ValueError('%s topology has room for %d hosts' % (family, len(host_routers)))
+        self.intf_ip = {}
+        self.host_ip = {}
+        link_pool = AddressPool(link_pool)
+        host_pool = AddressPool(host_pool)
+        ports = [0] * n_routers
+        routers = ['r%d' % (i + 1) for i in range(n_routers)]
+        for name in routers:
+            self.addHost(name, cls=router_cls, ip=None, **(router_opts or {}))
+
+        def router_port(i):
+            # (port, interface name), ports numbered as mininet would
+            port = ports[i]
+            ports[i] += 1
+            return port, '%s-eth%d' % (routers[i], port)
+
+        # /31: both addresses are usable (RFC 3021), /30: skip network address
+        first = 0 if link_prefix_len == 31 else 1
+        suffix = '/%d' % link_prefix_len
+        for a, b in edges:
+            net = link_pool.allocate(link_prefix_len)
+            (port1, intf1), (port2, intf2) = router_port(a), router_port(b)
+            self.intf_ip[intf1] = int_to_ip(net + first) + suffix
+            self.intf_ip[intf2] = int_to_ip(net + first + 1) + suffix
+            self.addLink(routers[a], routers[b], port1, port2, intfName1=intf1, intfName2=intf2,
+                         params1={'ip': self.intf_ip[intf1]}, params2={'ip': self.intf_ip[intf2]},
+                         **(link_opts or {}))
+
+        # host subnets: the router gets .1, the host .2
+        suffix = '/%d' % host_prefix_len
+        for h in range(hosts):
+            host, r = 'h%d' % (h + 1), host_routers[h]
+            net = host_pool.allocate(host_prefix_len)
+            port, intf = router_port(r)
+            self.intf_ip[intf] = int_to_ip(net + 1) + suffix
+            self.host_ip[host] = int_to_ip(net + 2) + suffix
+            self.addHost(host, intfName='%s-eth0' % host, ip=self.host_ip[host], **(host_opts or {}))
+            self.addLink(host, routers[r], 0, port, intfName2=intf, params2={'ip': self.intf_ip[intf]},
+                         **(link_opts or {}))
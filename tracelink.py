@@ -0,0 +1,292 @@
+import heapq, math, random, time
+from array import array
+from collections import namedtuple
+from mininet.log import info, error
+from link import TCIntf, TCBatch, NetlinkTCIntf
+from rtnl import NetlinkSocket, NetlinkError, tcHandle
+
+# Trace-driven link emulation: replays bandwidth/delay/loss traces (e.g.
+# recorded on cellular or WAN uplinks) on TCIntfs of a running network.
+#   replay = TraceReplay({intf1: load_trace('lte.trace'), intf2: ...})
+#   replay.run()
+#   print(replay.report())
+# A trace file has one sample per line: seconds from the start, Mbit/s,
+# delay in ms and loss in %, separated by spaces, tabs or commas; blank
+# lines, '#' comments and a header line are skipped. Samples are held in
+# array('d') columns, 32 bytes a sample.
+# prepare() gives every interface the shape of its first sample with
+# TCIntf.change() (one 'tc -batch' per node, the whole htb/tbf + netem
+# chain if it wasn't there). From then on one loop changes the htb class
+# or tbf qdisc and the netem qdisc in place over netlink, all interfaces
+# of a node due at the same time in a single request, so no process is
+# forked per update. An interface is updated at most every min_interval
+# seconds (100 times a second by default); when the loop falls behind, it
+# applies the latest sample that is due and counts the ones it skipped.
+# Every update records how late it was applied (acked by the kernel)
+# relative to when it was due.
+
+Trace = namedtuple('Trace', ['t', 'mbit', 'ms', 'loss'])
+
+# rate used for samples of 0 Mbit/s (outages): htb and tbf need one
+MIN_MBIT = 0.01
+
+_HTB_CLASS, _HTB_PARENT = tcHandle('5:1'), tcHandle('5:0')
+_TBF, _NETEM = tcHandle('5:'), tcHandle('10:')
+
+
+def make_trace(samples):
+    # Trace from (t, mbit, ms, loss) tuples, sorted by time
+    columns = tuple(array('d') for _ in Trace._fields)
+    for sample in sorted(samples):
+        for column, value in zip(columns, sample):
+            column.append(value)
+    return Trace(*columns)
+
+
+def load_trace(path):
+    # read a trace file (see above) into a Trace
+    columns = tuple(array('d') for _ in Trace._fields)
+    last = -1.0
+    with open(path) as f:
+        for n, line in enumerate(f, 1):
+            line = line.split('#', 1)[0].replace(',', ' ').split()
+            if not line:
+                continue
+            try:
+                sample = [float(x) for x in line]
+            except ValueError:
+                if not columns[0]:
+                    continue    # header
+                raise ValueError('%s:%d: not a number' % (path, n))
+            if len(sample) != 4:
+                raise ValueError('%s:%d: expected time, Mbit, ms and loss' % (path, n))
+            if sample[0] < last:
+                raise ValueError('%s:%d: time goes backwards' % (path, n))
+            last = sample[0]
+            for column, value in zip(columns, sample):
+                column.append(value)
+    if not columns[0]:
+        raise ValueError('%s: empty trace' % path)
+    return Trace(*columns)
+
+
+def load_mahimahi(path, interval=0.1, ms=0.0, loss=0.0, mtu=1500):
+    # a Mahimahi packet delivery trace (one line per MTU-sized delivery
+    # opportunity, in ms) as a Trace of interval-second bandwidth samples
+    counts = array('d')
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                slot = int(float(line) / 1000.0 / interval)
+                while len(counts) <= slot:
+                    counts.append(0)
+                counts[slot] += 1
+    scale = mtu * 8 / interval / 1e6
+    return make_trace((i * interval, n * scale, ms, loss) for i, n in enumerate(counts))
+
+
+def synthetic_trace(duration, interval=0.01, mbit=(5, 50), ms=(10, 80), loss=(0, 2), seed=0):
+    # random walk between the (low, high) bounds of each column, a sample
+    # every interval seconds; for testing and benchmarks
+    rnd = random.Random(seed)
+    bounds = (mbit, ms, loss)
+    values = [(low + high) / 2.0 for low, high in bounds]
+    samples = []
+    for i in range(int(duration / interval) + 1):
+        samples.append((i * interval,) + tuple(values))
+        values = [min(high, max(low, v + rnd.gauss(0, (high - low) / 20.0)))
+                  for v, (low, high) in zip(values, bounds)]
+    return make_trace(samples)
+
+
+class _Link:
+    # one interface being replayed: what it has installed and where it is
+    __slots__ = ('intf', 'trace', 'index', 'htb', 'tbf', 'netem', 'jitter', 'limit',
+                 'latency_ms', 'row', 'applied')
+
+    def __init__(self, intf, trace):
+        if not isinstance(intf, TCIntf):
+            raise ValueError('%s is not a TCIntf' % intf)
+        self.intf = intf
+        self.trace = trace
+        self.row = 0
+        self.applied = None
+
+    def setup(self):
+        # what shape the interface got from prepare(), once it is installed
+        kinds = set(TCIntf._layoutRegex.match(cmd).group(1) for cmd in self.intf.shapeInstalled)
+        if 'hfsc' in kinds:
+            raise ValueError('%s: hfsc classes are not replayed, use htb or tbf' % self.intf)
+        shape = self.intf.shape
+        self.htb, self.tbf, self.netem = 'htb' in kinds, 'tbf' in kinds, 'netem' in kinds
+        self.jitter = NetlinkTCIntf.usec(shape['jitter'])
+        self.limit = shape['max_queue_size'] or 1000
+        self.latency_ms = shape['latency_ms']
+        self.index = NetlinkSocket.forNode(self.intf.node).link(self.intf.name)['index']
+        trace = self.trace
+        self.applied = (max(trace.mbit[0], MIN_MBIT), trace.ms[0], trace.loss[0])
+
+    def messages(self, row):
+        # the sample at row as far as this interface can shape it, and the
+        # netlink requests moving us there ([] if it's what we have already);
+        # it only becomes applied once the requests went through
+        trace = self.trace
+        old_mbit, old_ms, old_loss = self.applied
+        mbit = max(trace.mbit[row], MIN_MBIT) if self.htb or self.tbf else old_mbit
+        ms, loss = (trace.ms[row], trace.loss[row]) if self.netem else (old_ms, old_loss)
+        msgs = []
+        if mbit != old_mbit:
+            # the burst sizes TCIntf.bwCmds() would use
+            rate, bursts = mbit * 1e6 / 8, self.intf.bursts(mbit)
+            if self.htb:
+                burst, cburst, quantum = bursts or (15 * 1024, None, 0)
+                msgs.append(NetlinkSocket.htbClassMsg(self.index, _HTB_CLASS, _HTB_PARENT, rate,
+                                                      burst, cburst=cburst, quantum=quantum))
+            elif self.tbf:
+                burst = bursts[0] if bursts else 15000
+                latency_ms = self.latency_ms if self.latency_ms is not None else burst * 8.0 / mbit / 1000
+                msgs.append(NetlinkSocket.tbfMsg(self.index, _TBF, rate, burst, latency_ms * 1e3))
+        if self.netem and (ms != old_ms or loss != old_loss):
+            msgs.append(NetlinkSocket.netemMsg(self.index, _NETEM, delay=ms * 1e3,
+                                               jitter=self.jitter, loss=loss, limit=self.limit))
+        return (mbit, ms, loss), msgs
+
+
+def _shape(mbit, ms, loss):
+    # TCIntf.change() parameters for a sample
+    return {'bw': max(mbit, MIN_MBIT), 'delay': '%gms' % ms, 'loss': loss}
+
+
+class TraceReplay:
+
+    def __init__(self, traces, min_interval=0.01):
+        # traces: {TCIntf: Trace}; min_interval: shortest time between two
+        # updates of an interface, in seconds
+        self.links = [_Link(intf, trace) for intf, trace in traces.items()]
+        self.min_interval = min_interval
+        self.prepared = False
+        # one entry per update: link number, due (seconds from the start),
+        # how late it was applied (seconds)
+        self.link = array('I')
+        self.due = array('d')
+        self.drift = array('d')
+        self.skipped = 0
+        self.unchanged = 0
+        self.errors = {}
+
+    def prepare(self):
+        # install every interface's first sample, one 'tc -batch' per node
+        with TCBatch():
+            for link in self.links:
+                trace = link.trace
+                link.intf.change(**_shape(trace.mbit[0], trace.ms[0], trace.loss[0]))
+        for link in self.links:
+            link.setup()
+        self.prepared = True
+
+    def run(self, duration=None, start_delay=0.1):
+        # replay the traces (for duration seconds at most), returns the
+        # drift stats (see stats())
+        if not self.prepared:
+            self.prepare()
+        start = time.monotonic() + start_delay
+        end = start + duration if duration is not None else None
+        heap = []
+        for i, link in enumerate(self.links):
+            if len(link.trace.t) > 1:
+                heap.append((start + link.trace.t[1], i))
+        heapq.heapify(heap)
+        info('*** Replaying traces on %d interfaces\n' % len(self.links))
+        min_interval = self.min_interval
+        while heap:
+            due = heap[0][0]
+            if end is not None and due > end:
+                break
+            wait = due - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            now = time.monotonic()
+            # everything due by now, grouped by node: one request each
+            requests = {}
+            while heap and heap[0][0] <= now:
+                due, i = heapq.heappop(heap)
+                link = self.links[i]
+                t = link.trace.t
+                row = link.row + 1
+                while row + 1 < len(t) and start + t[row + 1] <= now:
+                    row += 1
+                    self.skipped += 1
+                link.row = row
+                sample, msgs = link.messages(row)
+                if msgs:
+                    node_msgs, updates = requests.setdefault(link.intf.node, ([], []))
+                    node_msgs.extend(msgs)
+                    updates.append((i, due, sample))
+                else:
+                    self.unchanged += 1
+                if row + 1 < len(t):
+                    heapq.heappush(heap, (max(start + t[row + 1], due + min_interval), i))
+            for node, (msgs, updates) in requests.items():
+                try:
+                    NetlinkSocket.forNode(node).request(*msgs)
+                except NetlinkError as e:
+                    # none of the node's links moved: their next update
+                    # starts from what they still have
+                    self.errors[node.name] = self.errors.get(node.name, 0) + 1
+                    error('*** %s: trace update failed: %s\n' % (node.name, e))
+                    continue
+                done = time.monotonic()
+                for i, due, sample in updates:
+                    self.links[i].applied = sample
+                    self.link.append(i)
+                    self.due.append(due - start)
+                    self.drift.append(done - due)
+        self._sync()
+        return self.stats()
+
+    def _sync(self):
+        # tell the interfaces what they have now, so that change() and
+        # config() keep working from the right shape
+        for link in self.links:
+            if link.applied is None:
+                continue
+            intf = link.intf
+            intf.shape = dict(intf.shape, **_shape(*link.applied))
+            intf.shapeInstalled = intf.shapeCmds(**intf.shape)[0]
+
+    def stats(self):
+        # updates applied, skipped (the loop fell behind) and unchanged,
+        # failed requests per node, and the drift of the applied updates
+        # from their schedule (ms)
+        drift = sorted(self.drift)
+        n = len(drift)
+
+        def pct(p):
+            return drift[min(n - 1, int(math.ceil(p * n)) - 1)] * 1e3 if n else None
+        return {
+            'updates': n,
+            'skipped': self.skipped,
+            'unchanged': self.unchanged,
+            'errors': dict(self.errors),
+            'mean_ms': sum(drift) / n * 1e3 if n else None,
+            'p50_ms': pct(0.5),
+            'p99_ms': pct(0.99),
+            'max_ms': drift[-1] * 1e3 if n else None,
+        }
+
+    def report(self):
+        s = self.stats()
+        if not s['updates']:
+            return '0 updates\n'
+        return ('%d updates (%d skipped, %d unchanged) on %d interfaces, %d failed requests\n'
+                'drift: mean %.3f ms, p50 %.3f ms, p99 %.3f ms, max %.3f ms\n' % (
+                    s['updates'], s['skipped'], s['unchanged'], len(self.links),
+                    sum(s['errors'].values()), s['mean_ms'], s['p50_ms'], s['p99_ms'],
+                    s['max_ms']))
+
+    def write_drift(self, path):
+        # one line per applied update: interface, due (s), drift (ms)
+        with open(path, 'w') as f:
+            f.write('intf,due_s,drift_ms\n')
+            for i, due, drift in zip(self.link, self.due, self.drift):
+                f.write('%s,%.6f,%.3f\n' % (self.links[i].intf, due, drift * 1e3))
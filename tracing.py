@@ -0,0 +1,290 @@
+import functools, importlib, json, os, threading, time
+from collections import defaultdict
+
+# Span tracing for network setup and teardown, exported as Chrome trace
+# event JSON (open it in chrome://tracing or https://ui.perfetto.dev):
+#   tracing.enable()
+#   net = Mininet(topo=topo); net.start(); ...; net.stop()
+#   tracing.write_chrome_trace('trace.json')
+#   print(tracing.summary(20))
+# enable() wraps the methods listed in TARGETS (mininet's Mininet and Node,
+# link.py, the router classes), so every node, link, interface and command
+# gets its own span, nested in the phase that ran it; the repo's own
+# phases add theirs with 'with span(...)'. Disabled, which is the default,
+# nothing is wrapped and span() only checks a flag.
+# Times are time.monotonic_ns(). Spans are kept per thread; commands sent
+# with sendCmd() and collected later with waitOutput() (link.runScripts(),
+# behind runBatches(), TCBatch and Link.makeLinks) go on a track of their
+# own per node and end when their output was collected.
+
+enabled = False
+
+# (name, category, start ns, end ns, track, args); track is a thread ident
+# or a node name
+_events = []
+_track_names = {}
+_patched = []
+_pending = {}
+_local = threading.local()
+_t0 = 0
+
+# (module, class, method, category): methods wrapped while tracing
+TARGETS = [
+    ('mininet.net', 'Mininet', 'build', 'phase'),
+    ('mininet.net', 'Mininet', 'buildFromTopo', 'phase'),
+    ('mininet.net', 'Mininet', 'configHosts', 'phase'),
+    ('mininet.net', 'Mininet', 'start', 'phase'),
+    ('mininet.net', 'Mininet', 'stop', 'phase'),
+    ('mininet.net', 'Mininet', 'addHost', 'node'),
+    ('mininet.net', 'Mininet', 'addLink', 'link'),
+    ('mininet.node', 'Node', 'config', 'node'),
+    ('mininet.node', 'Node', 'terminate', 'node'),
+    ('mininet.node', 'Node', 'cmd', 'cmd'),
+    ('mininet.node', 'Node', 'pexec', 'cmd'),
+    ('mininet.node', 'Node', 'sendCmd', 'cmd'),
+    ('mininet.node', 'Node', 'waitOutput', 'cmd'),
+    ('link', 'Link', '__init__', 'link'),
+    ('link', 'Link', 'makeLinks', 'phase'),
+    ('link', 'Link', 'makeIntfPair', 'link'),
+    ('link', 'Link', 'delete', 'link'),
+    ('link', 'Intf', 'config', 'intf'),
+    ('link', 'TCIntf', 'config', 'intf'),
+    ('link', 'TCBatch', 'flush', 'intf'),
+    ('utils', 'LinuxRouter', 'config', 'node'),
+    ('utils', 'LinuxRouter', 'terminate', 'node'),
+    ('utils', 'BirdRouter', 'config', 'bird'),
+    ('utils', 'BirdRouter', 'terminate', 'bird'),
+    ('utils', 'BirdHost', 'config', 'bird'),
+    ('utils', 'BirdHost', 'terminate', 'bird'),
+]
+
+
+class _Span:
+    __slots__ = ('name', 'cat', 'args', 'start')
+
+    def __init__(self, name, cat, args):
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.monotonic_ns()
+        return self
+
+    def __exit__(self, *exc):
+        _record(self.name, self.cat, self.start, time.monotonic_ns(), None, self.args)
+        return False
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(name, cat='phase', **args):
+    # context manager timing a block, e.g. with span('install routes'): ...
+    if not enabled:
+        return _NO_SPAN
+    return _Span(name, cat, args)
+
+
+def record(name, start, end, cat='phase', node=None, **args):
+    # add a span timed elsewhere; start/end: time.monotonic() seconds
+    # node: put it on that node's track instead of the calling thread's
+    if enabled:
+        if node:
+            args['node'] = node
+        _record(name, cat, int(start * 1e9), int(end * 1e9), node and 'node ' + node, args)
+
+
+def _record(name, cat, start, end, track, args):
+    if track is None:
+        track = threading.get_ident()
+        if track not in _track_names:
+            _track_names[track] = threading.current_thread().name
+    _events.append((name, cat, start, end, track, args))
+
+
+def _label(obj):
+    name = getattr(obj, 'name', None)
+    return name if isinstance(name, str) else None
+
+
+def _command(args):
+    return ' '.join(str(a) for a in args)[:200]
+
+
+def _wrap(func, qualname, cat, method):
+    if method == 'sendCmd':
+        @functools.wraps(func)
+        def wrapper(node, *args, **kwargs):
+            # commands run by cmd() are traced there
+            if enabled and not getattr(_local, 'in_cmd', False):
+                _pending[node] = (time.monotonic_ns(), _command(args))
+            return func(node, *args, **kwargs)
+        return wrapper
+    if method == 'waitOutput':
+        @functools.wraps(func)
+        def wrapper(node, *args, **kwargs):
+            try:
+                return func(node, *args, **kwargs)
+            finally:
+                sent = _pending.pop(node, None)
+                if enabled and sent:
+                    start, cmd = sent
+                    _record('cmd ' + cmd.split(' ', 1)[0], cat, start, time.monotonic_ns(),
+                            'node ' + node.name, {'node': node.name, 'cmd': cmd})
+        return wrapper
+    if cat == 'cmd':
+        @functools.wraps(func)
+        def wrapper(node, *args, **kwargs):
+            if not enabled:
+                return func(node, *args, **kwargs)
+            cmd = _command(args)
+            nested = getattr(_local, 'in_cmd', False)
+            _local.in_cmd = True
+            start = time.monotonic_ns()
+            try:
+                return func(node, *args, **kwargs)
+            finally:
+                _local.in_cmd = nested
+                _record('cmd ' + cmd.split(' ', 1)[0], cat, start, time.monotonic_ns(), None,
+                        {'node': node.name, 'cmd': cmd})
+        return wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not enabled:
+            return func(*args, **kwargs)
+        # what the call is about: its object and first two arguments,
+        # where they have a name (nodes, interfaces) or are names
+        labels = {}
+        for key, arg in zip(('on', 'arg1', 'arg2'), args[:3]):
+            label = arg if isinstance(arg, str) and key != 'on' else _label(arg)
+            if label:
+                labels[key] = label
+        start = time.monotonic_ns()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _record(qualname, cat, start, time.monotonic_ns(), None, labels)
+    return wrapper
+
+
+def enable(targets=None):
+    # start tracing; targets: (module, class, method, category) list to
+    # wrap instead of TARGETS (modules that aren't installed are skipped)
+    global enabled, _t0
+    if enabled:
+        return
+    for module, cls_name, method, cat in targets if targets is not None else TARGETS:
+        try:
+            owner = getattr(importlib.import_module(module), cls_name)
+        except (ImportError, AttributeError):
+            continue
+        original = owner.__dict__.get(method)
+        if original is None:
+            continue
+        if isinstance(original, (classmethod, staticmethod)):
+            wrapped = type(original)(_wrap(original.__func__, '%s.%s' % (cls_name, method),
+                                           cat, method))
+        else:
+            wrapped = _wrap(original, '%s.%s' % (cls_name, method), cat, method)
+        setattr(owner, method, wrapped)
+        _patched.append((owner, method, original))
+    _t0 = _t0 or time.monotonic_ns()
+    enabled = True
+
+
+def disable():
+    # stop tracing and unwrap everything; recorded spans are kept
+    global enabled
+    enabled = False
+    while _patched:
+        owner, method, original = _patched.pop()
+        setattr(owner, method, original)
+    _pending.clear()
+
+
+def reset():
+    # drop the recorded spans
+    global _t0
+    del _events[:]
+    _t0 = time.monotonic_ns() if enabled else 0
+
+
+def events():
+    # recorded spans as (name, category, start ns, end ns, track, args)
+    return list(_events)
+
+
+def chrome_trace():
+    # the recorded spans as a Chrome trace event document
+    pid = os.getpid()
+    t0 = _t0 or min((e[2] for e in _events), default=0)
+    tids = {}
+    trace = [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': 0,
+              'args': {'name': 'mininet'}}]
+    for name, cat, start, end, track, args in _events:
+        if track not in tids:
+            tids[track] = len(tids) + 1
+            trace.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tids[track],
+                          'args': {'name': _track_names.get(track, track)}})
+        trace.append({'name': name, 'cat': cat, 'ph': 'X', 'pid': pid, 'tid': tids[track],
+                      'ts': (start - t0) / 1000.0, 'dur': (end - start) / 1000.0,
+                      'args': {k: str(v) for k, v in args.items()}})
+    return {'traceEvents': trace, 'displayTimeUnit': 'ms'}
+
+
+def write_chrome_trace(path):
+    with open(path, 'w') as f:
+        json.dump(chrome_trace(), f)
+
+
+def _self_times():
+    # time of every span not spent in spans nested in it (same track)
+    self_ns = [e[3] - e[2] for e in _events]
+    by_track = defaultdict(list)
+    for i, e in enumerate(_events):
+        by_track[e[4]].append(i)
+    for spans in by_track.values():
+        spans.sort(key=lambda i: (_events[i][2], -_events[i][3]))
+        stack = []
+        for i in spans:
+            start, end = _events[i][2], _events[i][3]
+            while stack and _events[stack[-1]][3] <= start:
+                stack.pop()
+            if stack:
+                self_ns[stack[-1]] -= end - start
+            stack.append(i)
+    return self_ns
+
+
+def summary(n=20):
+    # text report: time per span name (by self time, i.e. not counting
+    # nested spans) and the n slowest spans
+    self_ns = _self_times()
+    totals = defaultdict(lambda: [0, 0, 0, 0])
+    for e, own in zip(_events, self_ns):
+        t = totals[e[0]]
+        t[0] += 1
+        t[1] += e[3] - e[2]
+        t[2] += own
+        t[3] = max(t[3], e[3] - e[2])
+    lines = ['%-32s %7s %11s %11s %10s' % ('span', 'count', 'total ms', 'self ms', 'max ms')]
+    for name, (count, total, own, longest) in sorted(totals.items(), key=lambda t: -t[1][2])[:n]:
+        lines.append('%-32s %7d %11.1f %11.1f %10.1f' % (name[:32], count, total / 1e6, own / 1e6,
+                                                        longest / 1e6))
+    lines += ['', '%-32s %10s  %s' % ('slowest spans', 'ms', 'args')]
+    for e in sorted(_events, key=lambda e: e[2] - e[3])[:n]:
+        lines.append('%-32s %10.1f  %s' % (e[0][:32], (e[3] - e[2]) / 1e6,
+                                           ' '.join('%s=%s' % kv for kv in sorted(e[5].items()))))
+    return '\n'.join(lines) + '\n'
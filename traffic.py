@@ -0,0 +1,167 @@
+import json, os, selectors, time
+from collections import namedtuple
+from mininet.log import info, error
+
+# iperf3 traffic harness: runs many server/client pairs at once, each on
+# its own port, and returns the results parsed from 'iperf3 -J'.
+# Clients only start once their server listens, and all output is read
+# through pipes from one loop, so dozens of flows need no extra threads.
+
+# src/dst: host names, params: extra iperf3 client options, e.g.
+# ['-u', '-b', '10M'] or ['-R']
+Flow = namedtuple('Flow', ['src', 'dst', 'params'])
+Flow.__new__.__defaults__ = ((),)
+
+
+def _listening(pid, port):
+    # is there a TCP socket listening on port in pid's namespace; reads
+    # /proc instead of running ss so that polling forks nothing
+    hex_port = ':%04X' % port
+    for table in ('tcp', 'tcp6'):
+        try:
+            with open('/proc/%d/net/%s' % (pid, table)) as f:
+                next(f)
+                for line in f:
+                    fields = line.split()
+                    # state 0A is LISTEN
+                    if fields[1].endswith(hex_port) and fields[3] == '0A':
+                        return True
+        except OSError:
+            pass
+    return False
+
+
+def _read_all(procs, timeout):
+    # read stdout of every process until they all exit or timeout passes
+    # returns {proc: output}; processes still running are killed
+    outputs = {p: [] for p in procs}
+    sel = selectors.DefaultSelector()
+    for p in procs:
+        sel.register(p.stdout, selectors.EVENT_READ, p)
+    deadline = time.monotonic() + timeout
+    open_pipes = len(procs)
+    while open_pipes and time.monotonic() < deadline:
+        for key, _ in sel.select(deadline - time.monotonic()):
+            data = os.read(key.fileobj.fileno(), 65536)
+            if data:
+                outputs[key.data].append(data)
+            else:
+                sel.unregister(key.fileobj)
+                open_pipes -= 1
+    sel.close()
+    for p in procs:
+        if p.poll() is None:
+            p.kill()
+        p.wait()
+    return {p: b''.join(out).decode(errors='replace') for p, out in outputs.items()}
+
+
+def parse_iperf(output):
+    # 'iperf3 -J' client output => flow summary and per interval results
+    # rates in bits per second, rtt in ms (TCP only, iperf3 >= 3.1)
+    data = json.loads(output)
+    if data.get('error'):
+        return {'error': data['error']}
+    end = data.get('end', {})
+    sent = end.get('sum_sent', end.get('sum', {}))
+    received = end.get('sum_received', end.get('sum', {}))
+    stream = (end.get('streams') or [{}])[0].get('sender', {})
+    result = {
+        'error': None,
+        'seconds': received.get('seconds'),
+        'bytes': received.get('bytes'),
+        'goodput': received.get('bits_per_second'),
+        'throughput': sent.get('bits_per_second'),
+        'retransmits': sent.get('retransmits'),
+        'rtt': stream['mean_rtt'] / 1000.0 if 'mean_rtt' in stream else None,
+        'max_rtt': stream['max_rtt'] / 1000.0 if 'max_rtt' in stream else None,
+        'lost_percent': received.get('lost_percent'),
+        'intervals': [],
+    }
+    for interval in data.get('intervals', []):
+        total = interval.get('sum', {})
+        streams = interval.get('streams') or [{}]
+        result['intervals'].append({
+            'start': total.get('start'),
+            'end': total.get('end'),
+            'bits_per_second': total.get('bits_per_second'),
+            'retransmits': total.get('retransmits'),
+            'cwnd': streams[0].get('snd_cwnd'),
+            'rtt': streams[0]['rtt'] / 1000.0 if 'rtt' in streams[0] else None,
+        })
+    return result
+
+
+def run_flows(net, flows, duration=10, interval=1, base_port=5201, ready_timeout=5.0,
+              log_dir=None, log_name='iperf'):
+    # run every flow at once for duration seconds
+    # flows: list of Flow, or of (src, dst) pairs
+    # interval: seconds per interval report
+    # base_port: flow i uses port base_port + i
+    # log_dir: also write each client's raw JSON to log_dir/<log_name>-<src>-<dst>-<port>.json
+    # returns one result dict per flow, in order (see parse_iperf), with
+    # src, dst and port added
+    flows = [f if isinstance(f, Flow) else Flow(*f) for f in flows]
+    ports = [base_port + i for i in range(len(flows))]
+    results = [{'src': f.src, 'dst': f.dst, 'port': port, 'error': None}
+               for f, port in zip(flows, ports)]
+
+    # servers: one-off (-1), so that they exit after their client is done
+    servers = [net[f.dst].popen(['iperf3', '-s', '-1', '-J', '-p', str(port)])
+               for f, port in zip(flows, ports)]
+    waiting = set(range(len(flows)))
+    deadline = time.monotonic() + ready_timeout
+    while waiting and time.monotonic() < deadline:
+        for i in list(waiting):
+            if servers[i].poll() is not None:
+                results[i]['error'] = 'server exited with status %d' % servers[i].returncode
+                waiting.discard(i)
+            elif _listening(servers[i].pid, ports[i]):
+                waiting.discard(i)
+        if waiting:
+            time.sleep(0.01)
+    for i in waiting:
+        results[i]['error'] = 'server not listening after %.1f s' % ready_timeout
+
+    # clients, for every server that is up
+    clients = {}
+    for i, (f, port) in enumerate(zip(flows, ports)):
+        if results[i]['error']:
+            continue
+        dst_ip = net[f.dst].IP()
+        clients[i] = net[f.src].popen(['iperf3', '-c', dst_ip, '-p', str(port), '-J',
+                                       '-t', str(duration), '-i', str(interval)] + list(f.params))
+    info('*** Running %d iperf3 flows for %s s\n' % (len(clients), duration))
+    outputs = _read_all(list(clients.values()) + servers, duration + ready_timeout + 10)
+
+    for i, client in clients.items():
+        output = outputs[client]
+        if log_dir:
+            f = flows[i]
+            path = os.path.join(log_dir, '%s-%s-%s-%d.json' % (log_name, f.src, f.dst, ports[i]))
+            with open(path, 'w') as log:
+                log.write(output)
+        try:
+            results[i].update(parse_iperf(output))
+        except ValueError:
+            results[i]['error'] = 'no iperf3 output (exit status %s)' % client.returncode
+    for result in results:
+        if result['error']:
+            error('*** iperf3 %s -> %s (port %d): %s\n' %
+                  (result['src'], result['dst'], result['port'], result['error']))
+    return results
+
+
+def format_results(results):
+    # one line per flow, for logging
+    lines = ['%-6s %-6s %6s %12s %12s %8s %9s' % ('src', 'dst', 'port', 'goodput', 'throughput',
+                                                  'retrans', 'rtt')]
+    for r in results:
+        if r['error']:
+            lines.append('%-6s %-6s %6d  error: %s' % (r['src'], r['dst'], r['port'], r['error']))
+            continue
+        lines.append('%-6s %-6s %6d %7.2f Mbps %7.2f Mbps %8s %9s' % (
+            r['src'], r['dst'], r['port'], (r['goodput'] or 0) / 1e6, (r['throughput'] or 0) / 1e6,
+            r['retransmits'] if r['retransmits'] is not None else '-',
+            '%.1f ms' % r['rtt'] if r['rtt'] is not None else '-'))
+    return '\n'.join(lines) + '\n'
@@ -2,6 +2,7 @@ from mininet.node import Node
 from mininet.log import setLogLevel, info
 from contextlib import contextmanager
 import os
+from addr import network_addr
 
 setLogLevel('info')
 
@@ -26,18 +27,32 @@ class BirdRouter(Node):
         # enter the conf directory for this particular router
         # run bird
         # exit the conf directory for this particular router
-        self.cmd('cd ../bird-conf/%s' % self.name)
+        self.cmd('cd %s' % self.conf_dir())
         yield
         self.cmd('cd %s' % path)
 
 
-    def config(self, **params):
+    def conf_dir(self):
+        return bird_conf_dir(self.name, self.params.get('conf_root'))
+
+
+    def ctl_path(self):
+        # control socket of this router's daemon, for birdctl.BirdClient
+        return os.path.join(self.conf_dir(), 'bird.ctl')
+
+
+    def config(self, defer_bird=False, **params):
+        # defer_bird: don't start bird here, birdctl.start_daemons() starts
+        # all the daemons at once later
+        # conf_root (node param): directory holding <name>/bird.conf, instead
+        # of ../bird-conf
         super(BirdRouter, self).config(**params)
         # Enable ip forwarding on the router so that packet at one interface is forwarded 
         # to the appropriate interface on the same router
         self.cmd('sysctl net.ipv4.ip_forward=1')
-        with self.in_router_dir():
-            info(self.cmd('sudo bird -l'))
+        if not defer_bird:
+            with self.in_router_dir():
+                info(self.cmd('sudo bird -l'))
         
 
     def terminate(self):
@@ -56,15 +71,24 @@ class BirdHost(Node):
         # run bird
         # exit the conf directory for this particular router
         path = os.getcwd()
-        self.cmd('cd ../bird-conf/%s' % self.name)
+        self.cmd('cd %s' % self.conf_dir())
         yield
         self.cmd('cd %s' % path)
 
 
-    def config(self, **params):
+    def conf_dir(self):
+        return bird_conf_dir(self.name, self.params.get('conf_root'))
+
+
+    def ctl_path(self):
+        return os.path.join(self.conf_dir(), 'bird.ctl')
+
+
+    def config(self, defer_bird=False, **params):
         super(BirdHost, self).config(**params)
-        with self.in_host_dir():
-            info(self.cmd('sudo bird -l'))
+        if not defer_bird:
+            with self.in_host_dir():
+                info(self.cmd('sudo bird -l'))
 
 
     def terminate(self):
@@ -73,27 +97,18 @@ class BirdHost(Node):
         super(BirdHost, self).terminate()
 
 
-def get_network_addr(cidr):
-    # get network address from cidr
-    # e.g: 172.68.0.1/24 => 172.168.0.0/24
-    ip, subnet = cidr.split("/")
-    subnet = int(subnet)
-    subnet_mask_bits= [1,]*subnet + [0,]*(32-subnet)
-    ip_bin = [format(int(quad), "b") for quad in ip.split(".")]
-    ip_bin = [list('0'*(8-len(x))+x) for x in ip_bin]
-    ip_bits = []
-    for quad in ip_bin:
-        ip_bits+= [int(bit) for bit in quad]
+def bird_conf_dir(name, root=None):
+    # every node runs bird from its own directory under bird-conf, or under
+    # root for configs written by birdconf.write_confs
+    return os.path.abspath(os.path.join(root or '../bird-conf', name))
 
-    nw_addr_bits = [x*y for x,y in zip(ip_bits, subnet_mask_bits )]
-    nw_addr = []
-    for i in range(0,32,8):
-        nw_addr += [str(int("".join(str(i) for i in nw_addr_bits[i:i+8]), 2))]
-    
-    return ".".join(nw_addr)+"/"+str(subnet)
 
+def bird_ctl_path(name, root=None):
+    # 'bird -l' puts its control socket in the directory it was started from
+    return os.path.join(bird_conf_dir(name, root), 'bird.ctl')
 
 
-    
-    
-
+def get_network_addr(cidr):
+    # get network address from cidr
+    # e.g: 172.68.0.1/24 => 172.168.0.0/24
+    return network_addr(cidr)